@@ -0,0 +1,30 @@
+"""Async access to the blocking storage backends"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncDB:
+    """Runs Storage methods in a dedicated bounded thread pool"""
+
+    def __init__(self, storage, workers=4) -> None:
+        self.storage = storage
+        # количество потоков ограничивает число одновременных запросов к базе
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='db')
+
+    def __getattr__(self, name):
+        method = getattr(self.storage, name)
+        if not callable(method):
+            return method
+
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(method, *args, **kwargs))
+
+        return call
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.storage.close()
@@ -0,0 +1,281 @@
+"""Benchmarks for the poll cycle stages
+
+python benchmark.py --scales small medium --output bench.json
+python benchmark.py --diff-sizes 100000 500000 --scales  # only slot diffs of these sizes
+python benchmark.py --postgres localhost  # the bench rewrites tables of this database
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from changes import ChangeDetector
+from db import DB
+from matcher import Matcher
+from render import get_msg_from_result, get_slots_from_list
+from sqlite_db import SQLiteDB
+from wb import STREAM_CHUNK, Coefficient, iter_json_array
+
+ACCEPT_TYPES = ['Короба', 'Монопаллеты', 'Суперсейф', 'QR-поставка с коробами']
+
+# склады x даты x типы поставки в выгрузке WB, пользователи x заявки
+SCALES = {
+    'small': {'warehouses': 50, 'dates': 14, 'users': 100, 'subscriptions': 3},
+    'medium': {'warehouses': 200, 'dates': 14, 'users': 1_000, 'subscriptions': 3},
+    'large': {'warehouses': 300, 'dates': 21, 'users': 10_000, 'subscriptions': 5},
+}
+# число слотов в сравнении циклов, не зависит от масштабов выше
+DIFF_SIZES = [1_000, 10_000, 100_000, 500_000]
+# старый вариант O(n*m) слишком долгий на больших объемах
+LIST_SCAN_LIMIT = 10_000
+
+
+def generate_slots(size: int, seed=0) -> list:
+    """Synthetic read_all_slots result"""
+    rnd = random.Random(seed)
+    start = datetime(2024, 10, 1)
+    slots = []
+    for index in range(size):
+        slots.append(
+            (
+                index // 100,  # ID пользователя
+                f'Склад {index % 100 // 10}',  # Наименование склада
+                start + timedelta(days=index % 10),  # Дата приемки
+                rnd.randint(0, 20),  # Коэффициент приемки
+                'Короба',  # Тип поставки
+            ),
+        )
+    return slots
+
+
+def churn(slots, share=0.05, seed=1) -> list:
+    """Change coefficients for a share of slots"""
+    rnd = random.Random(seed)
+    result = list(slots)
+    for index in rnd.sample(range(len(result)), int(len(result) * share)):
+        user_id, name, date, _, accept_type = result[index]
+        result[index] = (user_id, name, date, rnd.randint(0, 20), accept_type)
+    return result
+
+
+def generate_coefficients(warehouses: int, dates: int, seed=0) -> list:
+    """Synthetic WB acceptance/coefficients payload as Coefficient records"""
+    rnd = random.Random(seed)
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return [
+        Coefficient(
+            warehouse_id,
+            (start + timedelta(days=day)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            rnd.choice([-1, -1, 0, 1, 2, 5, 10, 20]),
+            accept_type,
+        )
+        for warehouse_id in range(1, warehouses + 1)
+        for day in range(dates)
+        for accept_type in ACCEPT_TYPES
+    ]
+
+
+def to_json_body(coefficients) -> bytes:
+    """Response body of acceptance/coefficients for the records"""
+    items = [
+        {'warehouseID': warehouse_id, 'date': acceptance_date, 'coefficient': coef, 'boxTypeName': accept_type}
+        for warehouse_id, acceptance_date, coef, accept_type in coefficients
+    ]
+    return json.dumps(items, ensure_ascii=False).encode()
+
+
+def churn_coefficients(coefficients, share=0.05, seed=1) -> list:
+    """Change a share of coefficients as between two poll cycles"""
+    rnd = random.Random(seed)
+    result = list(coefficients)
+    for index in rnd.sample(range(len(result)), int(len(result) * share)):
+        result[index] = result[index]._replace(coef=rnd.choice([-1, 0, 1, 2, 5, 10, 20]))
+    return result
+
+
+def generate_orders(users: int, subscriptions: int, warehouses: int, seed=0) -> list:
+    """Synthetic orders: (user_id, warehouse_id, max_coef, delay, type)"""
+    rnd = random.Random(seed)
+    orders = {}
+    for user_id in range(1, users + 1):
+        for _ in range(subscriptions):
+            order = (
+                user_id,
+                rnd.randint(1, warehouses),
+                rnd.randint(0, 20),
+                rnd.randint(0, 3),
+                rnd.choice(ACCEPT_TYPES),
+            )
+            # одна заявка на склад и тип поставки
+            orders[(order[0], order[1], order[4])] = order
+    return list(orders.values())
+
+
+def seed_storage(storage, warehouses: int, orders: list):
+    storage.create_warehouses([{'ID': index, 'name': f'Склад {index}'} for index in range(1, warehouses + 1)])
+    for user_id in sorted({order[0] for order in orders}):
+        storage.update_user(user_id, f'user {user_id}')
+    for order in orders:
+        storage.create_order(*order)
+
+
+def measure_peak_memory(func, *args) -> int:
+    """Peak bytes allocated by func, allocations made before the call are not counted"""
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(func, *args, repeat=3) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return {'min': min(timings), 'median': statistics.median(timings), 'repeat': repeat}
+
+
+class Suite:
+    """Collects results and prints them as they come"""
+
+    def __init__(self, repeat=3) -> None:
+        self.repeat = repeat
+        self.results = []
+
+    def run_memory(self, name: str, scale: str, rows: int, func, *args):
+        result = {'name': name, 'scale': scale, 'rows': rows, 'peak_bytes': measure_peak_memory(func, *args)}
+        self.results.append(result)
+        sys.stdout.write(f'{name:<24} {scale:<8} rows={rows:>9}: peak {result["peak_bytes"] / 2**20:10.2f} MiB\n')
+        return result
+
+    def run(self, name: str, scale: str, rows: int, func, *args):
+        timing = measure(func, *args, repeat=self.repeat)
+        result = {'name': name, 'scale': scale, 'rows': rows, **timing}
+        self.results.append(result)
+        sys.stdout.write(f'{name:<24} {scale:<8} rows={rows:>9}: min {timing["min"] * 1000:10.2f} ms\n')
+        return result
+
+
+def bench_storage(suite: Suite, backend: str, storage, scale: str, params: dict):
+    """update_limits + read_all_slots per poll cycle"""
+    orders = generate_orders(params['users'], params['subscriptions'], params['warehouses'])
+    seed_storage(storage, params['warehouses'], orders)
+    coefficients = generate_coefficients(params['warehouses'], params['dates'])
+    suite.run(f'{backend}.update_limits', scale, len(coefficients), storage.update_limits, coefficients)
+    slots = storage.read_all_slots()
+    suite.run(f'{backend}.read_all_slots', scale, len(slots), storage.read_all_slots)
+
+
+def bench_diff(suite: Suite, scale: str, params: dict):
+    """Diff step of main(): incremental matcher"""
+    coefficients = generate_coefficients(params['warehouses'], params['dates'])
+    changed = churn_coefficients(coefficients)
+    orders = generate_orders(params['users'], params['subscriptions'], params['warehouses'])
+    subscriptions = [
+        (user_id, warehouse_id, f'Склад {warehouse_id}', max_coef, delay, accept_type)
+        for user_id, warehouse_id, max_coef, delay, accept_type in orders
+    ]
+
+    # каждый вызов сравнивает с предыдущим снимком, в котором отличаются 5% коэффициентов
+    matcher = Matcher()
+    matcher.load_subscriptions(subscriptions)
+    matcher.apply(coefficients)
+    payloads = itertools.cycle([changed, coefficients])
+    suite.run('matcher.apply', scale, len(coefficients), lambda: matcher.apply(next(payloads)))
+
+
+def bench_slot_diff(suite: Suite, size: int):
+    """Keyed change detection against the previous list-scan diff of matched slots"""
+    slots = generate_slots(size)
+    changed = churn(slots)
+    detector = ChangeDetector()
+    detector.update(slots)
+    results = itertools.cycle([changed, slots])
+    suite.run('change_detector.update', 'diff', size, lambda: detector.update(next(results)))
+    if size <= LIST_SCAN_LIMIT:
+        suite.run('diff.list_scan', 'diff', size, lambda: [slot for slot in changed if slot not in slots])
+
+
+def parse_whole(body: bytes) -> list:
+    """Previous path: response.json() and parameter tuples for update_limits"""
+    items = json.loads(body.decode())
+    return [(item['warehouseID'], item['date'], item['coefficient'], item['boxTypeName']) for item in items]
+
+
+def parse_stream(body: bytes) -> list:
+    """Streaming path: body chunks to Coefficient records"""
+
+    async def chunks():
+        for index in range(0, len(body), STREAM_CHUNK):
+            yield body[index : index + STREAM_CHUNK]
+
+    async def collect():
+        return [Coefficient.from_json(item) async for item in iter_json_array(chunks())]
+
+    return asyncio.run(collect())
+
+
+def bench_parse(suite: Suite, scale: str, params: dict):
+    """Peak memory and time of parsing the coefficients response"""
+    coefficients = generate_coefficients(params['warehouses'], params['dates'])
+    body = to_json_body(coefficients)
+    suite.run_memory('parse.json.peak', scale, len(coefficients), parse_whole, body)
+    suite.run_memory('parse.stream.peak', scale, len(coefficients), parse_stream, body)
+    suite.run('parse.json', scale, len(coefficients), parse_whole, body)
+    suite.run('parse.stream', scale, len(coefficients), parse_stream, body)
+
+
+def bench_render(suite: Suite, scale: str, params: dict):
+    slots = generate_slots(params['users'] * params['subscriptions'] * params['dates'])
+    suite.run('get_msg_from_result', scale, len(slots), get_msg_from_result, slots)
+    found = [(name, date, coef) for _, name, date, coef, _ in slots[: params['warehouses'] * params['dates']]]
+    suite.run('get_slots_from_list', scale, len(found), get_slots_from_list, found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', nargs='*', choices=list(SCALES), default=['small', 'medium'])
+    parser.add_argument('--diff-sizes', type=int, nargs='*', default=DIFF_SIZES, help='slots in the cycle diff')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--sqlite', default=':memory:', help='SQLite database path')
+    parser.add_argument('--postgres', help='Postgres host, the bench rewrites its tables')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    suite = Suite(repeat=args.repeat)
+    for size in args.diff_sizes:
+        bench_slot_diff(suite, size)
+    for scale in args.scales:
+        params = SCALES[scale]
+        bench_diff(suite, scale, params)
+        bench_parse(suite, scale, params)
+        bench_render(suite, scale, params)
+        bench_storage(suite, 'sqlite', SQLiteDB(args.sqlite), scale, params)
+        if args.postgres:
+            bench_storage(suite, 'postgres', DB(DB_HOST=args.postgres), scale, params)
+
+    if args.output:
+        report = {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'scales': {scale: SCALES[scale] for scale in args.scales},
+            'diff_sizes': args.diff_sizes,
+            'results': suite.results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
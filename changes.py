@@ -0,0 +1,53 @@
+"""Change detection for matched slots between poll cycles"""
+
+from typing import NamedTuple
+
+
+class SlotChanges(NamedTuple):
+    """Result of comparing two cycles of matched slots"""
+
+    appeared: list  # слоты, которых не было в прошлом цикле
+    disappeared: list  # слоты, пропавшие с прошлого цикла
+    improved: list  # слоты, у которых снизился коэффициент приемки
+    worsened: list  # слоты, у которых коэффициент вырос, но ещё подходит под заявку
+
+    @property
+    def alerts(self):
+        """Slots to notify users about"""
+        return self.appeared + self.improved
+
+
+def slot_key(slot) -> tuple:
+    """Slot identity: user, warehouse, date and accept type without coefficient"""
+    user_id, warehouse_name, acceptance_date, _, acceptance_type = slot
+    return user_id, warehouse_name, acceptance_date, acceptance_type
+
+
+def diff_slots(previous: dict, current: dict) -> SlotChanges:
+    """Compare slots keyed by slot_key"""
+    appeared = []
+    improved = []
+    worsened = []
+    for key, slot in current.items():
+        previous_slot = previous.get(key)
+        if previous_slot is None:
+            appeared.append(slot)
+        elif slot[3] < previous_slot[3]:
+            improved.append(slot)
+        elif slot[3] > previous_slot[3]:
+            worsened.append(slot)
+    disappeared = [slot for key, slot in previous.items() if key not in current]
+    return SlotChanges(appeared, disappeared, improved, worsened)
+
+
+class ChangeDetector:
+    """Keyed O(n) diff of read_all_slots results"""
+
+    def __init__(self) -> None:
+        self.previous = {}
+
+    def update(self, slots) -> SlotChanges:
+        current = {slot_key(slot): slot for slot in slots}
+        changes = diff_slots(self.previous, current)
+        self.previous = current
+        return changes
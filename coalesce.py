@@ -0,0 +1,102 @@
+"""Flap suppression and per-user digests of slot alerts"""
+
+import time
+
+from changes import slot_key
+
+# окно подавления повторных уведомлений и сбора дайджеста в секундах
+COALESCE_WINDOW = 60
+
+
+class Coalescer:
+    """Holds alerts between matching and sending
+
+    A slot alerted less than window seconds ago is not alerted again unless its
+    coefficient is lower now, so a slot flipping between -1 and a value is reported once.
+    A waiting slot always carries its current coefficient, better or worse.
+    A user gets at most one digest per window: the first alert goes out at once, alerts
+    coming later within the window wait for the end of it and are sent together.
+    """
+
+    def __init__(self, window=COALESCE_WINDOW, clock=time.monotonic) -> None:
+        self.window = window
+        self.clock = clock
+        # slot_key -> (коэффициент, время) последнего отправленного уведомления
+        self.sent = {}
+        # user_id -> {slot_key: (слот, время обнаружения)}, ожидающие дайджеста
+        self.pending = {}
+        # user_id -> время последнего дайджеста
+        self.digest_at = {}
+        # user_id -> время обнаружения самого раннего слота в последнем дайджесте
+        self.started = {}
+        self.suppressed = 0
+
+    def add(self, slots, now=None) -> int:
+        """Queue alert slots (user_id, name, date, coef, type) detected at now, return the number suppressed"""
+        now = self.clock() if now is None else now
+        suppressed = 0
+        for slot in slots:
+            key = slot_key(slot)
+            last = self.sent.get(key)
+            if last is not None and now - last[1] < self.window and slot[3] >= last[0]:
+                suppressed += 1
+                continue
+            pending = self.pending.setdefault(slot[0], {})
+            # ожидающий слот получает текущий коэффициент, время обнаружения остаётся первым
+            pending[key] = (slot, pending[key][1] if key in pending else now)
+        self.suppressed += suppressed
+        return suppressed
+
+    def update(self, slots):
+        """Set the current coefficient of waiting slots that got worse but still match"""
+        for slot in slots:
+            pending = self.pending.get(slot[0])
+            key = slot_key(slot)
+            if pending is not None and key in pending:
+                pending[key] = (slot, pending[key][1])
+
+    def discard(self, slots):
+        """Drop waiting alerts of slots that are no longer available"""
+        for slot in slots:
+            pending = self.pending.get(slot[0])
+            if pending is not None:
+                pending.pop(slot_key(slot), None)
+
+    def requeue(self, slots):
+        """Return flushed slots that were not published, the next flush sends them again"""
+        for slot in slots:
+            key = slot_key(slot)
+            self.sent.pop(key, None)
+            self.digest_at.pop(slot[0], None)
+            detected = self.started.get(slot[0], self.clock())
+            self.pending.setdefault(slot[0], {}).setdefault(key, (slot, detected))
+
+    def pending_count(self) -> int:
+        """Slots waiting for the digest of their user"""
+        return sum(len(pending) for pending in self.pending.values())
+
+    def flush(self, now=None) -> list:
+        """Alert slots of users whose digest is due
+
+        started then maps these users to the detection time of their earliest slot.
+        """
+        now = self.clock() if now is None else now
+        result = []
+        self.started = {}
+        for user_id in list(self.pending):
+            if now - self.digest_at.get(user_id, float('-inf')) < self.window:
+                continue
+            pending = self.pending.pop(user_id)
+            if not pending:
+                continue
+            self.digest_at[user_id] = now
+            self.started[user_id] = min(detected for _, detected in pending.values())
+            for key, (slot, _) in pending.items():
+                self.sent[key] = (slot[3], now)
+                result.append(slot)
+        self.__prune(now)
+        return result
+
+    def __prune(self, now: float):
+        self.sent = {key: last for key, last in self.sent.items() if now - last[1] < self.window}
+        self.digest_at = {user_id: at for user_id, at in self.digest_at.items() if now - at < self.window}
@@ -1,8 +1,171 @@
+import argparse
+import io
+import json
 import logging
 import psycopg2
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from psycopg2 import extensions, pool
+from psycopg2.extras import execute_values
 
+from events import ALERTS_CHANNEL, SNAPSHOT_CHANNEL, STATES_CHANNEL
+from migrate import read_migrations
+from storage import ALERT_MAX_ATTEMPTS, Storage, cached, count_openings, ingest_stats, uses_index, utc_now
 
-class DB:
+# соединение, простоявшее в пуле дольше, проверяется запросом перед выдачей;
+# соединения, оборвавшиеся при работе, закрываются при возврате в пул
+POOL_IDLE_CHECK = 30.0
+
+# ключ advisory lock для применения миграций
+MIGRATIONS_LOCK = 4242001
+
+READ_WAREHOUSES_QUERY = """
+SELECT
+    name
+FROM
+    warehouses
+WHERE
+    is_sc = ANY(%s);
+"""
+
+READ_ACCESSIBLE_WAREHOUSES_QUERY = """
+SELECT
+    limits.type,
+    warehouses.name,
+    min(limits.coef),
+    max(limits.coef)
+FROM
+    limits
+JOIN
+    warehouses
+ON
+    warehouses.id = limits.warehouse_id
+WHERE
+    limits.coef <> -1
+    AND warehouses.is_sc = ANY(%s)
+GROUP BY
+    limits.type, warehouses.id
+ORDER BY
+    limits.type, warehouses.name;
+"""
+
+READ_ALL_SLOTS_QUERY = """
+SELECT
+    orders.user_id,
+    warehouses.name,
+    limits.date,
+    limits.coef,
+    limits.type
+FROM
+    orders
+JOIN
+    limits
+ON
+    orders.warehouse_id = limits.warehouse_id
+JOIN
+    warehouses
+ON
+    warehouses.id = limits.warehouse_id
+WHERE
+    limits.coef <= orders.max_coef
+    AND limits.coef <> -1
+    AND limits.type = orders.type
+    AND limits.date > CURRENT_DATE + orders.delay
+ORDER BY orders.user_id, warehouses.name, limits.date;
+"""
+
+FIND_SLOT_QUERY = """
+SELECT
+    warehouses.name,
+    limits.date,
+    limits.coef
+FROM
+    limits
+JOIN
+    warehouses
+ON
+    warehouses.id = limits.warehouse_id
+WHERE
+    limits.type = %s
+    AND limits.coef <> -1
+    AND limits.coef < %s
+    AND limits.date > CURRENT_DATE + %s
+ORDER BY warehouses.name, limits.date;
+"""
+
+# запрос, параметры и индекс, который должен быть в плане
+EXPLAIN_CHECKS = {
+    'read_warehouses': (READ_WAREHOUSES_QUERY, ([True],), 'warehouses_is_sc_idx'),
+    'read_accessible_warehouses': (READ_ACCESSIBLE_WAREHOUSES_QUERY, ([True],), 'limits_type_date_idx'),
+    'read_all_slots': (READ_ALL_SLOTS_QUERY, (), 'limits_warehouse_type_date_idx'),
+    'find_slot': (FIND_SLOT_QUERY, ('Короба', 20, 0), 'limits_type_date_idx'),
+}
+
+
+def sc_filter(sc) -> list:
+    """Values of warehouses.is_sc for the sc parameter of reference queries"""
+    return [True, False] if sc is None else [sc]
+
+
+def history_partition(month: date) -> tuple:
+    """(name, start, end) of the monthly limits_history partition containing month"""
+    start = month.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return f'limits_history_{start:%Y_%m}', start, end
+
+
+def copy_row(values) -> str:
+    """Строка в текстовом формате COPY с экранированием спецсимволов"""
+    fields = []
+    for value in values:
+        if value is None:
+            fields.append('\\N')
+            continue
+        value = str(value)
+        value = value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+        fields.append(value)
+    return '\t'.join(fields) + '\n'
+
+
+class CopyStream(io.TextIOBase):
+    """Read-only file over an iterator of COPY rows, rows are not buffered all at once"""
+
+    def __init__(self, rows) -> None:
+        self.rows = iter(rows)
+        self.buffer = ''
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size=-1) -> str:
+        chunks = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            chunks.append(row)
+            length += len(row)
+        data = ''.join(chunks)
+        if size < 0:
+            size = len(data)
+        self.buffer = data[size:]
+        return data[:size]
+
+
+class PooledConnection(extensions.connection):
+    """Connection of the pool with the time it was returned to the pool"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.released_at = time.monotonic()
+        self.used = False
+
+
+class DB(Storage):
     """Class for work with POSTGRE"""
 
     def __init__(
@@ -12,13 +175,98 @@ class DB:
         DB_PASSWORD='postgres',
         DB_HOST='postgres',
         DB_PORT=5432,
+        DB_POOL_MIN=1,
+        DB_POOL_MAX=10,
+        DB_CACHE_SIZE=256,
     ) -> None:
+        super().__init__(DB_CACHE_SIZE)
         self.DATABASE_URL = f'postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+        self.pool_min = DB_POOL_MIN
+        self.pool_max = DB_POOL_MAX
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        # счётчики открытых и переиспользованных соединений, меняются из потоков AsyncDB
+        self.pool_stats = {'opened': 0, 'reused': 0, 'broken': 0}
+        self.stats_lock = threading.Lock()
+        # созданные секции limits_history
+        self.history_partitions = set()
+
+    def __get_pool(self):
+        """Ленивое создание пула, чтобы не подключаться к базе при импорте"""
+        with self.pool_lock:
+            if self.pool is None:
+                self.pool = pool.ThreadedConnectionPool(
+                    self.pool_min, self.pool_max, self.DATABASE_URL, connection_factory=PooledConnection
+                )
+            return self.pool
+
+    def __count(self, name: str):
+        with self.stats_lock:
+            self.pool_stats[name] += 1
+
+    def connection_stats(self) -> dict:
+        """Connections opened, reused from the pool and dropped as broken since start"""
+        with self.stats_lock:
+            return dict(self.pool_stats)
+
+    def __is_alive(self, conn) -> bool:
+        """Health check соединения, долго простоявшего в пуле"""
+        if conn.closed:
+            return False
+        if time.monotonic() - conn.released_at < POOL_IDLE_CHECK:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1;')
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
 
+    def __release(self, conn, broken=False):
+        if broken:
+            self.__count('broken')
+        conn.released_at = time.monotonic()
+        self.__get_pool().putconn(conn, close=broken)
+
+    def __acquire(self):
+        conn_pool = self.__get_pool()
+        # при разорванном соединении пробуем переподключиться, но не бесконечно
+        for _ in range(self.pool_max + 1):
+            conn = conn_pool.getconn()
+            if self.__is_alive(conn):
+                break
+            self.__release(conn, broken=True)
+        else:
+            raise psycopg2.OperationalError('No alive connection in pool')
+
+        if conn.used:
+            self.__count('reused')
+        else:
+            conn.used = True
+            self.__count('opened')
+        return conn
+
+    @contextmanager
     def __connect(self):
-        """Функция подключения к базе данных"""
-        connect = psycopg2.connect(self.DATABASE_URL)
-        return connect
+        """Функция подключения к базе данных через пул соединений"""
+        conn = self.__acquire()
+        broken = False
+        try:
+            with conn:
+                yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.__release(conn, broken=broken or bool(conn.closed))
+
+    def close(self):
+        """Закрытие всех соединений пула"""
+        with self.pool_lock:
+            if self.pool is not None:
+                self.pool.closeall()
+                self.pool = None
 
     def update_user(self, user_id: int, name: str):
         try:
@@ -40,21 +288,17 @@ class DB:
         except psycopg2.Error as error:
             logging.warning(f'Error update user {user_id}, {name}: {error}')
 
-    def read_warehouses(self, regexp='.*'):
+    @cached
+    def read_warehouses(self, sc=None):
+        """Names of warehouses, sc: True - only sorting centres, False - without them"""
+        rows = []
         try:
             with self.__connect() as conn, conn.cursor() as cur:
-                query = """
-                SELECT
-                    name
-                FROM
-                    warehouses
-                WHERE
-                    name ~ %s;
-                """
-                cur.execute(query, (regexp,))
+                cur.execute(READ_WAREHOUSES_QUERY, (sc_filter(sc),))
                 rows = cur.fetchall()
         except psycopg2.Error as error:
-            logging.warning(f'Error read warehouse, regexp {regexp}: {error}')
+            logging.warning(f'Error read warehouse, sc {sc}: {error}')
+            self.cache.skip()
 
         result = []
         for row in rows:
@@ -62,6 +306,26 @@ class DB:
                 result.append(element)
         return result
 
+    @cached
+    def read_all_warehouses(self):
+        result = []
+        try:
+            with self.__connect() as conn, conn.cursor() as cur:
+                query = """
+                SELECT
+                    id,
+                    name
+                FROM
+                    warehouses;
+                """
+                cur.execute(query)
+                result = cur.fetchall()
+        except psycopg2.Error as error:
+            logging.warning(f'Error read all warehouses: {error}')
+            self.cache.skip()
+
+        return result
+
     def create_warehouses(self, warehouses):
         try:
             with self.__connect() as conn, conn.cursor() as cur:
@@ -79,41 +343,29 @@ class DB:
                             warehouse['name'],  # Наименование склада
                         ),
                     )
+                # процессы бота сбрасывают кэш и индекс складов
+                cur.execute('SELECT pg_notify(%s, %s);', (SNAPSHOT_CHANNEL, 'warehouses'))
                 conn.commit()
+            self.cache.invalidate()
         except psycopg2.Error as error:
             logging.warning(f'Error update warehouses: {error}')
 
-    def read_accessible_warehouses(self, regexp='.*'):
+    @cached
+    def read_accessible_warehouses(self, sc=None):
+        result = []
         try:
             with self.__connect() as conn, conn.cursor() as cur:
-                query = """
-                SELECT
-                    limits.type,
-                    warehouses.name,
-                    min(limits.coef),
-                    max(limits.coef)
-                FROM
-                    limits
-                JOIN
-                    warehouses
-                ON
-                    warehouses.id = limits.warehouse_id
-                WHERE
-                    limits.coef <> -1
-                    AND warehouses.name ~ %s
-                GROUP BY
-                    limits.type,warehouses.id
-                ORDER BY
-                    limits.type, warehouses.name;
-                """
-                cur.execute(query, (regexp,))
+                cur.execute(READ_ACCESSIBLE_WAREHOUSES_QUERY, (sc_filter(sc),))
                 result = cur.fetchall()
         except psycopg2.Error as error:
-            logging.warning(f'Error read accessible warehouse, regexp {regexp}: {error}')
+            logging.warning(f'Error read accessible warehouse, sc {sc}: {error}')
+            self.cache.skip()
 
         return result
 
+    @cached
     def read_warehouse_id(self, warehouse: str):
+        rows = None
         try:
             with self.__connect() as conn, conn.cursor() as cur:
                 query = """
@@ -128,6 +380,7 @@ class DB:
                 rows = cur.fetchone()
         except psycopg2.Error as error:
             logging.warning(f'Error read warehouse id, warehouse {warehouse}: {error}')
+            self.cache.skip()
 
         if rows is None:
             # User does not exist
@@ -140,6 +393,8 @@ class DB:
                 query = """
                 INSERT INTO orders (user_id, warehouse_id, max_coef, delay, type)
                 VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (user_id, warehouse_id, type) DO UPDATE
+                SET max_coef = excluded.max_coef, delay = excluded.delay;
                 """
                 cur.execute(
                     query,
@@ -202,105 +457,404 @@ class DB:
 
         return result
 
-    def update_limits(self, coefficients):
+    def read_subscriptions(self):
         try:
             with self.__connect() as conn, conn.cursor() as cur:
-                query = 'DELETE FROM limits;'
+                query = """
+                SELECT
+                    orders.user_id,
+                    orders.warehouse_id,
+                    warehouses.name,
+                    orders.max_coef,
+                    orders.delay,
+                    orders.type
+                FROM
+                    orders
+                JOIN
+                    warehouses
+                ON
+                    warehouses.id = orders.warehouse_id;
+                """
                 cur.execute(query)
+                result = cur.fetchall()
+        except psycopg2.Error as error:
+            logging.warning(f'Error read subscriptions: {error}')
+            # пустой список означал бы, что все заявки удалены
+            return None
+
+        return result
+
+    def update_limits(self, coefficients, warehouse_ids=None):
+        """Загрузка коэффициентов через COPY в staging таблицу и атомарная замена limits"""
+        start = time.monotonic()
+        rows = 0
+
+        def copy_rows():
+            nonlocal rows
+            # (warehouse_id, date, coef, type) читаются из генератора по мере отправки COPY
+            for coefficient in coefficients:
+                rows += 1
+                yield copy_row(coefficient)
+
+        try:
+            with self.__connect() as conn, conn.cursor() as cur:
+                # staging таблица живёт в сессии соединения пула и очищается при commit
                 query = """
-                INSERT INTO limits (warehouse_id, date, coef, type)
-                VALUES (%s, %s, %s, %s)
+                CREATE TEMP TABLE IF NOT EXISTS limits_staging
+                (LIKE limits)
+                ON COMMIT DELETE ROWS;
                 """
-                for coefficient in coefficients:
-                    cur.execute(
-                        query,
-                        (
-                            coefficient['warehouseID'],  # ID склада
-                            coefficient['date'],  # Дата поставки
-                            coefficient['coefficient'],  # Коэффициент приемки
-                            coefficient['boxTypeName'],  # Тип поставки
-                        ),
-                    )
+                cur.execute(query)
+                query = 'COPY limits_staging (warehouse_id, date, coef, type) FROM STDIN'
+                cur.copy_expert(query, CopyStream(copy_rows()))
+                # замена данных в одной транзакции: читатели видят либо старый, либо новый снимок
+                if warehouse_ids is None:
+                    cur.execute('DELETE FROM limits;')
+                else:
+                    cur.execute('DELETE FROM limits WHERE warehouse_id = ANY(%s);', (list(warehouse_ids),))
+                cur.execute('INSERT INTO limits SELECT * FROM limits_staging;')
+                # уведомление доставляется слушателям после commit
+                cur.execute('SELECT pg_notify(%s, %s);', (SNAPSHOT_CHANNEL, 'limits'))
                 conn.commit()
+            self.cache.invalidate()
         except psycopg2.Error as error:
             logging.warning(f'Error update limits: {error}')
+            # limits не изменился, вызывающий код не должен считать выгрузку записанной
+            return None
+
+        self.ingest_stats = ingest_stats(rows, start)
+        return self.ingest_stats
+
+    def read_limits(self):
+        try:
+            with self.__connect() as conn, conn.cursor() as cur:
+                cur.execute('SELECT warehouse_id, date, coef, type FROM limits;')
+                result = cur.fetchall()
+        except psycopg2.Error as error:
+            logging.warning(f'Error read limits: {error}')
+            # пустой снимок означал бы, что все слоты открылись заново
+            return None
 
-        pass
+        return result
 
     def read_all_slots(self):
+        result = []
+        try:
+            with self.__connect() as conn, conn.cursor() as cur:
+                cur.execute(READ_ALL_SLOTS_QUERY)
+                result = cur.fetchall()
+        except psycopg2.Error as error:
+            logging.warning(f'Error read all slots: {error}')
+
+        return result
+
+    @cached
+    def find_slot(self, max_coef: int, delay: int, accept_type: str) -> list:
+        result = []
+        try:
+            with self.__connect() as conn, conn.cursor() as cur:
+                cur.execute(
+                    FIND_SLOT_QUERY,
+                    (
+                        accept_type,
+                        max_coef,
+                        delay,
+                    ),
+                )
+                result = cur.fetchall()
+        except psycopg2.Error as error:
+            logging.warning(f'Error find slots: {error}')
+            self.cache.skip()
+
+        return result
+
+    def record_history(self, changes, changed_at=None):
+        if not changes:
+            return
+        changed_at = changed_at or utc_now()
+        openings = count_openings(changes, changed_at)
+        name, start, end = history_partition(changed_at.date())
+        try:
+            with self.__connect() as conn, conn.cursor() as cur:
+                if name not in self.history_partitions:
+                    query = f"""
+                    CREATE TABLE IF NOT EXISTS {name}
+                    PARTITION OF limits_history
+                    FOR VALUES FROM (%s) TO (%s);
+                    """
+                    cur.execute(query, (start, end))
+                buffer = io.StringIO()
+                for warehouse_id, acceptance_date, accept_type, prev_coef, coef in changes:
+                    buffer.write(copy_row((warehouse_id, acceptance_date, accept_type, prev_coef, coef, changed_at)))
+                buffer.seek(0)
+                cur.copy_expert(
+                    'COPY limits_history (warehouse_id, date, type, prev_coef, coef, changed_at) FROM STDIN',
+                    buffer,
+                )
+                query = """
+                INSERT INTO limits_openings (warehouse_id, type, day, hour, openings)
+                VALUES %s
+                ON CONFLICT (warehouse_id, type, day, hour) DO UPDATE
+                SET openings = limits_openings.openings + excluded.openings;
+                """
+                execute_values(cur, query, [(*key, count) for key, count in openings.items()])
+                conn.commit()
+            self.history_partitions.add(name)
+        except psycopg2.Error as error:
+            logging.warning(f'Error record history: {error}')
+
+    def read_opening_hours(self, warehouse_id: int, days: int) -> list:
         result = []
         try:
             with self.__connect() as conn, conn.cursor() as cur:
                 query = """
                 SELECT
-                    orders.user_id,
-                    warehouses.name,
-                    limits.date,
-                    limits.coef,
-                    limits.type
+                    type,
+                    hour,
+                    sum(openings)
                 FROM
-                    orders
-                JOIN
-                    limits
-                ON
-                    orders.warehouse_id = limits.warehouse_id
-                JOIN
-                    warehouses
-                ON
-                    warehouses.id = limits.warehouse_id
+                    limits_openings
                 WHERE
-                    limits.coef <= orders.max_coef
-                    AND limits.coef <> -1
-                    AND limits.type = orders.type
-                    AND limits.date > CURRENT_DATE + orders.delay
-                ORDER BY orders.user_id, warehouses.name, limits.date;
+                    warehouse_id = %s
+                    AND day >= (now() AT TIME ZONE 'UTC')::date - %s
+                GROUP BY
+                    type, hour
+                ORDER BY
+                    type, sum(openings) DESC, hour;
                 """
-                cur.execute(query)
+                cur.execute(query, (warehouse_id, days))
                 result = cur.fetchall()
         except psycopg2.Error as error:
-            logging.warning(f'Error read all slots: {error}')
+            logging.warning(f'Error read opening hours, warehouse {warehouse_id}: {error}')
 
         return result
 
-    def find_slot(self, max_coef: int, delay: int, accept_type: str) -> tuple:
-        result = []
+    def prune_history(self, retention_days: int, openings_days: int):
+        """Drop whole monthly partitions older than retention_days, delete old openings"""
+        cutoff = utc_now().date() - timedelta(days=retention_days)
         try:
             with self.__connect() as conn, conn.cursor() as cur:
                 query = """
                 SELECT
-                    warehouses.name,
-                    limits.date,
-                    limits.coef
+                    child.relname
                 FROM
-                    limits
+                    pg_inherits
                 JOIN
-                    warehouses
+                    pg_class child
                 ON
-                    warehouses.id = limits.warehouse_id
+                    child.oid = pg_inherits.inhrelid
                 WHERE
-                    limits.type = %s
-                    AND limits.coef <> -1
-                    AND limits.coef < %s
-                    AND limits.date > CURRENT_DATE + %s
-                ORDER BY warehouses.name, limits.date;
+                    pg_inherits.inhparent = 'limits_history'::regclass;
                 """
+                cur.execute(query)
+                for (name,) in cur.fetchall():
+                    month = datetime.strptime(name[len('limits_history_') :], '%Y_%m').date()
+                    if history_partition(month)[2] <= cutoff:
+                        cur.execute(f'DROP TABLE IF EXISTS {name};')
+                        self.history_partitions.discard(name)
                 cur.execute(
+                    "DELETE FROM limits_openings WHERE day < (now() AT TIME ZONE 'UTC')::date - %s;", (openings_days,)
+                )
+                conn.commit()
+        except (psycopg2.Error, ValueError) as error:
+            logging.warning(f'Error prune history: {error}')
+
+    def enqueue_alerts(self, messages: dict, ages=None):
+        if not messages:
+            return
+        ages = ages or {}
+        try:
+            with self.__connect() as conn, conn.cursor() as cur:
+                query = """
+                INSERT INTO alerts_outbox (user_id, text, created_at)
+                VALUES %s;
+                """
+                execute_values(
+                    cur,
                     query,
-                    (
-                        accept_type,
-                        max_coef,
-                        delay,
-                    ),
+                    [(user_id, text, ages.get(user_id, 0.0)) for user_id, text in messages.items()],
+                    template="(%s, %s, LOCALTIMESTAMP - %s * interval '1 second')",
                 )
-                result = cur.fetchall()
+                cur.execute('SELECT pg_notify(%s, %s);', (ALERTS_CHANNEL, str(len(messages))))
+                conn.commit()
         except psycopg2.Error as error:
-            logging.warning(f'Error find slots: {error}')
+            logging.warning(f'Error enqueue alerts: {error}')
+            raise
+
+    def claim_alerts(self, shard: int, shards: int, limit: int, lease: int, max_attempts=ALERT_MAX_ATTEMPTS) -> list:
+        result = []
+        try:
+            with self.__connect() as conn, conn.cursor() as cur:
+                # уведомления, не доставленные за max_attempts захватов, больше не захватываются
+                query = """
+                DELETE FROM alerts_outbox
+                WHERE
+                    user_id %% %s = %s
+                    AND attempts >= %s
+                    AND claimed_at < now() - %s * interval '1 second';
+                """
+                cur.execute(query, (shards, shard, max_attempts, lease))
+                if cur.rowcount:
+                    logging.warning(f'Dropped {cur.rowcount} undelivered alerts after {max_attempts} attempts')
+                # SKIP LOCKED: реплики одного шарда не ждут друг друга и не берут одни и те же строки
+                query = """
+                UPDATE alerts_outbox
+                SET claimed_at = now(), attempts = attempts + 1
+                WHERE id IN (
+                    SELECT
+                        id
+                    FROM
+                        alerts_outbox
+                    WHERE
+                        user_id %% %s = %s
+                        AND attempts < %s
+                        AND (claimed_at IS NULL OR claimed_at < now() - %s * interval '1 second')
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, user_id, text, extract(epoch FROM LOCALTIMESTAMP - created_at)::float8;
+                """
+                cur.execute(query, (shards, shard, max_attempts, lease, limit))
+                result = sorted(cur.fetchall())
+                conn.commit()
+        except psycopg2.Error as error:
+            logging.warning(f'Error claim alerts, shard {shard}/{shards}: {error}')
 
         return result
 
+    def delete_alerts(self, ids):
+        try:
+            with self.__connect() as conn, conn.cursor() as cur:
+                cur.execute('DELETE FROM alerts_outbox WHERE id = ANY(%s);', (list(ids),))
+                conn.commit()
+        except psycopg2.Error as error:
+            logging.warning(f'Error delete alerts: {error}')
+
+    def read_state(self, key: str):
+        try:
+            with self.__connect() as conn, conn.cursor() as cur:
+                query = """
+                SELECT
+                    state,
+                    data,
+                    EXTRACT(EPOCH FROM expires_at - now())
+                FROM
+                    bot_states
+                WHERE
+                    key = %s
+                    AND expires_at > now();
+                """
+                cur.execute(query, (key,))
+                row = cur.fetchone()
+        except psycopg2.Error as error:
+            logging.warning(f'Error read state {key}: {error}')
+            raise
+
+        if row is None:
+            return None
+        state, data, ttl = row
+        return state, data, float(ttl)
+
+    def write_state(self, key: str, state: str, data: dict, ttl: int, origin=''):
+        try:
+            with self.__connect() as conn, conn.cursor() as cur:
+                query = """
+                INSERT INTO bot_states (key, state, data, expires_at)
+                VALUES (%s, %s, %s::jsonb, now() + %s * interval '1 second')
+                ON CONFLICT (key) DO UPDATE SET
+                    state = EXCLUDED.state,
+                    data = EXCLUDED.data,
+                    expires_at = EXCLUDED.expires_at;
+                """
+                cur.execute(query, (key, state, json.dumps(data), ttl))
+                cur.execute('SELECT pg_notify(%s, %s);', (STATES_CHANNEL, f'{origin} {key}'))
+                conn.commit()
+        except psycopg2.Error as error:
+            logging.warning(f'Error write state {key}: {error}')
+            raise
+
+    def delete_state(self, key: str, origin=''):
+        try:
+            with self.__connect() as conn, conn.cursor() as cur:
+                cur.execute('DELETE FROM bot_states WHERE key = %s;', (key,))
+                cur.execute('SELECT pg_notify(%s, %s);', (STATES_CHANNEL, f'{origin} {key}'))
+                conn.commit()
+        except psycopg2.Error as error:
+            logging.warning(f'Error delete state {key}: {error}')
+            raise
+
+    def prune_states(self) -> int:
+        try:
+            with self.__connect() as conn, conn.cursor() as cur:
+                cur.execute('DELETE FROM bot_states WHERE expires_at <= now();')
+                conn.commit()
+                return cur.rowcount
+        except psycopg2.Error as error:
+            logging.warning(f'Error prune states: {error}')
+            return 0
+
+    def migrate(self) -> list:
+        """Apply new migrations from migrations/postgres, return applied versions"""
+        applied = []
+        try:
+            with self.__connect() as conn, conn.cursor() as cur:
+                # реплики не должны применять миграции одновременно
+                cur.execute('SELECT pg_advisory_xact_lock(%s);', (MIGRATIONS_LOCK,))
+                query = """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version character varying(128) PRIMARY KEY,
+                    applied_at timestamp without time zone DEFAULT now()
+                );
+                """
+                cur.execute(query)
+                cur.execute('SELECT version FROM schema_migrations;')
+                done = {row[0] for row in cur.fetchall()}
+                for version, sql in read_migrations('postgres'):
+                    if version in done:
+                        continue
+                    cur.execute(sql)
+                    cur.execute('INSERT INTO schema_migrations (version) VALUES (%s);', (version,))
+                    applied.append(version)
+                conn.commit()
+        except psycopg2.Error as error:
+            logging.warning(f'Error apply migrations: {error}')
+            raise
+        self.cache.invalidate()
+        return applied
+
+    def check_plans(self) -> dict:
+        """EXPLAIN the hot queries, return {name: (uses expected index, plan)}
+
+        The plans are the ones the planner picks on the current data, run it against
+        a database with production-sized tables, on small ones seq scans are cheaper.
+        """
+        result = {}
+        with self.__connect() as conn, conn.cursor() as cur:
+            for name, (query, params, index) in EXPLAIN_CHECKS.items():
+                cur.execute(f'EXPLAIN {query}', params)
+                plan = '\n'.join(row[0] for row in cur.fetchall())
+                result[name] = (uses_index(plan, index), plan)
+            conn.rollback()
+        return result
+
 
 def main():
-    pass
+    parser = argparse.ArgumentParser(description='Schema migrations and query plan checks')
+    parser.add_argument('command', choices=['migrate', 'explain'])
+    parser.add_argument('--host', default='postgres')
+    args = parser.parse_args()
+
+    db = DB(DB_HOST=args.host)
+    if args.command == 'migrate':
+        sys.stdout.write(f'Applied migrations: {db.migrate()}\n')
+        return
+
+    failed = False
+    for name, (indexed, plan) in db.check_plans().items():
+        sys.stdout.write(f'{name}: {"OK" if indexed else "NO INDEX"}\n{plan}\n\n')
+        failed = failed or not indexed
+    sys.exit(1 if failed else 0)
 
 
 if __name__ == '__main__':
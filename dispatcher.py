@@ -0,0 +1,135 @@
+"""Concurrent rate-limited delivery of alerts to Telegram"""
+
+import asyncio
+import logging
+import time
+from telebot.asyncio_helper import ApiTelegramException
+
+from metrics import ALERT_LATENCY_SECONDS, MESSAGES_QUEUED, MESSAGES_SENT, TELEGRAM_ERRORS
+from render import MAX_MESSAGE_LENGTH, paginate
+
+# лимит Telegram на количество сообщений в секунду от одного бота
+GLOBAL_RATE = 30
+# лимит Telegram на сообщения в один чат: не чаще раза в секунду
+CHAT_INTERVAL = 1.0
+
+# результаты отправки: отклонённое сообщение (бот заблокирован, чат не найден) не повторяется
+SENT, FAILED, REJECTED = 'sent', 'failed', 'rejected'
+
+
+def split_message(text: str, limit=MAX_MESSAGE_LENGTH) -> list:
+    """Split text by lines into parts not longer than limit"""
+    return paginate(text.splitlines(keepends=True), limit)
+
+
+class RateLimiter:
+    """Spaces calls at least 1 / rate seconds apart"""
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1 / rate
+        self.next_time = 0.0
+
+    def pause(self, seconds: float):
+        """Hold all calls for seconds, used on flood errors"""
+        self.next_time = max(self.next_time, time.monotonic() + seconds)
+
+    async def acquire(self):
+        now = time.monotonic()
+        # резервируем слот до await, поэтому блокировка не нужна
+        wait = self.next_time - now
+        self.next_time = max(now, self.next_time) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class Dispatcher:
+    """Sends messages with a bounded worker pool within Telegram limits"""
+
+    def __init__(self, send, workers=10, rate=GLOBAL_RATE, chat_interval=CHAT_INTERVAL, max_retries=3) -> None:
+        self.send = send  # корутина отправки, например bot.send_message
+        self.workers = workers
+        self.limiter = RateLimiter(rate)
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        # время последней отправки в чат
+        self.chat_last_sent = {}
+
+    async def __wait_chat(self, chat_id):
+        wait = self.chat_last_sent.get(chat_id, 0.0) + self.chat_interval - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def __send(self, chat_id, text) -> str:
+        """SENT, REJECTED on client errors other than 429, FAILED if retries are exhausted"""
+        for attempt in range(self.max_retries + 1):
+            await self.__wait_chat(chat_id)
+            await self.limiter.acquire()
+            try:
+                await self.send(chat_id, text)
+                self.chat_last_sent[chat_id] = time.monotonic()
+                return SENT
+            except ApiTelegramException as error:
+                TELEGRAM_ERRORS.labels(error.error_code).inc()
+                if error.error_code != 429:
+                    logging.warning(f'Send message to {chat_id} error: {error}')
+                    return REJECTED if 400 <= error.error_code < 500 else FAILED
+                retry_after = error.result_json.get('parameters', {}).get('retry_after', 1)
+                logging.warning(f'Send message to {chat_id} flood limit, retry after {retry_after}s')
+                self.limiter.pause(retry_after)
+            except Exception as error:
+                TELEGRAM_ERRORS.labels('network').inc()
+                logging.warning(f'Send message to {chat_id} error: {error}, attempt {attempt + 1}')
+                await asyncio.sleep(2**attempt)
+        return FAILED
+
+    async def __worker(self, queue: asyncio.Queue, stats: dict, start: float):
+        while True:
+            try:
+                chat_id, parts, started = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            # части одного сообщения отправляются по порядку одним обработчиком
+            result = SENT
+            for part in parts:
+                status = await self.__send(chat_id, part)
+                if status == SENT:
+                    now = time.monotonic()
+                    stats['sent'] += 1
+                    stats['latencies'].append(now - start)
+                    MESSAGES_SENT.inc()
+                    ALERT_LATENCY_SECONDS.observe(now - started)
+                    continue
+                stats['failed'] += 1
+                result = FAILED
+                if status == REJECTED:
+                    # остальные части в этот чат тоже не дойдут
+                    result = REJECTED
+                    break
+            stats[{SENT: 'delivered', FAILED: 'undelivered', REJECTED: 'rejected'}[result]].append(chat_id)
+
+    async def dispatch(self, messages: dict, started=None) -> dict:
+        """Send {chat_id: text}, return delivery stats of the cycle
+
+        started is time.monotonic() of the WB fetch or {chat_id: time.monotonic()} of each
+        message, used for end-to-end latency. stats['delivered'] lists chats that got all parts,
+        stats['rejected'] chats Telegram refused to deliver to, stats['undelivered'] the rest.
+        """
+        start = time.monotonic()
+        started = start if started is None else started
+        queue = asyncio.Queue()
+        for chat_id, text in messages.items():
+            parts = split_message(text)
+            MESSAGES_QUEUED.inc(len(parts))
+            queue.put_nowait((chat_id, parts, started.get(chat_id, start) if isinstance(started, dict) else started))
+
+        stats = {'sent': 0, 'failed': 0, 'delivered': [], 'rejected': [], 'undelivered': [], 'latencies': []}
+        workers = min(self.workers, queue.qsize())
+        await asyncio.gather(*(self.__worker(queue, stats, start) for _ in range(workers)))
+
+        elapsed = time.monotonic() - start
+        latencies = stats.pop('latencies')
+        stats['seconds'] = elapsed
+        stats['throughput'] = stats['sent'] / elapsed if elapsed else 0.0
+        stats['latency_avg'] = sum(latencies) / len(latencies) if latencies else 0.0
+        stats['latency_max'] = max(latencies, default=0.0)
+        return stats
@@ -0,0 +1,77 @@
+"""Postgres LISTEN/NOTIFY events between the poller, bot and sender processes"""
+
+import asyncio
+import logging
+import psycopg2
+from psycopg2 import extensions
+
+# новые уведомления в alerts_outbox
+ALERTS_CHANNEL = 'wb_alerts'
+# новый снимок limits или справочник складов, payload - что изменилось
+SNAPSHOT_CHANNEL = 'wb_snapshot'
+# изменено состояние диалога бота, payload - '<реплика> <ключ>'
+STATES_CHANNEL = 'wb_states'
+
+RECONNECT_DELAY = 5.0
+
+
+class Listener:
+    """LISTEN on channels over a dedicated connection, notifications go to an asyncio queue"""
+
+    def __init__(self, dsn: str, channels, reconnect_delay=RECONNECT_DELAY) -> None:
+        self.dsn = dsn
+        self.channels = tuple(channels)
+        self.reconnect_delay = reconnect_delay
+        self.conn = None
+        self.fileno = None
+        # число установленных соединений, после переподключения пропущенные уведомления потеряны
+        self.connects = 0
+        self.queue = asyncio.Queue()
+
+    def __connect(self):
+        conn = psycopg2.connect(self.dsn)
+        conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            for channel in self.channels:
+                cur.execute(f'LISTEN {channel};')
+        return conn
+
+    async def start(self) -> bool:
+        try:
+            self.conn = await asyncio.to_thread(self.__connect)
+        except psycopg2.Error as error:
+            logging.warning(f'Error listen {", ".join(self.channels)}: {error}')
+            return False
+        self.connects += 1
+        # уведомления читаются, когда сокет соединения готов к чтению
+        self.fileno = self.conn.fileno()
+        asyncio.get_running_loop().add_reader(self.fileno, self.__on_readable)
+        return True
+
+    def __on_readable(self):
+        try:
+            self.conn.poll()
+        except psycopg2.Error as error:
+            logging.warning(f'Listener connection lost: {error}')
+            self.close()
+            return
+        while self.conn.notifies:
+            notify = self.conn.notifies.pop(0)
+            self.queue.put_nowait((notify.channel, notify.payload))
+
+    async def get(self, timeout: float):
+        """Next (channel, payload) or None on timeout, a lost connection is reopened"""
+        if self.conn is None and not await self.start():
+            await asyncio.sleep(min(timeout, self.reconnect_delay))
+            return None
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        if self.conn is None:
+            return
+        asyncio.get_running_loop().remove_reader(self.fileno)
+        self.conn.close()
+        self.conn = None
@@ -0,0 +1,208 @@
+"""Local fakes of the WB supplies API and the Telegram Bot API for load tests"""
+
+import asyncio
+import random
+import time
+from aiohttp import web
+from collections import Counter, deque
+from telebot import asyncio_helper
+
+import wb
+
+# коэффициенты, между которыми переключаются ячейки выгрузки при изменениях
+CHURN_COEFS = [-1, -1, 0, 1, 2, 5, 10, 20]
+
+
+class FakeWB:
+    """Serves acceptance/coefficients and warehouses of the WB supplies API
+
+    Before each coefficients answer a churn share of the requested cells changes,
+    latency delays every answer, flood_every answers every n-th request with 429.
+    """
+
+    def __init__(self, coefficients, churn=0.01, latency=0.0, flood_every=0, seed=0) -> None:
+        self.cells = list(coefficients)
+        self.churn = churn
+        self.latency = latency
+        self.flood_every = flood_every
+        self.rnd = random.Random(seed)
+        self.calls = Counter()
+        self.changed = 0
+        self.runner = None
+        self.api_url = None
+
+    def warehouses(self) -> list:
+        return [{'ID': warehouse_id, 'name': f'Склад {warehouse_id}'} for warehouse_id in sorted(self.warehouse_ids)]
+
+    @property
+    def warehouse_ids(self) -> set:
+        return {cell.warehouse_id for cell in self.cells}
+
+    def change(self, indexes):
+        """Change coefficients of a churn share of cells among indexes"""
+        indexes = list(indexes)
+        for index in self.rnd.sample(indexes, int(len(indexes) * self.churn)):
+            self.cells[index] = self.cells[index]._replace(coef=self.rnd.choice(CHURN_COEFS))
+            self.changed += 1
+
+    async def __answer(self, method: str):
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.flood_every and self.calls[method] % self.flood_every == 0:
+            self.calls['429'] += 1
+            return web.json_response({'detail': 'Too many requests'}, status=429, headers={'X-Ratelimit-Retry': '1'})
+        return None
+
+    async def handle_coefficients(self, request: web.Request) -> web.Response:
+        error = await self.__answer('coefficients')
+        if error is not None:
+            return error
+        warehouse_ids = request.query.get('warehouseIDs')
+        if warehouse_ids:
+            requested = {int(warehouse_id) for warehouse_id in warehouse_ids.split(',')}
+            indexes = [index for index, cell in enumerate(self.cells) if cell.warehouse_id in requested]
+        else:
+            indexes = range(len(self.cells))
+        self.change(indexes)
+        items = [
+            {'warehouseID': warehouse_id, 'date': acceptance_date, 'coefficient': coef, 'boxTypeName': accept_type}
+            for warehouse_id, acceptance_date, coef, accept_type in (self.cells[index] for index in indexes)
+        ]
+        return web.json_response(items)
+
+    async def handle_warehouses(self, request: web.Request) -> web.Response:
+        error = await self.__answer('warehouses')
+        if error is not None:
+            return error
+        return web.json_response(self.warehouses())
+
+    async def start(self, host='127.0.0.1', port=0) -> str:
+        """Serve the fake API and point AsyncWB at it"""
+        app = web.Application()
+        app.router.add_get('/api/v1/acceptance/coefficients', self.handle_coefficients)
+        app.router.add_get('/api/v1/warehouses', self.handle_warehouses)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.api_url = wb.SUPPLIES_API
+        wb.SUPPLIES_API = f'http://{host}:{port}/api/v1'
+        return wb.SUPPLIES_API
+
+    async def stop(self):
+        if self.api_url is not None:
+            wb.SUPPLIES_API = self.api_url
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+
+class FakeTelegram:
+    """Answers Bot API methods like Telegram and records sent messages
+
+    latency delays every answer, flood_every answers every n-th sendMessage with 429.
+    With rate or chat_interval set, sendMessage answers 429 above rate messages per second
+    or more often than once in chat_interval seconds to a chat, as Telegram does.
+    """
+
+    def __init__(self, latency=0.0, flood_every=0, rate=0, chat_interval=0.0) -> None:
+        self.latency = latency
+        self.flood_every = flood_every
+        self.rate = rate
+        self.chat_interval = chat_interval
+        self.calls = Counter()
+        self.messages = []  # (chat_id, text)
+        # время доставки сообщений, для пропускной способности
+        self.sent_at = []
+        self.chat_sent_at = {}
+        self.window = deque()
+        self.runner = None
+        self.api_url = None
+
+    def __retry_after(self, chat_id: int, now: float):
+        """Seconds to wait if the message exceeds the limits, else None"""
+        if self.flood_every and self.calls['sendMessage'] % self.flood_every == 0:
+            return 1
+        while self.window and self.window[0] <= now - 1:
+            self.window.popleft()
+        if self.rate and len(self.window) >= self.rate:
+            return 1
+        last = self.chat_sent_at.get(chat_id)
+        if self.chat_interval and last is not None and now - last < self.chat_interval:
+            return 1
+        return None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        data = await request.post()
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == 'getUpdates':
+            # long polling без обновлений
+            await asyncio.sleep(1)
+            return web.json_response({'ok': True, 'result': []})
+        if method == 'getMe':
+            return web.json_response({'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'wb_alerter'}})
+        if method != 'sendMessage':
+            return web.json_response({'ok': True, 'result': True})
+
+        chat_id = int(data['chat_id'])
+        now = time.monotonic()
+        retry_after = self.__retry_after(chat_id, now)
+        if retry_after is not None:
+            self.calls['429'] += 1
+            return web.json_response(
+                {
+                    'ok': False,
+                    'error_code': 429,
+                    'description': f'Too Many Requests: retry after {retry_after}',
+                    'parameters': {'retry_after': retry_after},
+                },
+                status=429,
+            )
+        self.window.append(now)
+        self.chat_sent_at[chat_id] = now
+        self.sent_at.append(now)
+        self.messages.append((chat_id, data['text']))
+        message = {
+            'message_id': len(self.messages),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': data['text'],
+        }
+        return web.json_response({'ok': True, 'result': message})
+
+    async def start(self, host='127.0.0.1', port=0) -> str:
+        """Serve the fake API and point telebot at it"""
+        app = web.Application()
+        app.router.add_route('*', '/bot{token}/{method}', self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.api_url = asyncio_helper.API_URL
+        asyncio_helper.API_URL = f'http://{host}:{port}/bot{{0}}/{{1}}'
+        return asyncio_helper.API_URL
+
+    async def stop(self):
+        if self.api_url is not None:
+            asyncio_helper.API_URL = self.api_url
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+
+def make_update(update_id: int, user_id: int, text: str) -> dict:
+    """Synthetic private chat text message update"""
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private', 'first_name': f'user {user_id}'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'user {user_id}'},
+            'text': text,
+        },
+    }
@@ -0,0 +1,87 @@
+"""Per-warehouse fingerprints of the coefficients payload"""
+
+from typing import NamedTuple
+
+import hashlib
+
+
+class PayloadDiff(NamedTuple):
+    """Warehouses whose section of the payload differs from the previous one"""
+
+    changed: set  # ID складов с новыми или изменёнными данными
+    removed: set  # ID складов, пропавших из выгрузки
+    unchanged: int  # количество складов без изменений
+    full: bool  # сравнивать не с чем, данные нужно заменить целиком
+
+    @property
+    def warehouse_ids(self) -> set:
+        return self.changed | self.removed
+
+    @property
+    def empty(self) -> bool:
+        return not self.full and not self.changed and not self.removed
+
+
+def canonical(coefficients) -> dict:
+    """warehouse_id -> sorted (date, type, coef) rows, independent of the payload order"""
+    sections = {}
+    for warehouse_id, acceptance_date, coef, accept_type in coefficients:
+        sections.setdefault(warehouse_id, []).append((str(acceptance_date), accept_type, coef))
+    for rows in sections.values():
+        rows.sort(key=repr)
+    return sections
+
+
+def fingerprint(rows) -> bytes:
+    return hashlib.blake2b(repr(rows).encode(), digest_size=16).digest()
+
+
+class Fingerprinter:
+    """Remembers fingerprints of the last payload per warehouse
+
+    Every full_every-th payload is reported as fully changed, so that a failed
+    write of an earlier partial update does not leave stale limits forever.
+    """
+
+    def __init__(self, full_every=40) -> None:
+        self.full_every = full_every
+        self.updates = 0
+        self.fingerprints = {}  # warehouse_id -> хэш секции выгрузки
+
+    def update(self, coefficients, warehouse_ids=None) -> PayloadDiff:
+        """Compare the payload with the previous one and remember it
+
+        With warehouse_ids the payload was requested only for these warehouses,
+        fingerprints of the others are kept.
+        """
+        fingerprints = {warehouse_id: fingerprint(rows) for warehouse_id, rows in canonical(coefficients).items()}
+        refresh = not self.fingerprints or self.updates % self.full_every == 0
+        self.updates += 1
+        if warehouse_ids is None:
+            previous = self.fingerprints
+            self.fingerprints = fingerprints
+            if refresh:
+                return PayloadDiff(set(fingerprints), set(), 0, True)
+        else:
+            previous = {
+                warehouse_id: value
+                for warehouse_id, value in self.fingerprints.items()
+                if warehouse_id in warehouse_ids
+            }
+            for warehouse_id in previous:
+                del self.fingerprints[warehouse_id]
+            self.fingerprints.update(fingerprints)
+
+        if refresh:
+            changed = set(fingerprints)
+        else:
+            changed = {
+                warehouse_id for warehouse_id, value in fingerprints.items() if previous.get(warehouse_id) != value
+            }
+        removed = set(previous) - set(fingerprints)
+        return PayloadDiff(changed, removed, len(fingerprints) - len(changed), False)
+
+    def reset(self):
+        """Forget fingerprints, the next payload is treated as changed"""
+        self.fingerprints = {}
+        self.updates = 0
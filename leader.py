@@ -0,0 +1,123 @@
+"""Election of the single active poller among replicas by a Postgres advisory lock"""
+
+import asyncio
+import logging
+import psycopg2
+
+from metrics import LEADER
+
+# ключ сессионной advisory lock активного поллера, меньше 2^32
+LEADER_LOCK = 4242002
+# как часто лидер проверяет блокировку, а резервные реплики пытаются её захватить
+LEADER_INTERVAL = 2.0
+
+CHECK_LOCK_QUERY = """
+SELECT
+    1
+FROM
+    pg_locks
+WHERE
+    locktype = 'advisory'
+    AND classid = 0
+    AND objid = %s
+    AND objsubid = 1
+    AND pid = pg_backend_pid()
+    AND granted;
+"""
+
+
+class LeaderElection:
+    """The replica holding the session advisory lock on its dedicated connection is the leader
+
+    The lock is released by Postgres as soon as the session of the leader ends, so a
+    standby replica takes over within one interval after the leader stops. Server-side
+    TCP keepalives end the session of a leader cut off by the network within seconds.
+    """
+
+    def __init__(self, dsn: str, lock_id=LEADER_LOCK, interval=LEADER_INTERVAL) -> None:
+        self.dsn = dsn
+        self.lock_id = lock_id
+        self.interval = interval
+        self.conn = None
+        self.leader = asyncio.Event()
+
+    @property
+    def is_leader(self) -> bool:
+        return self.leader.is_set()
+
+    def __connect(self):
+        # keepalive с обеих сторон, чтобы потеря связи обнаруживалась за секунды: клиент
+        # перестаёт считать себя лидером, а сервер закрывает сессию и снимает блокировку
+        conn = psycopg2.connect(
+            self.dsn,
+            connect_timeout=5,
+            keepalives=1,
+            keepalives_idle=5,
+            keepalives_interval=2,
+            keepalives_count=2,
+            options='-c tcp_keepalives_idle=5 -c tcp_keepalives_interval=2 -c tcp_keepalives_count=2',
+            application_name='wb_alerter_leader',
+        )
+        conn.autocommit = True
+        return conn
+
+    def __close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def __try_lock(self) -> bool:
+        if self.conn is None or self.conn.closed:
+            self.conn = self.__connect()
+        with self.conn.cursor() as cur:
+            cur.execute('SELECT pg_try_advisory_lock(%s);', (self.lock_id,))
+            return cur.fetchone()[0]
+
+    def __renew(self) -> bool:
+        """Check that the session is alive and still holds the lock"""
+        with self.conn.cursor() as cur:
+            cur.execute(CHECK_LOCK_QUERY, (self.lock_id,))
+            return cur.fetchone() is not None
+
+    def __step(self, leader: bool) -> bool:
+        try:
+            return self.__renew() if leader else self.__try_lock()
+        except psycopg2.Error as error:
+            logging.warning(f'Leader election error: {error}')
+            self.__close()
+            return False
+
+    async def run(self):
+        while True:
+            leader = await asyncio.to_thread(self.__step, self.is_leader)
+            if leader and not self.is_leader:
+                logging.info('Became the active poller')
+                self.leader.set()
+            elif not leader and self.is_leader:
+                logging.warning('Lost the active poller lock')
+                self.leader.clear()
+            LEADER.set(int(leader))
+            await asyncio.sleep(self.interval)
+
+    async def wait(self):
+        """Wait until this replica becomes the leader"""
+        await self.leader.wait()
+
+    def close(self):
+        self.__close()
+        self.leader.clear()
+
+
+class SingleLeader:
+    """Leader election stub for the embedded SQLite backend, one process is always the leader"""
+
+    is_leader = True
+
+    async def run(self):
+        LEADER.set(1)
+
+    async def wait(self):
+        return
+
+    def close(self):
+        return
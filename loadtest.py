@@ -0,0 +1,184 @@
+"""End-to-end load test of the alerter against local fakes of WB and Telegram
+
+The real main() pipeline runs on an in-memory SQLite seeded with synthetic users and orders,
+WB coefficients change between requests, Telegram enforces its rate limits. Measuring starts
+after the warm-up cycles, so the burst of alerts on all new orders is not counted.
+
+python loadtest.py --users 5000 --subscriptions 3 --warehouses 300 --duration 120
+python loadtest.py --wb-flood-every 10 --telegram-latency 0.05 --output loadtest.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from benchmark import generate_coefficients, generate_orders, seed_storage
+from dispatcher import CHAT_INTERVAL, GLOBAL_RATE
+from fakes import FakeTelegram, FakeWB
+
+
+def histogram_stats(histogram) -> dict:
+    """Count, mean and p95 upper bucket bound of an unlabeled metrics Histogram"""
+    counts, total, count = histogram.values.get((), ([0] * len(histogram.buckets), 0.0, 0))
+    p95 = next((bound for bound, bucket in zip(histogram.buckets, counts) if bucket >= count * 0.95), float('inf'))
+    return {'count': count, 'mean': total / count if count else 0.0, 'p95': p95}
+
+
+def reset(metrics, wb_api: FakeWB, telegram: FakeTelegram):
+    """Forget statistics of the warm-up cycles"""
+    for metric in (
+        metrics.CYCLE_SECONDS,
+        metrics.ALERT_LATENCY_SECONDS,
+        metrics.MESSAGES_QUEUED,
+        metrics.SUPPRESSED_ALERTS,
+    ):
+        with metric.lock:
+            metric.values.clear()
+    wb_api.calls.clear()
+    wb_api.changed = 0
+    telegram.calls.clear()
+    telegram.sent_at.clear()
+
+
+async def warm_up(metrics, cycles: int):
+    """Wait for cycles poll cycles, the first one alerts on all new orders at once"""
+    while histogram_stats(metrics.CYCLE_SECONDS)['count'] < cycles:
+        await asyncio.sleep(0.1)
+
+
+def configure(args):
+    """Environment of main, it is read on import"""
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0000:loadtest')
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['DB_PATH'] = ':memory:'
+    os.environ['METRICS_PORT'] = '0'
+    os.environ['BOT_UPDATES'] = 'polling'
+    os.environ['POLL_INTERVAL'] = str(args.poll_interval)
+    # у заглушки WB нет квоты на запросы
+    os.environ['WB_REQUEST_INTERVAL'] = '0'
+    # с окном длиннее замера дайджесты не успевают уйти
+    os.environ['ALERT_COALESCE_WINDOW'] = str(args.coalesce_window)
+    os.environ['POLL_MIN_INTERVAL'] = str(min(args.poll_interval, float(os.getenv('POLL_MIN_INTERVAL', '5'))))
+
+
+async def run(args) -> dict:
+    import main
+    import metrics
+
+    wb_api = FakeWB(
+        generate_coefficients(args.warehouses, args.dates),
+        churn=args.churn,
+        latency=args.wb_latency,
+        flood_every=args.wb_flood_every,
+    )
+    telegram = FakeTelegram(latency=args.telegram_latency, rate=args.telegram_rate, chat_interval=CHAT_INTERVAL)
+    await wb_api.start()
+    await telegram.start()
+
+    main.db.migrate()
+    orders = generate_orders(args.users, args.subscriptions, args.warehouses)
+    seed_storage(main.db, args.warehouses, orders)
+
+    app = asyncio.create_task(main.main('all'))
+    if args.warmup_cycles:
+        await asyncio.wait(
+            [app, asyncio.create_task(warm_up(metrics, args.warmup_cycles))], return_when='FIRST_COMPLETED'
+        )
+    reset(metrics, wb_api, telegram)
+    start = time.monotonic()
+    done, _ = await asyncio.wait([app], timeout=args.duration)
+    if app in done:
+        app.result()
+    elapsed = time.monotonic() - start
+
+    # останавливаем main() вместе с его фоновыми задачами до остановки заглушек
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await main.wb.close()
+    await main.bot.close_session()
+    await telegram.stop()
+    await wb_api.stop()
+
+    return {
+        'users': args.users,
+        'orders': len(orders),
+        'cells': len(wb_api.cells),
+        'seconds': elapsed,
+        'cycle_seconds': histogram_stats(metrics.CYCLE_SECONDS),
+        'alert_latency_seconds': histogram_stats(metrics.ALERT_LATENCY_SECONDS),
+        'coalesce_window': args.coalesce_window,
+        'alerts_suppressed': metrics.SUPPRESSED_ALERTS.values.get((), 0),
+        'alerts_pending': metrics.PENDING_ALERTS.values.get((), 0),
+        'messages_queued': metrics.MESSAGES_QUEUED.values.get((), 0),
+        'messages_sent': len(telegram.sent_at),
+        'messages_per_second': len(telegram.sent_at) / elapsed,
+        'telegram_429': telegram.calls['429'],
+        'wb_requests': wb_api.calls['coefficients'],
+        'wb_429': wb_api.calls['429'],
+        'wb_cells_changed': wb_api.changed,
+    }
+
+
+def report(results: dict):
+    cycle = results['cycle_seconds']
+    latency = results['alert_latency_seconds']
+    sys.stdout.write(
+        f'{results["users"]} users, {results["orders"]} orders, {results["cells"]} WB cells, '
+        f'{results["seconds"]:.0f}s\n'
+    )
+    sys.stdout.write(f'cycles: {cycle["count"]}, cycle time mean {cycle["mean"]:.3f}s, p95 <= {cycle["p95"]}s\n')
+    sys.stdout.write(f'alert latency: mean {latency["mean"]:.3f}s, p95 <= {latency["p95"]}s\n')
+    sys.stdout.write(
+        f'coalescing window {results["coalesce_window"]}s: suppressed {results["alerts_suppressed"]}, '
+        f'pending at the end {results["alerts_pending"]}\n'
+    )
+    sys.stdout.write(
+        f'messages: queued {results["messages_queued"]}, sent {results["messages_sent"]}, '
+        f'{results["messages_per_second"]:.1f} msg/s, Telegram 429: {results["telegram_429"]}\n'
+    )
+    sys.stdout.write(
+        f'WB: {results["wb_requests"]} coefficients requests, 429: {results["wb_429"]}, '
+        f'cells changed {results["wb_cells_changed"]}\n'
+    )
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--subscriptions', type=int, default=3, help='orders per user')
+    parser.add_argument('--warehouses', type=int, default=200)
+    parser.add_argument('--dates', type=int, default=14)
+    parser.add_argument('--duration', type=float, default=60, help='seconds to measure main()')
+    parser.add_argument(
+        '--warmup-cycles', type=int, default=1, help='poll cycles before measuring, the first alerts on all orders'
+    )
+    parser.add_argument('--poll-interval', type=float, default=5)
+    parser.add_argument(
+        '--coalesce-window', type=float, default=0, help='ALERT_COALESCE_WINDOW, 0 - alerts are sent every cycle'
+    )
+    parser.add_argument('--churn', type=float, default=0.01, help='share of cells changed per WB request')
+    parser.add_argument('--wb-latency', type=float, default=0.0, help='seconds per WB request')
+    parser.add_argument('--wb-flood-every', type=int, default=0, help='answer every n-th WB request with 429')
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help='seconds per Bot API call')
+    parser.add_argument('--telegram-rate', type=int, default=GLOBAL_RATE, help='messages per second before 429')
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level)
+    configure(args)
+    results = asyncio.run(run(args))
+    report(results)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    cli()
@@ -3,35 +3,146 @@
 import asyncio
 import logging
 import os
-from fuzzywuzzy import process
+import sys
+import time
 from telebot import async_telebot, asyncio_filters, types
-from telebot.asyncio_storage import StateMemoryStorage
 from telebot.states import State, StatesGroup
 from telebot.states.asyncio.context import StateContext
 from telebot.states.asyncio.middleware import StateMiddleware
 from telebot.types import ReplyParameters
-from time import sleep
 
+import metrics
+from async_db import AsyncDB
+from changes import SlotChanges
+from coalesce import Coalescer
 from db import DB
-from wb import WB, MyError
+from dispatcher import Dispatcher, split_message
+from events import ALERTS_CHANNEL, SNAPSHOT_CHANNEL, STATES_CHANNEL, Listener
+from fingerprint import Fingerprinter
+from leader import LeaderElection, SingleLeader
+from matcher import Matcher
+from render import (
+    get_accept_warehouse_from_list,
+    get_all_warehouse_from_list,
+    get_msg_from_result,
+    get_opening_hours_from_list,
+    get_orders_from_list,
+    get_slots_from_list,
+)
+from scheduler import Scheduler
+from sqlite_db import SQLiteDB
+from state_storage import SharedStateStorage
+from warehouse_index import WarehouseIndex
+from wb import COEFFICIENTS_INTERVAL, AsyncWB, MyError
+from webhook import MAX_CONNECTIONS, WebhookServer
 
 # минимальный коээфициент для выбора названия склада
 MIN_SCORE_WAREHOUSE = 70
+# количество вариантов названия склада в подсказке
+WAREHOUSE_SUGGESTIONS = 3
 
 # извлекаем токены из env
 WB_TOKEN = os.getenv('WB_TOKEN')
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 
+# секунд между запросами коэффициентов WB, квота API - 6 запросов в минуту
+WB_REQUEST_INTERVAL = float(os.getenv('WB_REQUEST_INTERVAL', str(COEFFICIENTS_INTERVAL)))
+# интервал опроса WB API в секундах и его минимум при большом количестве заявок,
+# минимум не меньше квоты WB
+POLL_INTERVAL = float(os.getenv('POLL_INTERVAL', '15'))
+POLL_MIN_INTERVAL = max(float(os.getenv('POLL_MIN_INTERVAL', '10')), WB_REQUEST_INTERVAL)
+POLL_BUSY_ORDERS = int(os.getenv('POLL_BUSY_ORDERS', '1000'))
+
+# раз в сколько секунд запрашивать коэффициенты всех складов для справочных меню,
+# в остальных циклах запрашиваются только склады из заявок; 0 - всегда все склады
+COEFFICIENTS_FULL_REFRESH = float(os.getenv('COEFFICIENTS_FULL_REFRESH', '600'))
+
+# окно в секундах, в течение которого слот не переотправляется, если коэффициент не снизился,
+# а уведомления пользователю собираются в один дайджест; 0 - отправлять сразу
+ALERT_COALESCE_WINDOW = float(os.getenv('ALERT_COALESCE_WINDOW', '60'))
+
+# хранение журнала изменений коэффициентов и сводки открытий слотов в днях,
+# за сколько дней показывать типичное время открытия слотов
+HISTORY_RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', '90'))
+HISTORY_OPENINGS_DAYS = int(os.getenv('HISTORY_OPENINGS_DAYS', '365'))
+HISTORY_STATS_DAYS = int(os.getenv('HISTORY_STATS_DAYS', '30'))
+
+# режим запуска: all - всё в одном процессе, poller - опрос WB и поиск слотов,
+# bot - обработка сообщений бота, sender - рассылка уведомлений из очереди
+RUN_MODES = ('all', 'poller', 'bot', 'sender')
+RUN_MODE = os.getenv('RUN_MODE', 'all')
+# процесс рассылки обслуживает пользователей с user_id % SENDER_SHARDS == SENDER_SHARD
+SENDER_SHARD = int(os.getenv('SENDER_SHARD', '0'))
+SENDER_SHARDS = int(os.getenv('SENDER_SHARDS', '1'))
+SENDER_BATCH = int(os.getenv('SENDER_BATCH', '500'))
+# как часто рассылка проверяет очередь без уведомлений и через сколько секунд
+# незавершённый захват уведомлений истекает
+SENDER_POLL_INTERVAL = 5.0
+ALERT_LEASE = 300
+
+# получение обновлений бота: polling - getUpdates из одного процесса, webhook - HTTP сервер,
+# которому Telegram отправляет обновления, экземпляров может быть несколько за балансировщиком
+BOT_UPDATES = os.getenv('BOT_UPDATES', 'polling')
+# публичный адрес вебхука, если задан, бот регистрирует его при запуске
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '8'))
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+
+# через сколько секунд без ответа пользователя диалог бота сбрасывается
+STATE_TTL = int(os.getenv('STATE_TTL', '86400'))
+
+# порт HTTP сервера метрик Prometheus, 0 - не запускать
+METRICS_PORT = int(os.getenv('METRICS_PORT', '8000'))
+
 # инициализируем класс для работы с WB API
-wb = WB(WB_TOKEN)
+wb = AsyncWB(WB_TOKEN, request_interval=WB_REQUEST_INTERVAL)
 
 # инициализируем класс для работы с DB
-db = DB()
+if os.getenv('DB_BACKEND', 'postgres') == 'sqlite':
+    db = SQLiteDB(
+        os.getenv('DB_PATH', 'wb_alerter.sqlite3'),
+        DB_CACHE_SIZE=int(os.getenv('DB_CACHE_SIZE', '256')),
+    )
+else:
+    db = DB(
+        DB_POOL_MIN=int(os.getenv('DB_POOL_MIN', '1')),
+        DB_POOL_MAX=int(os.getenv('DB_POOL_MAX', '10')),
+        DB_CACHE_SIZE=int(os.getenv('DB_CACHE_SIZE', '256')),
+    )
+
+# запросы к DB выполняются в пуле потоков, чтобы не блокировать event loop;
+# каждому потоку нужно соединение, иначе пул psycopg2 выдаёт PoolError
+DB_WORKERS = int(os.getenv('DB_WORKERS', '4'))
+if isinstance(db, DB) and DB_WORKERS > db.pool_max:
+    raise SystemExit(f'DB_WORKERS={DB_WORKERS} must not exceed DB_POOL_MAX={db.pool_max}')
+adb = AsyncDB(db, workers=DB_WORKERS)
+metrics.QUERY_CACHE.set_function(db.cache.stats)
+if isinstance(db, DB):
+    metrics.DB_POOL_CONNECTIONS.set_function(db.connection_stats)
+
+# только одна реплика опрашивает WB и рассылает уведомления
+if isinstance(db, DB):
+    election = LeaderElection(db.DATABASE_URL, interval=float(os.getenv('LEADER_INTERVAL', '2')))
+else:
+    election = SingleLeader()
+
+# мониторинг задержки event loop
+loop_lag = metrics.LoopLagMonitor()
+
+# индекс названий складов для нечеткого поиска
+warehouse_index = WarehouseIndex()
 
 # инициализируем модуль Telebot
-state_storage = StateMemoryStorage()
+# состояния диалогов хранятся в БД, чтобы переживать перезапуск и быть общими для реплик бота
+state_storage = SharedStateStorage(adb, ttl=STATE_TTL)
+metrics.STATE_CACHE.set_function(state_storage.stats)
 bot = async_telebot.AsyncTeleBot(TELEGRAM_BOT_TOKEN, state_storage=state_storage)
 
+# рассылка уведомлений с ограничением по лимитам Telegram
+dispatcher = Dispatcher(bot.send_message, workers=int(os.getenv('SEND_WORKERS', '10')))
+
 
 class AddWarehouseStates(StatesGroup):
     name = State()
@@ -45,6 +156,10 @@ class DelWarehouseStates(StatesGroup):
     name = State()
 
 
+class OpeningHoursStates(StatesGroup):
+    name = State()
+
+
 class FindSlot(StatesGroup):
     max_coef = State()
     delay = State()
@@ -75,6 +190,7 @@ MENU_BUTTONS = {
         '🔍 Показать все СЦ',
         '🔍 Показать доступные склады',
         '🔍 Показать доступные СЦ',
+        '🕒 Когда открываются слоты',
         '⏪️ Назад',
     ),
 }
@@ -99,7 +215,7 @@ async def start(message):
     ],
 )
 async def get_text_message(message: types.Message, state: StateContext):
-    db.update_user(message.chat.id, message.chat.first_name)
+    await adb.update_user(message.chat.id, message.chat.first_name)
     await bot.send_message(
         message.from_user.id,
         '❓ Задайте интересующий вопрос',
@@ -136,11 +252,12 @@ def get_menu_buttons(menu='⏪️ Назад') -> types.ReplyKeyboardMarkup:
 )
 async def look_my_warehouse(message: types.Message, state: StateContext):
     user_id = int(message.chat.id)
-    warehouses_list = db.read_orders(user_id)
+    warehouses_list = await adb.read_orders(user_id)
     msg = get_orders_from_list(warehouses_list)
     if not msg:
         msg = 'Вы не отслеживайте ни один склад!'
-    await bot.send_message(message.from_user.id, msg, reply_markup=get_menu_buttons('📦 Мои склады'))
+    for page in split_message(msg):
+        await bot.send_message(message.from_user.id, page, reply_markup=get_menu_buttons('📦 Мои склады'))
 
 
 @bot.message_handler(
@@ -163,7 +280,7 @@ async def add_my_warehouse(message: types.Message, state: StateContext):
     ],
 )
 async def del_my_warehouse(message: types.Message, state: StateContext):
-    if not db.read_orders(message.chat.id):
+    if not await adb.read_orders(message.chat.id):
         msg = 'Вы не отслеживайте ни один склад!'
         await bot.send_message(message.from_user.id, msg, reply_markup=get_menu_buttons('📦 Мои склады'))
         return
@@ -185,23 +302,38 @@ async def del_my_warehouse(message: types.Message, state: StateContext):
 )
 async def wb_warehouse(message: types.Message, state: StateContext):
     if message.text == '🔍 Показать все склады':
-        warehouses_list = db.read_warehouses('^(?!СЦ)')
+        warehouses_list = await adb.read_warehouses(sc=False)
         msg = get_all_warehouse_from_list(warehouses_list, prefix='📦:')
     elif message.text == '🔍 Показать все СЦ':
-        warehouses_list = db.read_warehouses('^(СЦ)')
+        warehouses_list = await adb.read_warehouses(sc=True)
         msg = get_all_warehouse_from_list(warehouses_list, prefix='📦:')
     elif message.text == '🔍 Показать доступные склады':
-        warehouses_list = db.read_accessible_warehouses('^(?!СЦ)')
+        warehouses_list = await adb.read_accessible_warehouses(sc=False)
         msg = get_accept_warehouse_from_list(warehouses_list)
     elif message.text == '🔍 Показать доступные СЦ':
-        warehouses_list = db.read_accessible_warehouses('^(СЦ)')
+        warehouses_list = await adb.read_accessible_warehouses(sc=True)
         msg = get_accept_warehouse_from_list(warehouses_list)
     if not msg:
         msg = 'Ой! Ничего не нашли по вашему запросу!'
+    for page in split_message(msg):
+        await bot.send_message(
+            message.from_user.id,
+            page,
+            reply_markup=get_menu_buttons('🍒 Склады WB'),
+        )
+
+
+@bot.message_handler(
+    text=[
+        '🕒 Когда открываются слоты',
+    ],
+)
+async def opening_hours(message: types.Message, state: StateContext):
+    await state.set(OpeningHoursStates.name)
     await bot.send_message(
-        message.from_user.id,
-        msg,
-        reply_markup=get_menu_buttons('🍒 Склады WB'),
+        message.chat.id,
+        '📦 Введите название склада/СЦ',
+        reply_parameters=ReplyParameters(message_id=message.message_id),
     )
 
 
@@ -228,18 +360,18 @@ async def find_slot(message: types.Message, state: StateContext):
 @bot.message_handler(state=AddWarehouseStates.name)
 async def warehouse_name_get(message: types.Message, state: StateContext):
     try:
-        warehouses_list = db.read_warehouses()
-        warehouse, score = process.extractOne(message.text, warehouses_list)
-        if score < MIN_SCORE_WAREHOUSE:
+        suggestions = warehouse_index.search(message.text, limit=WAREHOUSE_SUGGESTIONS)
+        if not suggestions or suggestions[0][2] < MIN_SCORE_WAREHOUSE:
             await state.set(AddWarehouseStates.name)
             await bot.send_message(
                 message.chat.id,
-                'Не могу распознать название склада. Введите название без ошибок.',
+                get_unknown_warehouse_msg(suggestions),
                 reply_parameters=ReplyParameters(message_id=message.message_id),
             )
             return
+        warehouse, warehouse_id, _ = suggestions[0]
         await state.add_data(name=warehouse)
-        await state.add_data(warehouse_id=db.read_warehouse_id(warehouse))
+        await state.add_data(warehouse_id=warehouse_id)
 
         await state.set(AddWarehouseStates.max_coef)
         await bot.send_message(
@@ -350,7 +482,7 @@ async def warehouse_accept_type_get(message: types.Message, state: StateContext)
             max_coef = data.get('max_coef')
             delay = data.get('delay')
             accept_type = data.get('accept_type')
-            db.create_order(message.chat.id, warehouse_id, max_coef, delay, accept_type)
+            await adb.create_order(message.chat.id, warehouse_id, max_coef, delay, accept_type)
             msg = (
                 f'Создана заявка на отслеживание: склад - {name}, '
                 f'максимальный коэф приемки - {max_coef}, '
@@ -377,18 +509,17 @@ async def warehouse_accept_type_get(message: types.Message, state: StateContext)
 @bot.message_handler(state=DelWarehouseStates.name)
 async def warehouse_delete(message: types.Message, state: StateContext):
     try:
-        warehouses_list = db.read_warehouses()
-        warehouse, score = process.extractOne(message.text, warehouses_list)
-        if score < MIN_SCORE_WAREHOUSE:
+        suggestions = warehouse_index.search(message.text, limit=WAREHOUSE_SUGGESTIONS)
+        if not suggestions or suggestions[0][2] < MIN_SCORE_WAREHOUSE:
             await state.set(DelWarehouseStates.name)
             await bot.send_message(
                 message.chat.id,
-                'Не могу распознать название склада. Введите название без ошибок.',
+                get_unknown_warehouse_msg(suggestions),
                 reply_parameters=ReplyParameters(message_id=message.message_id),
             )
             return
-        warehouse_id = db.read_warehouse_id(warehouse)
-        db.delete_order(message.chat.id, warehouse_id)
+        warehouse, warehouse_id, _ = suggestions[0]
+        await adb.delete_order(message.chat.id, warehouse_id)
         await bot.send_message(
             message.chat.id,
             f'Cклад {warehouse} удалён из отслеживания!',
@@ -404,6 +535,42 @@ async def warehouse_delete(message: types.Message, state: StateContext):
         )
 
 
+@bot.message_handler(state=OpeningHoursStates.name)
+async def warehouse_opening_hours(message: types.Message, state: StateContext):
+    try:
+        suggestions = warehouse_index.search(message.text, limit=WAREHOUSE_SUGGESTIONS)
+        if not suggestions or suggestions[0][2] < MIN_SCORE_WAREHOUSE:
+            await state.set(OpeningHoursStates.name)
+            await bot.send_message(
+                message.chat.id,
+                get_unknown_warehouse_msg(suggestions),
+                reply_parameters=ReplyParameters(message_id=message.message_id),
+            )
+            return
+        warehouse, warehouse_id, _ = suggestions[0]
+        hours = await adb.read_opening_hours(warehouse_id, HISTORY_STATS_DAYS)
+        msg = get_opening_hours_from_list(hours)
+        if msg:
+            msg = f'Склад {warehouse}, открытия слотов за {HISTORY_STATS_DAYS} дн., время московское:\n{msg}'
+        else:
+            msg = f'По складу {warehouse} пока нет истории открытия слотов.'
+        await bot.send_message(
+            message.chat.id,
+            msg,
+            reply_markup=get_menu_buttons('🍒 Склады WB'),
+            reply_parameters=ReplyParameters(message_id=message.message_id),
+        )
+        await state.delete()
+    except Exception as error:
+        logging.warning(f'Opening hours error: {error}')
+        await bot.send_message(
+            message.chat.id,
+            'Ой, кажется всё сломалось! Чип и дейл уже спешат на помощь!',
+            reply_markup=get_menu_buttons('🍒 Склады WB'),
+            reply_parameters=ReplyParameters(message_id=message.message_id),
+        )
+
+
 @bot.message_handler(state=FindSlot.accept_type)
 async def warehouse_find_accept_type(message: types.Message, state: StateContext):
     try:
@@ -490,25 +657,18 @@ async def warehouse_find_result(message: types.Message, state: StateContext):
             delay = data.get('delay')
             accept_type = data.get('accept_type')
             max_coef = data.get('max_coef')
-            result = db.find_slot(max_coef, delay, accept_type)
+            result = await adb.find_slot(max_coef, delay, accept_type)
             msg = get_slots_from_list(result)
         if not msg:
             msg = 'Ой! Ничего не нашли по вашему запросу!'
-        # if len(msg) > 4096:
-        for indx in range(0, len(msg), 4096):
+        # сообщение делится по строкам в пределах лимита Telegram
+        for page in split_message(msg):
             await bot.send_message(
                 message.chat.id,
-                msg[indx : indx + 4096],
+                page,
                 reply_markup=get_menu_buttons(),
                 reply_parameters=ReplyParameters(message_id=message.message_id),
             )
-        # else:
-        #     await bot.send_message(
-        #         message.chat.id,
-        #         msg,
-        #         reply_markup=get_menu_buttons(),
-        #         reply_parameters=ReplyParameters(message_id=message.message_id),
-        #     )
         await state.delete()
     except Exception as error:
         logging.warning(f'Find slot result error: {error}')
@@ -520,112 +680,289 @@ async def warehouse_find_result(message: types.Message, state: StateContext):
         )
 
 
-async def send_message_to_user(messages):
-    for key in list(messages.keys()):
-        chat_id = key
-        text = messages.get(key)
-        await bot.send_message(chat_id, text)
+async def send_message_to_user(messages, started=None):
+    stats = await dispatcher.dispatch(messages, started)
+    logging.info(
+        f'Sent {stats["sent"]} messages, failed {stats["failed"]} in {stats["seconds"]:.3f}s, '
+        f'{stats["throughput"]:.1f} msg/s, latency avg {stats["latency_avg"]:.3f}s max {stats["latency_max"]:.3f}s',
+    )
+    return stats
 
 
-def get_all_warehouse_from_list(warehouse_list, prefix='', postfix=''):
-    msg = ''
-    for row in warehouse_list:
-        msg += f'{prefix} {row} {postfix}\n'
+def get_unknown_warehouse_msg(suggestions):
+    msg = 'Не могу распознать название склада. Введите название без ошибок.'
+    if suggestions:
+        names = ', '.join(name for name, _, _ in suggestions)
+        msg += f' Возможно, вы имели в виду: {names}'
     return msg
 
 
-def get_accept_warehouse_from_list(warehouse_list, prefix='', postfix=''):
-    msg = ''
-    for row in warehouse_list:
-        accept_type, warehose_name, acceptance_coef_min, acceptance_coef_max = row
-        msg += f'{prefix} '
-        msg += f'📦: {accept_type}, '
-        msg += f'🚛: {warehose_name}, '
-        msg += f'₽: {acceptance_coef_min}-{acceptance_coef_max} '
-        msg += f'{postfix}\n'
-    return msg
+async def run_poller(publish):
+    """Poll WB while this replica is the leader, other replicas wait as hot standby"""
+    while True:
+        await election.wait()
+        await poll(publish)
+        logging.warning('Polling stopped, waiting for the active poller lock')
+
+
+async def poll(publish):
+    """Poll WB, ingest limits, match orders and pass messages to publish(messages, started)"""
+    # хранит снимок коэффициентов предыдущего цикла и индекс заявок; предыдущим снимком
+    # считается limits, записанный прошлым лидером, чтобы не повторять его уведомления
+    matcher = Matcher()
+    scheduler = Scheduler(POLL_INTERVAL, POLL_MIN_INTERVAL, POLL_BUSY_ORDERS)
+    limits = await adb.read_limits()
+    while limits is None:
+        # с пустым снимком первый цикл повторил бы уведомления обо всех открытых слотах
+        delay = scheduler.failure()
+        logging.warning(f'Read limits error. Retry in {delay:.1f} seconds.')
+        await scheduler.wait()
+        if not election.is_leader:
+            return
+        limits = await adb.read_limits()
+    scheduler.success()
+    matcher.load_snapshot(limits)
+    fingerprinter = Fingerprinter()
+    coalescer = Coalescer(ALERT_COALESCE_WINDOW)
+    full_refresh_at = 0.0
+    prune_at = 0.0
+    # заявки первого успешного цикла известны прошлому лидеру, по ним не уведомляем
+    announce = False
+
+    while election.is_leader:
+        await scheduler.wait()
+        cycle_start = time.monotonic()
+        subscriptions = await adb.read_subscriptions()
+        if subscriptions is None:
+            # без заявок матчер считал бы их все новыми на следующем цикле
+            delay = scheduler.failure()
+            logging.warning(f'Read subscriptions error. Retry in {delay:.1f} seconds.')
+            continue
+        # полная выгрузка для справочных меню, иначе только склады из заявок
+        if cycle_start - full_refresh_at >= COEFFICIENTS_FULL_REFRESH or not full_refresh_at:
+            fetch_ids = None
+        else:
+            fetch_ids = {subscription[1] for subscription in subscriptions}
+        try:
+            # извлекаем коэффициенты по складам
+            coefficients = await wb.get_coefficients(fetch_ids)
+        except MyError as error:
+            delay = scheduler.failure(error.retry_after)
+            logging.warning(f'Get coefficients error: {error}. Retry in {delay:.1f} seconds.')
+            continue
+        scheduler.success()
+        scheduler.defer(wb.retry_after)
+        if fetch_ids is None:
+            full_refresh_at = cycle_start
+
+        # сравниваем секции выгрузки по складам с предыдущим циклом
+        payload = fingerprinter.update(coefficients, fetch_ids)
+        metrics.UNCHANGED_PAYLOADS.labels('warehouse').inc(payload.unchanged)
+        ingest_stats = None
+        if payload.empty:
+            # выгрузка не изменилась: limits и снимок матчера актуальны
+            metrics.UNCHANGED_PAYLOADS.labels('payload').inc()
+        else:
+            warehouse_ids = None if payload.full else payload.warehouse_ids
+            if warehouse_ids is not None:
+                coefficients = [
+                    coefficient for coefficient in coefficients if coefficient.warehouse_id in payload.changed
+                ]
+            if not election.is_leader:
+                # блокировку перехватила другая реплика, limits пишет она
+                break
+            ingest_stats = await adb.update_limits(coefficients, warehouse_ids)
+            if ingest_stats is None:
+                # отпечатки уже обновлены, без сброса неизменившиеся склады не попали бы в limits
+                fingerprinter.reset()
+                delay = scheduler.failure()
+                logging.warning(f'Update limits error. Retry in {delay:.1f} seconds.')
+                continue
+            metrics.UPDATE_LIMITS_SECONDS.observe(ingest_stats['seconds'])
+        metrics.mark_snapshot()
+
+        # слоты по новым заявкам, затем только по изменившимся коэффициентам
+        match_start = time.monotonic()
+        result = matcher.load_subscriptions(subscriptions, announce=announce)
+        announce = True
+        if payload.empty:
+            changes = SlotChanges([], [], [], [])
+        else:
+            # первый снимок на пустой базе не является изменением коэффициентов
+            had_snapshot = bool(matcher.snapshot)
+            changes = await asyncio.to_thread(matcher.apply, coefficients, None, warehouse_ids)
+            if had_snapshot:
+                await adb.record_history([cell for cell in matcher.changed_cells if cell[4] is not None])
+        result.extend(changes.alerts)
+        # мигающие слоты не переотправляются, уведомления копятся в дайджест пользователя,
+        # ожидающие слоты следуют за текущим коэффициентом
+        coalescer.discard(changes.disappeared)
+        coalescer.update(changes.worsened)
+        metrics.SUPPRESSED_ALERTS.inc(coalescer.add(result, cycle_start))
+        result = coalescer.flush(cycle_start)
+        metrics.PENDING_ALERTS.set(coalescer.pending_count())
+        result.sort(key=lambda slot: (slot[0], slot[1], slot[2]))
+        scheduler.adapt(len(matcher.subscriptions))
+        metrics.MATCH_SECONDS.observe(time.monotonic() - match_start)
+        for kind in changes._fields:
+            metrics.DIFF_SIZE.labels(kind).set(len(getattr(changes, kind)))
 
+        msg = get_msg_from_result(result)
 
-def get_slots_from_list(warehouse_list, prefix='', postfix=''):
-    msg = ''
-    for row in warehouse_list:
-        warehose_name, acceptance_date, acceptance_coef = row
-        msg += f'{prefix} '
-        msg += f'📦: {warehose_name}, '
-        msg += f'🚛: {acceptance_date.strftime("%d.%m.%Y")}, '
-        msg += f'₽: {acceptance_coef} '
-        msg += f'{postfix}\n'
-    return msg
+        if not election.is_leader:
+            break
+        # отправляем сообщение пользователям или в очередь процессов рассылки
+        try:
+            # задержка дайджеста считается от цикла, в котором найден его первый слот
+            await publish(msg, coalescer.started)
+        except Exception as error:
+            # снимок уже продвинут, уведомления возвращаются коалесцеру и уходят в следующем цикле
+            coalescer.requeue(result)
+            delay = scheduler.failure()
+            logging.warning(f'Publish alerts error: {error}. Retry in {delay:.1f} seconds.')
+            continue
+        metrics.CYCLE_SECONDS.observe(time.monotonic() - cycle_start)
+
+        # раз в сутки удаляем устаревшую историю коэффициентов
+        if cycle_start - prune_at >= 86400 or not prune_at:
+            await adb.prune_history(HISTORY_RETENTION_DAYS, HISTORY_OPENINGS_DAYS)
+            prune_at = cycle_start
+
+        if ingest_stats is None:
+            ingest = 'payload unchanged'
+        else:
+            ingest = f'limits ingest {ingest_stats["rows"]} rows, {ingest_stats["rows_per_second"]:.0f} rows/s'
+        logging.info(
+            f'Cycle time {time.monotonic() - cycle_start:.3f}s, {ingest}, '
+            f'changed warehouses {len(payload.warehouse_ids)}, '
+            f'event loop lag max {loop_lag.take_max_lag():.3f}s',
+        )
 
 
-def get_orders_from_list(orders):
-    msg = ''
-    for order in orders:
-        warehose_name, acceptance_coef_max, acceptance_delay, acceptance_type = order
-        msg += f'Склад: {warehose_name}, '
-        msg += f'макс. коэф. приемки {acceptance_coef_max}, '
-        msg += f'смотрим слоты через {acceptance_delay} дн., '
-        msg += f'тип поставки - {acceptance_type}\n'
-    return msg
+async def enqueue_alerts(messages, started=None):
+    # ошибка записи в очередь поднимается в poll(), уведомления остаются у него
+    now = time.monotonic()
+    started = started or {}
+    # возраст уведомления от обнаружения слота, от него рассылка считает задержку
+    await adb.enqueue_alerts(messages, {user_id: now - started.get(user_id, now) for user_id in messages})
 
 
-def get_msg_from_result(slots):
-    result = {}
-    for slot in slots:
-        user_id, warehose_name, acceptance_date, acceptance_coef, acceptance_type = slot
-        msg = result.get(user_id, '')
-        msg += f'Склад: {warehose_name}, '
-        msg += f'дата приемки: {acceptance_date.strftime("%d.%m.%Y")}, '
-        msg += f'коэф. приемки: {acceptance_coef}, '
-        msg += f'тип поставки: {acceptance_type}.\n'
-        result[user_id] = msg
-    return result
+async def run_sender(shard: int, shards: int):
+    """Deliver alerts of users with user_id % shards == shard from alerts_outbox"""
+    listener = Listener(db.DATABASE_URL, [ALERTS_CHANNEL])
+    await listener.start()
+    while True:
+        alerts = await adb.claim_alerts(shard, shards, SENDER_BATCH, ALERT_LEASE)
+        if not alerts:
+            # ждём уведомление от поллера, по таймауту проверяем очередь сами
+            await listener.get(SENDER_POLL_INTERVAL)
+            continue
+        # уведомления нескольких циклов одному пользователю объединяются,
+        # задержка считается от самого раннего из них
+        now = time.monotonic()
+        messages = {}
+        started = {}
+        for _, user_id, text, age in alerts:
+            messages[user_id] = messages.get(user_id, '') + text
+            started[user_id] = min(started.get(user_id, now), now - age)
+        stats = await send_message_to_user(messages, started)
+        # недоставленные остаются в очереди и будут захвачены снова после истечения аренды,
+        # отклонённые Telegram удаляются: повтор их не доставит
+        done = set(stats['delivered']) | set(stats['rejected'])
+        await adb.delete_alerts([alert_id for alert_id, user_id, _, _ in alerts if user_id in done])
+
+
+def setup_bot():
+    bot.add_custom_filter(asyncio_filters.StateFilter(bot))
+    bot.add_custom_filter(asyncio_filters.TextMatchFilter())
+    bot.setup_middleware(StateMiddleware(bot))
 
 
-async def main():
+async def start_bot():
     # await bot.set_my_commands(
     #     [
     #         BotCommand('/start', 'Main menu'),
     #     ],
     # )
 
-    bot.add_custom_filter(asyncio_filters.StateFilter(bot))
-    bot.add_custom_filter(asyncio_filters.TextMatchFilter())
-    bot.setup_middleware(StateMiddleware(bot))
-    asyncio.create_task(bot.polling())
+    setup_bot()
+    asyncio.create_task(state_storage.run_expiry())
+    # индекс названий складов для поиска в диалогах
+    warehouse_index.load(await adb.read_all_warehouses())
+    if BOT_UPDATES == 'polling':
+        await bot.delete_webhook()
+        asyncio.create_task(bot.polling())
+        return
+
+    server = WebhookServer(bot, WEBHOOK_SECRET, WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE)
+    await server.start(WEBHOOK_PORT)
+    if WEBHOOK_URL:
+        max_connections = min(WEBHOOK_WORKERS * 5, MAX_CONNECTIONS)
+        await bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET, max_connections=max_connections)
 
-    # заполнение таблицы warehouses
-    db.create_warehouses(wb.get_warehouses())
 
-    # пустой лист для сохранения предыдущего состояния между циклами
-    previous_result = []
+async def watch_snapshots():
+    """Drop the query cache of the bot process when the poller writes a new snapshot
 
+    and cached dialog states changed by other bot replicas.
+    """
+    listener = Listener(db.DATABASE_URL, [SNAPSHOT_CHANNEL, STATES_CHANNEL])
+    connects = 0
     while True:
-        try:
-            pass
-            # извлекаем коэффициенты по складам
-            coefficients = wb.get_coefficients()
-        except MyError:
-            logging.warning('Get coefficients error. Get timeout for 10 seconds.')
-            sleep(10)
+        event = await listener.get(60)
+        if listener.connects != connects:
+            # уведомления, пришедшие без соединения, потеряны
+            connects = listener.connects
+            db.cache.invalidate()
+            state_storage.clear()
+        if event is None:
             continue
-
-        db.update_limits(coefficients)
-
-        current_result = db.read_all_slots()
-
-        result = [val for val in current_result if val not in previous_result]
-        previous_result = current_result
-
-        msg = get_msg_from_result(result)
-
-        # отправляем сообщение пользователям
-        task_send_message = asyncio.create_task(send_message_to_user(msg))
-        await task_send_message
-
-        # спим
-        await asyncio.sleep(15)
+        channel, payload = event
+        if channel == STATES_CHANNEL:
+            state_storage.forget(payload)
+            continue
+        db.cache.invalidate()
+        if payload == 'warehouses':
+            warehouse_index.load(await adb.read_all_warehouses())
+
+
+async def main(mode=RUN_MODE):
+    if mode not in RUN_MODES:
+        raise SystemExit(f'Unknown run mode {mode}, expected one of: {", ".join(RUN_MODES)}')
+    if BOT_UPDATES not in ('polling', 'webhook'):
+        raise SystemExit(f'Unknown BOT_UPDATES {BOT_UPDATES}, expected polling or webhook')
+    if BOT_UPDATES == 'webhook' and not WEBHOOK_SECRET:
+        raise SystemExit('BOT_UPDATES=webhook needs WEBHOOK_SECRET')
+    if mode != 'all' and not isinstance(db, DB):
+        raise SystemExit(f'Run mode {mode} needs DB_BACKEND=postgres')
+
+    asyncio.create_task(loop_lag.run())
+    if METRICS_PORT:
+        await metrics.start_metrics_server(METRICS_PORT)
+
+    # применение миграций схемы БД
+    await adb.migrate()
+
+    if mode == 'sender':
+        await run_sender(SENDER_SHARD, SENDER_SHARDS)
+        return
+    if mode in ('all', 'poller'):
+        # заполнение таблицы warehouses
+        await adb.create_warehouses(await wb.get_warehouses())
+        asyncio.create_task(election.run())
+    if mode in ('all', 'bot'):
+        await start_bot()
+    if mode == 'all' and isinstance(db, DB):
+        # резервные реплики отвечают боту по снимку, записанному лидером
+        asyncio.create_task(watch_snapshots())
+
+    if mode == 'bot':
+        await watch_snapshots()
+    elif mode == 'poller':
+        await run_poller(enqueue_alerts)
+    else:
+        await run_poller(send_message_to_user)
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else RUN_MODE))
@@ -0,0 +1,143 @@
+"""Incremental matching of orders against changed coefficient cells"""
+
+from typing import NamedTuple
+
+from datetime import date, datetime, timedelta
+
+from changes import SlotChanges, diff_slots, slot_key
+
+
+class Subscription(NamedTuple):
+    """Order of the user with the warehouse name"""
+
+    user_id: int
+    warehouse_id: int
+    warehouse_name: str
+    max_coef: int
+    delay: int
+    type: str
+
+
+def parse_date(value) -> datetime:
+    """WB date like 2024-10-01T00:00:00Z to naive datetime, as it is stored in limits"""
+    if isinstance(value, datetime):
+        return value
+    return datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+
+
+def is_match(subscription: Subscription, acceptance_date: datetime, coef, today: date) -> bool:
+    """Same conditions as DB.read_all_slots"""
+    return (
+        coef is not None
+        and coef != -1
+        and coef <= subscription.max_coef
+        and acceptance_date.date() > today + timedelta(days=subscription.delay)
+    )
+
+
+class Matcher:
+    """Keeps the previous coefficients snapshot and matches only changed cells"""
+
+    def __init__(self) -> None:
+        # (warehouse_id, date, type) -> coef
+        self.snapshot = {}
+        # (warehouse_id, type) -> список заявок
+        self.index = {}
+        self.subscriptions = set()
+        self.dates = {}
+        # (warehouse_id, date, type, previous coef, coef) ячеек, изменившихся при последнем apply
+        self.changed_cells = []
+
+    def __date(self, value) -> datetime:
+        # дат в выгрузке немного, поэтому разбор строк кэшируется
+        parsed = self.dates.get(value)
+        if parsed is None:
+            parsed = self.dates[value] = parse_date(value)
+        return parsed
+
+    def __rows(self, subscriptions, cells, today) -> dict:
+        rows = {}
+        for subscription in subscriptions:
+            for acceptance_date, coef in cells:
+                if is_match(subscription, acceptance_date, coef, today):
+                    row = (
+                        subscription.user_id,
+                        subscription.warehouse_name,
+                        acceptance_date,
+                        coef,
+                        subscription.type,
+                    )
+                    rows[slot_key(row)] = row
+        return rows
+
+    def load_subscriptions(self, subscriptions, today=None, announce=True) -> list:
+        """Rebuild the (warehouse_id, type) index, return current slots of new subscriptions
+
+        With announce=False the subscriptions are only indexed, as at takeover of a snapshot
+        whose slots were already alerted by the previous leader.
+        """
+        today = today or date.today()
+        subscriptions = {Subscription(*subscription) for subscription in subscriptions}
+        index = {}
+        for subscription in subscriptions:
+            index.setdefault((subscription.warehouse_id, subscription.type), []).append(subscription)
+
+        new_subscriptions = subscriptions - self.subscriptions
+        self.index = index
+        self.subscriptions = subscriptions
+        if not announce or not new_subscriptions or not self.snapshot:
+            return []
+
+        cells = {}
+        for (warehouse_id, acceptance_date, accept_type), coef in self.snapshot.items():
+            cells.setdefault((warehouse_id, accept_type), []).append((acceptance_date, coef))
+        rows = {}
+        for subscription in new_subscriptions:
+            key = (subscription.warehouse_id, subscription.type)
+            rows.update(self.__rows((subscription,), cells.get(key, ()), today))
+        return list(rows.values())
+
+    def load_snapshot(self, coefficients):
+        """Use stored (warehouse_id, date, coef, type) as the previous snapshot without matching"""
+        self.snapshot = {
+            (warehouse_id, self.__date(acceptance_date), accept_type): coef
+            for warehouse_id, acceptance_date, coef, accept_type in coefficients
+        }
+
+    def apply(self, coefficients, today=None, warehouse_ids=None) -> SlotChanges:
+        """Diff the payload with the previous snapshot and match orders of changed cells
+
+        With warehouse_ids the payload holds only these warehouses, the rest of the
+        snapshot is kept.
+        """
+        today = today or date.today()
+        current = {}
+        for warehouse_id, acceptance_date, coef, accept_type in coefficients:
+            current[(warehouse_id, self.__date(acceptance_date), accept_type)] = coef
+
+        changed = []
+        for key, coef in current.items():
+            previous_coef = self.snapshot.get(key)
+            if previous_coef != coef:
+                changed.append((key, previous_coef, coef))
+        if warehouse_ids is None:
+            changed.extend((key, coef, None) for key, coef in self.snapshot.items() if key not in current)
+            self.snapshot = current
+        else:
+            for key, coef in list(self.snapshot.items()):
+                if key[0] in warehouse_ids and key not in current:
+                    changed.append((key, coef, None))
+                    del self.snapshot[key]
+            self.snapshot.update(current)
+
+        self.changed_cells = [(*key, old_coef, new_coef) for key, old_coef, new_coef in changed]
+
+        previous_rows = {}
+        current_rows = {}
+        for (warehouse_id, acceptance_date, accept_type), old_coef, new_coef in changed:
+            subscriptions = self.index.get((warehouse_id, accept_type))
+            if not subscriptions:
+                continue
+            previous_rows.update(self.__rows(subscriptions, ((acceptance_date, old_coef),), today))
+            current_rows.update(self.__rows(subscriptions, ((acceptance_date, new_coef),), today))
+        return diff_slots(previous_rows, current_rows)
@@ -0,0 +1,219 @@
+"""Runtime metrics of the alerter in Prometheus text format"""
+
+import asyncio
+import logging
+import threading
+import time
+from aiohttp import web
+
+# задержка event loop, после которой пишем предупреждение в лог
+LOOP_LAG_WARNING = 1.0
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def format_labels(names, values) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in zip(names, values))
+    return f'{{{pairs}}}'
+
+
+class Metric:
+    """Base class of metrics with optional labels"""
+
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labels=()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+        REGISTRY.register(self)
+
+    def labels(self, *values):
+        """Child metric for label values"""
+        return LabeledMetric(self, tuple(str(value) for value in values))
+
+    def samples(self):
+        """(suffix, label names, label values, value) for render"""
+        with self.lock:
+            return [('', self.label_names, key, value) for key, value in self.values.items()]
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for suffix, names, values, value in self.samples():
+            lines.append(f'{self.name}{suffix}{format_labels(names, values)} {value}')
+        return '\n'.join(lines)
+
+
+class LabeledMetric:
+    """Metric bound to label values"""
+
+    def __init__(self, metric: Metric, key: tuple) -> None:
+        self.metric = metric
+        self.key = key
+
+    def __getattr__(self, name):
+        method = getattr(self.metric, name)
+        return lambda *args: method(*args, key=self.key)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, key=()):
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels=()) -> None:
+        super().__init__(name, documentation, labels)
+        self.function = None
+
+    def set(self, value, key=()):
+        with self.lock:
+            self.values[key] = value
+
+    def set_function(self, function):
+        """Value is computed on every scrape, a gauge with a label gets {label value: value}"""
+        self.function = function
+
+    def samples(self):
+        if self.function is None:
+            return super().samples()
+        if not self.label_names:
+            return [('', (), (), self.function())]
+        return [('', self.label_names, (str(key),), value) for key, value in self.function().items()]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, key=()):
+        with self.lock:
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self.values[key] = (counts, total + value, count + 1)
+
+    def samples(self):
+        result = []
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                names = self.label_names + ('le',)
+                for bound, bucket_count in zip(self.buckets, counts):
+                    result.append(('_bucket', names, key + (bound,), bucket_count))
+                result.append(('_bucket', names, key + ('+Inf',), count))
+                result.append(('_sum', self.label_names, key, total))
+                result.append(('_count', self.label_names, key, count))
+        return result
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics = []
+
+    def register(self, metric: Metric):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self.metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+WB_FETCH_SECONDS = Histogram('wb_alerter_wb_fetch_seconds', 'WB API request duration', labels=('method',))
+WB_ERRORS = Counter('wb_alerter_wb_errors_total', 'WB API request errors', labels=('method',))
+UPDATE_LIMITS_SECONDS = Histogram('wb_alerter_update_limits_seconds', 'Duration of limits ingestion')
+MATCH_SECONDS = Histogram('wb_alerter_match_seconds', 'Duration of matching orders against new coefficients')
+DIFF_SIZE = Gauge('wb_alerter_diff_size', 'Slots changed in the last cycle', labels=('kind',))
+UNCHANGED_PAYLOADS = Counter(
+    'wb_alerter_unchanged_payloads_total',
+    'Skipped ingestion of unchanged coefficients, scope: payload or warehouse',
+    labels=('scope',),
+)
+CYCLE_SECONDS = Histogram('wb_alerter_cycle_seconds', 'Duration of the poll cycle')
+SUPPRESSED_ALERTS = Counter(
+    'wb_alerter_suppressed_alerts_total', 'Repeated alerts on flapping slots suppressed within the coalescing window'
+)
+PENDING_ALERTS = Gauge('wb_alerter_pending_alerts', 'Alert slots waiting for the digest of their user')
+MESSAGES_QUEUED = Counter('wb_alerter_messages_queued_total', 'Messages queued for delivery')
+MESSAGES_SENT = Counter('wb_alerter_messages_sent_total', 'Messages delivered to Telegram')
+TELEGRAM_ERRORS = Counter('wb_alerter_telegram_errors_total', 'Telegram API errors', labels=('code',))
+ALERT_LATENCY_SECONDS = Histogram(
+    'wb_alerter_alert_latency_seconds',
+    'Latency from the start of WB fetch to send_message',
+)
+SNAPSHOT_AGE_SECONDS = Gauge('wb_alerter_snapshot_age_seconds', 'Age of the last successful coefficients snapshot')
+LEADER = Gauge('wb_alerter_leader', '1 if this replica is the active poller')
+DB_POOL_CONNECTIONS = Gauge(
+    'wb_alerter_db_pool_connections', 'Postgres connections opened, reused from the pool and broken', labels=('event',)
+)
+QUERY_CACHE = Gauge('wb_alerter_query_cache', 'Reference query cache hits, misses and size', labels=('stat',))
+STATE_CACHE = Gauge('wb_alerter_state_cache', 'Bot dialog state cache hits, misses and size', labels=('stat',))
+LOOP_LAG_SECONDS = Gauge('wb_alerter_event_loop_lag_seconds', 'Event loop lag')
+WEBHOOK_UPDATES = Counter('wb_alerter_webhook_updates_total', 'Telegram webhook requests', labels=('status',))
+WEBHOOK_HANDLER_SECONDS = Histogram(
+    'wb_alerter_webhook_handler_seconds', 'Latency from receiving a webhook update to the end of its handler'
+)
+
+# время последнего успешного снимка коэффициентов
+last_snapshot = {'time': None}
+SNAPSHOT_AGE_SECONDS.set_function(
+    lambda: time.time() - last_snapshot['time'] if last_snapshot['time'] is not None else -1,
+)
+
+
+def mark_snapshot():
+    last_snapshot['time'] = time.time()
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up a sleeping task"""
+
+    def __init__(self, interval=0.5) -> None:
+        self.interval = interval
+        self.lag = 0.0
+        # максимум с последнего вызова take_max_lag
+        self.max_lag = 0.0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag = max(loop.time() - start - self.interval, 0.0)
+            self.max_lag = max(self.max_lag, self.lag)
+            LOOP_LAG_SECONDS.set(self.lag)
+            if self.lag > LOOP_LAG_WARNING:
+                logging.warning(f'Event loop lag {self.lag:.3f}s')
+
+    def take_max_lag(self) -> float:
+        """Maximum lag since the previous call, the maximum starts over"""
+        max_lag = self.max_lag
+        self.max_lag = 0.0
+        return max_lag
+
+
+async def handle_metrics(request):
+    return web.Response(text=REGISTRY.render(), content_type='text/plain', charset='utf-8')
+
+
+async def start_metrics_server(port: int, host='0.0.0.0') -> web.AppRunner:
+    """Serve /metrics on port"""
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
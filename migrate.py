@@ -0,0 +1,10 @@
+"""Versioned schema migrations stored as SQL files"""
+
+from pathlib import Path
+
+MIGRATIONS_DIR = Path(__file__).parent / 'migrations'
+
+
+def read_migrations(backend: str) -> list:
+    """(version, sql) of migrations for backend sorted by version"""
+    return [(path.stem, path.read_text(encoding='utf-8')) for path in sorted((MIGRATIONS_DIR / backend).glob('*.sql'))]
@@ -0,0 +1,34 @@
+-- Базовая схема, совпадает с init_db.sql
+
+CREATE TABLE IF NOT EXISTS public.limits (
+    warehouse_id integer,
+    date timestamp without time zone,
+    coef integer,
+    type character varying(128)
+);
+
+CREATE TABLE IF NOT EXISTS public.menu (
+    type_menu character varying(128),
+    order_num integer,
+    btn_name character varying(128),
+    btn_callback character varying(128)
+);
+
+CREATE TABLE IF NOT EXISTS public.users (
+    id integer NOT NULL PRIMARY KEY,
+    name character varying(255)
+);
+
+CREATE TABLE IF NOT EXISTS public.warehouses (
+    id integer NOT NULL PRIMARY KEY,
+    name character varying(255),
+    updtime timestamp without time zone DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS public.orders (
+    user_id integer REFERENCES public.users(id),
+    warehouse_id integer REFERENCES public.warehouses(id),
+    max_coef integer,
+    delay integer,
+    type character varying(128)
+);
@@ -0,0 +1,24 @@
+-- Индексы и ограничения для запросов цикла опроса и справочного меню
+
+-- признак сортировочного центра вместо регулярного выражения по name
+ALTER TABLE public.warehouses
+    ADD COLUMN IF NOT EXISTS is_sc boolean GENERATED ALWAYS AS (name LIKE 'СЦ%') STORED;
+CREATE INDEX IF NOT EXISTS warehouses_is_sc_idx ON public.warehouses (is_sc, name);
+
+-- соединение orders x limits в read_all_slots
+CREATE INDEX IF NOT EXISTS limits_warehouse_type_date_idx ON public.limits (warehouse_id, type, date) INCLUDE (coef);
+-- поиск слотов find_slot и доступные склады
+CREATE INDEX IF NOT EXISTS limits_type_date_idx ON public.limits (type, date) INCLUDE (warehouse_id, coef)
+    WHERE coef <> -1;
+
+-- одна заявка на склад и тип поставки, дубликаты удаляются
+DELETE FROM public.orders a
+USING public.orders b
+WHERE
+    a.ctid < b.ctid
+    AND a.user_id = b.user_id
+    AND a.warehouse_id = b.warehouse_id
+    AND a.type = b.type;
+ALTER TABLE public.orders
+    ADD CONSTRAINT orders_user_warehouse_type_key UNIQUE (user_id, warehouse_id, type);
+CREATE INDEX IF NOT EXISTS orders_warehouse_type_idx ON public.orders (warehouse_id, type);
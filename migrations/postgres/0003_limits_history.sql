@@ -0,0 +1,23 @@
+-- Журнал изменений коэффициентов и сводка открытий слотов
+
+-- только изменения коэффициента по (склад, дата, тип поставки), секции по месяцам
+-- создаются приложением перед записью, старые секции удаляются целиком
+CREATE TABLE IF NOT EXISTS public.limits_history (
+    warehouse_id integer NOT NULL,
+    date timestamp without time zone NOT NULL,
+    type character varying(255) NOT NULL,
+    coef smallint,
+    prev_coef smallint,
+    changed_at timestamp without time zone NOT NULL DEFAULT now()
+) PARTITION BY RANGE (changed_at);
+CREATE INDEX IF NOT EXISTS limits_history_warehouse_type_idx ON public.limits_history (warehouse_id, type, changed_at);
+
+-- количество открытий слотов по дням и часам, хранится дольше журнала
+CREATE TABLE IF NOT EXISTS public.limits_openings (
+    warehouse_id integer NOT NULL,
+    type character varying(255) NOT NULL,
+    day date NOT NULL,
+    hour smallint NOT NULL,
+    openings integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (warehouse_id, type, day, hour)
+);
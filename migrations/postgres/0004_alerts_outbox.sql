@@ -0,0 +1,10 @@
+-- Очередь уведомлений между процессом опроса WB и процессами рассылки
+
+CREATE TABLE IF NOT EXISTS public.alerts_outbox (
+    id bigserial PRIMARY KEY,
+    user_id bigint NOT NULL,
+    text text NOT NULL,
+    created_at timestamp without time zone NOT NULL DEFAULT now(),
+    -- время захвата рассылкой, незавершённый захват истекает
+    claimed_at timestamp without time zone
+);
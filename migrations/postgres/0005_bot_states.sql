@@ -0,0 +1,10 @@
+-- Состояния диалогов бота, общие для реплик; брошенные диалоги истекают
+
+CREATE TABLE IF NOT EXISTS public.bot_states (
+    key character varying(256) PRIMARY KEY,
+    state character varying(128) NOT NULL,
+    data jsonb NOT NULL DEFAULT '{}',
+    expires_at timestamp without time zone NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS bot_states_expires_at_idx ON public.bot_states (expires_at);
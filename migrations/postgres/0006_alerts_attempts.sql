@@ -0,0 +1,3 @@
+-- Количество захватов уведомления рассылкой, уведомление без доставки после нескольких попыток удаляется
+
+ALTER TABLE public.alerts_outbox ADD COLUMN IF NOT EXISTS attempts integer NOT NULL DEFAULT 0;
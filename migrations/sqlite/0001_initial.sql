@@ -0,0 +1,27 @@
+-- Базовая схема
+
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    name TEXT
+);
+
+CREATE TABLE IF NOT EXISTS warehouses (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    updtime TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS limits (
+    warehouse_id INTEGER,
+    date TEXT,
+    coef INTEGER,
+    type TEXT
+);
+
+CREATE TABLE IF NOT EXISTS orders (
+    user_id INTEGER REFERENCES users(id),
+    warehouse_id INTEGER REFERENCES warehouses(id),
+    max_coef INTEGER,
+    delay INTEGER,
+    type TEXT
+);
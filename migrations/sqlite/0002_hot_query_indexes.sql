@@ -0,0 +1,18 @@
+-- Индексы и ограничения для запросов цикла опроса и справочного меню
+
+-- признак сортировочного центра вместо регулярного выражения по name
+ALTER TABLE warehouses ADD COLUMN is_sc INTEGER GENERATED ALWAYS AS (name LIKE 'СЦ%') VIRTUAL;
+CREATE INDEX IF NOT EXISTS warehouses_is_sc_idx ON warehouses (is_sc, name);
+
+-- соединение orders x limits в read_all_slots
+CREATE INDEX IF NOT EXISTS limits_warehouse_type_date_idx ON limits (warehouse_id, type, date, coef);
+-- поиск слотов find_slot и доступные склады
+CREATE INDEX IF NOT EXISTS limits_type_date_idx ON limits (type, date, warehouse_id, coef) WHERE coef <> -1;
+
+-- одна заявка на склад и тип поставки, дубликаты удаляются
+DELETE FROM orders
+WHERE rowid NOT IN (
+    SELECT max(rowid) FROM orders GROUP BY user_id, warehouse_id, type
+);
+CREATE UNIQUE INDEX IF NOT EXISTS orders_user_warehouse_type_key ON orders (user_id, warehouse_id, type);
+CREATE INDEX IF NOT EXISTS orders_warehouse_type_idx ON orders (warehouse_id, type);
@@ -0,0 +1,22 @@
+-- Журнал изменений коэффициентов и сводка открытий слотов
+
+-- без секций: старые записи удаляются по changed_at
+CREATE TABLE IF NOT EXISTS limits_history (
+    warehouse_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    type TEXT NOT NULL,
+    coef INTEGER,
+    prev_coef INTEGER,
+    changed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS limits_history_changed_at_idx ON limits_history (changed_at);
+CREATE INDEX IF NOT EXISTS limits_history_warehouse_type_idx ON limits_history (warehouse_id, type, changed_at);
+
+CREATE TABLE IF NOT EXISTS limits_openings (
+    warehouse_id INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    day TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    openings INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (warehouse_id, type, day, hour)
+);
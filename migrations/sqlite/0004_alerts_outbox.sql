@@ -0,0 +1,9 @@
+-- Очередь уведомлений между процессом опроса WB и процессами рассылки
+
+CREATE TABLE IF NOT EXISTS alerts_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    claimed_at TEXT
+);
@@ -0,0 +1,10 @@
+-- Состояния диалогов бота; брошенные диалоги истекают
+
+CREATE TABLE IF NOT EXISTS bot_states (
+    key TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    data TEXT NOT NULL DEFAULT '{}',
+    expires_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS bot_states_expires_at_idx ON bot_states (expires_at);
@@ -0,0 +1,3 @@
+-- Количество захватов уведомления рассылкой, уведомление без доставки после нескольких попыток удаляется
+
+ALTER TABLE alerts_outbox ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0;
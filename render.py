@@ -0,0 +1,151 @@
+"""Rendering of bot replies and alerts into Telegram messages"""
+
+from datetime import timedelta
+
+# максимальная длина сообщения Telegram в UTF-16 символах
+MAX_MESSAGE_LENGTH = 4096
+# количество часов с наибольшим числом открытий в ответе бота
+OPENING_HOURS_TOP = 3
+# часы открытий хранятся в UTC, пользователям показываются по Москве (UTC+3 круглый год)
+MOSCOW_UTC_OFFSET = 3
+
+
+def message_length(text: str) -> int:
+    """Length as Telegram counts it: emoji outside BMP take two UTF-16 units"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def cut_line(line: str, limit: int) -> list:
+    """Split a line longer than limit, preferably after ', ', never inside a character"""
+    parts = []
+    start = 0
+    # длина в UTF-16 от start до текущего символа считается нарастающим итогом
+    size = 0
+    for index, char in enumerate(line):
+        units = 2 if ord(char) > 0xFFFF else 1
+        if size + units > limit and index > start:
+            end = index
+            separator = line.rfind(', ', start, end)
+            if separator > start:
+                end = separator + 2
+            parts.append(line[start:end])
+            size = message_length(line[end:index])
+            start = end
+        size += units
+    if start < len(line):
+        parts.append(line[start:])
+    return parts
+
+
+def paginate(lines, limit=MAX_MESSAGE_LENGTH) -> list:
+    """Join lines into pages not longer than limit, lines are not split unless too long
+
+    Pages are stripped, Telegram rejects messages of whitespace only.
+    """
+    pages = []
+    page = []
+    size = 0
+    for line in lines:
+        for part in cut_line(line, limit):
+            length = message_length(part)
+            if page and size + length > limit:
+                pages.append(''.join(page))
+                page = []
+                size = 0
+            page.append(part)
+            size += length
+    if page:
+        pages.append(''.join(page))
+    return [page.strip() for page in pages if not page.isspace()]
+
+
+def date_ranges(dates) -> list:
+    """Collapse sorted (date, coef) into (first date, last date, coef) of consecutive days with equal coef"""
+    ranges = []
+    for acceptance_date, coef in dates:
+        if ranges:
+            first, last, last_coef = ranges[-1]
+            if coef == last_coef and acceptance_date.date() - last.date() == timedelta(days=1):
+                ranges[-1] = (first, acceptance_date, coef)
+                continue
+        ranges.append((acceptance_date, acceptance_date, coef))
+    return ranges
+
+
+def format_ranges(dates) -> str:
+    """10.10-12.10 ₽0, 14.10 ₽2"""
+    result = []
+    for first, last, coef in date_ranges(dates):
+        if first == last:
+            result.append(f'{first:%d.%m} ₽{coef}')
+        else:
+            result.append(f'{first:%d.%m}-{last:%d.%m} ₽{coef}')
+    return ', '.join(result)
+
+
+def get_all_warehouse_from_list(warehouse_list, prefix='', postfix=''):
+    return ''.join(f'{prefix} {row} {postfix}\n' for row in warehouse_list)
+
+
+def get_accept_warehouse_from_list(warehouse_list):
+    """Warehouses grouped by accept type, rows are sorted by type"""
+    lines = []
+    current_type = None
+    for accept_type, warehose_name, acceptance_coef_min, acceptance_coef_max in warehouse_list:
+        if accept_type != current_type:
+            current_type = accept_type
+            lines.append(f'📦 {accept_type}:\n')
+        if acceptance_coef_min == acceptance_coef_max:
+            lines.append(f'🚛 {warehose_name} ₽{acceptance_coef_min}\n')
+        else:
+            lines.append(f'🚛 {warehose_name} ₽{acceptance_coef_min}-{acceptance_coef_max}\n')
+    return ''.join(lines)
+
+
+def get_slots_from_list(warehouse_list):
+    """One line per warehouse with date ranges, rows are (name, date, coef)"""
+    warehouses = {}
+    for warehose_name, acceptance_date, acceptance_coef in warehouse_list:
+        warehouses.setdefault(warehose_name, []).append((acceptance_date, acceptance_coef))
+    return ''.join(
+        f'📦 {warehose_name}: {format_ranges(sorted(dates))}\n' for warehose_name, dates in sorted(warehouses.items())
+    )
+
+
+def get_orders_from_list(orders):
+    return ''.join(
+        f'Склад: {warehose_name}, '
+        f'макс. коэф. приемки {acceptance_coef_max}, '
+        f'смотрим слоты через {acceptance_delay} дн., '
+        f'тип поставки - {acceptance_type}\n'
+        for warehose_name, acceptance_coef_max, acceptance_delay, acceptance_type in orders
+    )
+
+
+def get_opening_hours_from_list(hours, top=OPENING_HOURS_TOP):
+    """Hours with the most slot openings per accept type, hours are sorted by openings
+
+    UTC hours of read_opening_hours are shown in Moscow time.
+    """
+    result = {}
+    for accept_type, hour, openings in hours:
+        top_hours = result.setdefault(accept_type, [])
+        if len(top_hours) < top:
+            hour = (hour + MOSCOW_UTC_OFFSET) % 24
+            top_hours.append(f'{hour:02d}:00-{(hour + 1) % 24:02d}:00 ({openings})')
+    return ''.join(f'{accept_type}: {", ".join(top_hours)}\n' for accept_type, top_hours in result.items())
+
+
+def get_msg_from_result(slots):
+    """user_id -> message, one line per warehouse and accept type with date ranges"""
+    users = {}
+    for user_id, warehose_name, acceptance_date, acceptance_coef, acceptance_type in slots:
+        warehouses = users.setdefault(user_id, {})
+        warehouses.setdefault((warehose_name, acceptance_type), []).append((acceptance_date, acceptance_coef))
+    return {
+        user_id: ''.join(
+            f'📦 {warehose_name}, {acceptance_type}: {format_ranges(sorted(dates))}\n'
+            for (warehose_name, acceptance_type), dates in sorted(warehouses.items())
+        )
+        for user_id, warehouses in users.items()
+    }
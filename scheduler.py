@@ -0,0 +1,79 @@
+"""Fixed-cadence poll scheduler with backoff on WB errors"""
+
+import asyncio
+import logging
+import math
+import random
+import time
+
+
+class Scheduler:
+    """Ticks every interval seconds regardless of cycle duration
+
+    Ticks missed during a long cycle are coalesced into one immediate run. After
+    errors the next tick is delayed with exponential backoff and jitter, or by the
+    rate-limit hint of WB.
+    """
+
+    def __init__(
+        self,
+        interval=15.0,
+        min_interval=5.0,
+        busy_orders=1000,
+        max_backoff=300.0,
+        clock=time.monotonic,
+        sleep=asyncio.sleep,
+    ) -> None:
+        self.base_interval = interval
+        self.interval = interval
+        self.min_interval = min_interval  # интервал при большом количестве заявок
+        self.busy_orders = busy_orders
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.sleep = sleep
+        self.next_tick = None
+        self.failures = 0
+        self.skipped = 0
+
+    def adapt(self, active_orders: int) -> float:
+        """Tighten the interval proportionally to the number of active orders"""
+        if active_orders <= self.busy_orders:
+            self.interval = self.base_interval
+        else:
+            self.interval = max(self.min_interval, self.base_interval * self.busy_orders / active_orders)
+        return self.interval
+
+    def success(self):
+        self.failures = 0
+
+    def failure(self, retry_after=None) -> float:
+        """Delay the next tick after an error, return the delay"""
+        self.failures += 1
+        backoff = min(self.max_backoff, self.base_interval * 2 ** (self.failures - 1))
+        # jitter, чтобы реплики и повторные запуски не били в API одновременно
+        delay = random.uniform(backoff / 2, backoff)
+        if retry_after:
+            delay = max(delay, retry_after)
+        self.next_tick = self.clock() + delay
+        return delay
+
+    def defer(self, seconds):
+        """Do not tick earlier than in seconds, used for rate-limit headers"""
+        if seconds:
+            self.next_tick = max(self.next_tick or 0.0, self.clock() + seconds)
+
+    async def wait(self):
+        """Sleep until the next tick"""
+        now = self.clock()
+        if self.next_tick is None:
+            self.next_tick = now
+        elif now > self.next_tick:
+            # цикл длился дольше интервала: пропущенные тики объединяются в один запуск сразу
+            missed = math.ceil((now - self.next_tick) / self.interval)
+            self.skipped += missed
+            logging.warning(f'Poll cycle overrun, coalesced {missed} ticks')
+            self.next_tick += missed * self.interval
+            await self.sleep(0)
+            return
+        await self.sleep(self.next_tick - now)
+        self.next_tick += self.interval
@@ -0,0 +1,649 @@
+"""Embedded SQLite backend for tests and small single-node deployments"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from migrate import read_migrations
+from storage import ALERT_MAX_ATTEMPTS, Storage, cached, count_openings, ingest_stats, uses_index, utc_now
+
+READ_ALL_SLOTS_QUERY = """
+SELECT
+    orders.user_id,
+    warehouses.name,
+    limits.date,
+    limits.coef,
+    limits.type
+FROM
+    orders
+JOIN
+    limits
+ON
+    orders.warehouse_id = limits.warehouse_id
+    AND limits.type = orders.type
+JOIN
+    warehouses
+ON
+    warehouses.id = limits.warehouse_id
+WHERE
+    limits.coef <= orders.max_coef
+    AND limits.coef <> -1
+    AND limits.date >= date('now', 'localtime', '+' || (orders.delay + 1) || ' days')
+ORDER BY orders.user_id, warehouses.name, limits.date;
+"""
+
+FIND_SLOT_QUERY = """
+SELECT
+    warehouses.name,
+    limits.date,
+    limits.coef
+FROM
+    limits
+JOIN
+    warehouses
+ON
+    warehouses.id = limits.warehouse_id
+WHERE
+    limits.type = ?
+    AND limits.coef <> -1
+    AND limits.coef < ?
+    AND limits.date >= date('now', 'localtime', '+' || (? + 1) || ' days')
+ORDER BY warehouses.name, limits.date;
+"""
+
+
+# запрос, параметры и индекс, который должен быть в плане
+EXPLAIN_CHECKS = {
+    'read_warehouses': ('SELECT name FROM warehouses WHERE is_sc = ?;', (1,), 'warehouses_is_sc_idx'),
+    'read_all_slots': (READ_ALL_SLOTS_QUERY, (), 'limits_warehouse_type_date_idx'),
+    'find_slot': (FIND_SLOT_QUERY, ('Короба', 20, 0), 'limits_type_date_idx'),
+}
+
+
+def to_timestamp(value) -> str:
+    """WB date like 2024-10-01T00:00:00Z to the text form stored in limits"""
+    return str(value)[:19].replace('T', ' ')
+
+
+def from_timestamp(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+class SQLiteDB(Storage):
+    """Class for work with SQLite"""
+
+    def __init__(self, DB_PATH=':memory:', DB_CACHE_SIZE=256) -> None:
+        super().__init__(DB_CACHE_SIZE)
+        self.DB_PATH = DB_PATH
+        self.lock = threading.Lock()
+        # одно соединение на процесс, доступ сериализуется блокировкой
+        self.conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        if DB_PATH != ':memory:':
+            self.conn.execute('PRAGMA journal_mode=WAL;')
+        self.migrate()
+
+    @contextmanager
+    def __connect(self):
+        """Функция доступа к соединению с базой данных"""
+        with self.lock, self.conn:
+            yield self.conn
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def update_user(self, user_id: int, name: str):
+        try:
+            with self.__connect() as conn:
+                query = """
+                INSERT INTO users (id, name)
+                VALUES (?, ?)
+                ON CONFLICT (id) DO UPDATE
+                SET name = excluded.name;
+                """
+                conn.execute(
+                    query,
+                    (
+                        user_id,  # ID пользователя
+                        name,  # Имя пользователя
+                    ),
+                )
+        except sqlite3.Error as error:
+            logging.warning(f'Error update user {user_id}, {name}: {error}')
+
+    @cached
+    def read_warehouses(self, sc=None):
+        """Names of warehouses, sc: True - only sorting centres, False - without them"""
+        rows = []
+        try:
+            with self.__connect() as conn:
+                query = """
+                SELECT
+                    name
+                FROM
+                    warehouses
+                WHERE
+                    ? IS NULL OR is_sc = ?;
+                """
+                rows = conn.execute(query, (sc, sc)).fetchall()
+        except sqlite3.Error as error:
+            logging.warning(f'Error read warehouse, sc {sc}: {error}')
+            self.cache.skip()
+
+        return [row[0] for row in rows]
+
+    @cached
+    def read_all_warehouses(self):
+        result = []
+        try:
+            with self.__connect() as conn:
+                query = """
+                SELECT
+                    id,
+                    name
+                FROM
+                    warehouses;
+                """
+                result = conn.execute(query).fetchall()
+        except sqlite3.Error as error:
+            logging.warning(f'Error read all warehouses: {error}')
+            self.cache.skip()
+
+        return result
+
+    def create_warehouses(self, warehouses):
+        try:
+            with self.__connect() as conn:
+                query = """
+                INSERT INTO warehouses (id, name)
+                VALUES (?, ?)
+                ON CONFLICT (id) DO UPDATE
+                SET name = excluded.name;
+                """
+                conn.executemany(
+                    query,
+                    (
+                        (
+                            warehouse['ID'],  # ID склада
+                            warehouse['name'],  # Наименование склада
+                        )
+                        for warehouse in warehouses
+                    ),
+                )
+            self.cache.invalidate()
+        except sqlite3.Error as error:
+            logging.warning(f'Error update warehouses: {error}')
+
+    @cached
+    def read_accessible_warehouses(self, sc=None):
+        result = []
+        try:
+            with self.__connect() as conn:
+                query = """
+                SELECT
+                    limits.type,
+                    warehouses.name,
+                    min(limits.coef),
+                    max(limits.coef)
+                FROM
+                    limits
+                JOIN
+                    warehouses
+                ON
+                    warehouses.id = limits.warehouse_id
+                WHERE
+                    limits.coef <> -1
+                    AND (? IS NULL OR warehouses.is_sc = ?)
+                GROUP BY
+                    limits.type, warehouses.id
+                ORDER BY
+                    limits.type, warehouses.name;
+                """
+                result = conn.execute(query, (sc, sc)).fetchall()
+        except sqlite3.Error as error:
+            logging.warning(f'Error read accessible warehouse, sc {sc}: {error}')
+            self.cache.skip()
+
+        return result
+
+    @cached
+    def read_warehouse_id(self, warehouse: str):
+        row = None
+        try:
+            with self.__connect() as conn:
+                query = """
+                SELECT
+                    id
+                FROM
+                    warehouses
+                WHERE
+                    name = ?;
+                """
+                row = conn.execute(query, (warehouse,)).fetchone()
+        except sqlite3.Error as error:
+            logging.warning(f'Error read warehouse id, warehouse {warehouse}: {error}')
+            self.cache.skip()
+
+        if row is None:
+            # Warehouse does not exist
+            return -1
+        return row[0]
+
+    def create_order(self, user_id: int, warehouse_id: int, max_coef: int, delay: int, accept_type: str):
+        try:
+            with self.__connect() as conn:
+                query = """
+                INSERT INTO orders (user_id, warehouse_id, max_coef, delay, type)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, warehouse_id, type) DO UPDATE
+                SET max_coef = excluded.max_coef, delay = excluded.delay;
+                """
+                conn.execute(
+                    query,
+                    (
+                        user_id,  # ID пользователя
+                        warehouse_id,  # ID склада
+                        max_coef,  # Макс коэф приемки
+                        delay,  # Через сколько дней ищем слоты
+                        accept_type,  # тип поставки
+                    ),
+                )
+        except sqlite3.Error as error:
+            logging.warning(f'Error create order: {error}')
+
+    def delete_order(self, user_id: int, warehouse_id: int):
+        try:
+            with self.__connect() as conn:
+                query = """
+                DELETE FROM
+                    orders
+                WHERE
+                    user_id = ? AND
+                    warehouse_id = ?
+                """
+                conn.execute(
+                    query,
+                    (
+                        user_id,  # ID пользователя
+                        warehouse_id,  # ID склада
+                    ),
+                )
+        except sqlite3.Error as error:
+            logging.warning(f'Error delete order. User_id {user_id}, warehouse {warehouse_id}: {error}')
+
+    def read_orders(self, user_id: int):
+        result = []
+        try:
+            with self.__connect() as conn:
+                query = """
+                SELECT
+                    warehouses.name,
+                    orders.max_coef,
+                    orders.delay,
+                    orders.type
+                FROM
+                    orders
+                JOIN
+                    warehouses
+                ON
+                    warehouses.id = orders.warehouse_id
+                WHERE
+                    user_id = ?;
+                """
+                result = conn.execute(query, (user_id,)).fetchall()
+        except sqlite3.Error as error:
+            logging.warning(f'Error read orders for user_id {user_id}: {error}')
+
+        return result
+
+    def read_subscriptions(self):
+        try:
+            with self.__connect() as conn:
+                query = """
+                SELECT
+                    orders.user_id,
+                    orders.warehouse_id,
+                    warehouses.name,
+                    orders.max_coef,
+                    orders.delay,
+                    orders.type
+                FROM
+                    orders
+                JOIN
+                    warehouses
+                ON
+                    warehouses.id = orders.warehouse_id;
+                """
+                result = conn.execute(query).fetchall()
+        except sqlite3.Error as error:
+            logging.warning(f'Error read subscriptions: {error}')
+            # пустой список означал бы, что все заявки удалены
+            return None
+
+        return result
+
+    def update_limits(self, coefficients, warehouse_ids=None):
+        start = time.monotonic()
+        rows = 0
+
+        def params():
+            nonlocal rows
+            for warehouse_id, acceptance_date, coef, accept_type in coefficients:
+                rows += 1
+                yield warehouse_id, to_timestamp(acceptance_date), coef, accept_type
+
+        try:
+            # замена данных в одной транзакции
+            with self.__connect() as conn:
+                if warehouse_ids is None:
+                    conn.execute('DELETE FROM limits;')
+                else:
+                    conn.executemany(
+                        'DELETE FROM limits WHERE warehouse_id = ?;',
+                        ((warehouse_id,) for warehouse_id in warehouse_ids),
+                    )
+                query = """
+                INSERT INTO limits (warehouse_id, date, coef, type)
+                VALUES (?, ?, ?, ?)
+                """
+                conn.executemany(query, params())
+            self.cache.invalidate()
+        except sqlite3.Error as error:
+            logging.warning(f'Error update limits: {error}')
+            # limits не изменился, вызывающий код не должен считать выгрузку записанной
+            return None
+
+        self.ingest_stats = ingest_stats(rows, start)
+        return self.ingest_stats
+
+    def read_limits(self):
+        try:
+            with self.__connect() as conn:
+                rows = conn.execute('SELECT warehouse_id, date, coef, type FROM limits;').fetchall()
+            result = [
+                (warehouse_id, from_timestamp(acceptance_date), coef, accept_type)
+                for warehouse_id, acceptance_date, coef, accept_type in rows
+            ]
+        except sqlite3.Error as error:
+            logging.warning(f'Error read limits: {error}')
+            # пустой снимок означал бы, что все слоты открылись заново
+            return None
+
+        return result
+
+    def read_all_slots(self):
+        result = []
+        try:
+            with self.__connect() as conn:
+                rows = conn.execute(READ_ALL_SLOTS_QUERY).fetchall()
+            result = [
+                (user_id, name, from_timestamp(acceptance_date), coef, accept_type)
+                for user_id, name, acceptance_date, coef, accept_type in rows
+            ]
+        except sqlite3.Error as error:
+            logging.warning(f'Error read all slots: {error}')
+
+        return result
+
+    @cached
+    def find_slot(self, max_coef: int, delay: int, accept_type: str) -> list:
+        result = []
+        try:
+            with self.__connect() as conn:
+                rows = conn.execute(
+                    FIND_SLOT_QUERY,
+                    (
+                        accept_type,
+                        max_coef,
+                        delay,
+                    ),
+                ).fetchall()
+            result = [(name, from_timestamp(acceptance_date), coef) for name, acceptance_date, coef in rows]
+        except sqlite3.Error as error:
+            logging.warning(f'Error find slots: {error}')
+            self.cache.skip()
+
+        return result
+
+    def record_history(self, changes, changed_at=None):
+        if not changes:
+            return
+        changed_at = changed_at or utc_now()
+        openings = count_openings(changes, changed_at)
+        try:
+            with self.__connect() as conn:
+                query = """
+                INSERT INTO limits_history (warehouse_id, date, type, prev_coef, coef, changed_at)
+                VALUES (?, ?, ?, ?, ?, ?);
+                """
+                conn.executemany(
+                    query,
+                    (
+                        (
+                            warehouse_id,
+                            to_timestamp(acceptance_date),
+                            accept_type,
+                            prev_coef,
+                            coef,
+                            to_timestamp(changed_at),
+                        )
+                        for warehouse_id, acceptance_date, accept_type, prev_coef, coef in changes
+                    ),
+                )
+                query = """
+                INSERT INTO limits_openings (warehouse_id, type, day, hour, openings)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (warehouse_id, type, day, hour) DO UPDATE
+                SET openings = openings + excluded.openings;
+                """
+                conn.executemany(
+                    query,
+                    (
+                        (warehouse_id, accept_type, day.isoformat(), hour, count)
+                        for (warehouse_id, accept_type, day, hour), count in openings.items()
+                    ),
+                )
+        except sqlite3.Error as error:
+            logging.warning(f'Error record history: {error}')
+
+    def read_opening_hours(self, warehouse_id: int, days: int) -> list:
+        result = []
+        try:
+            with self.__connect() as conn:
+                query = """
+                SELECT
+                    type,
+                    hour,
+                    sum(openings)
+                FROM
+                    limits_openings
+                WHERE
+                    warehouse_id = ?
+                    AND day >= ?
+                GROUP BY
+                    type, hour
+                ORDER BY
+                    type, sum(openings) DESC, hour;
+                """
+                since = (utc_now() - timedelta(days=days)).date().isoformat()
+                result = conn.execute(query, (warehouse_id, since)).fetchall()
+        except sqlite3.Error as error:
+            logging.warning(f'Error read opening hours, warehouse {warehouse_id}: {error}')
+
+        return result
+
+    def prune_history(self, retention_days: int, openings_days: int):
+        now = utc_now()
+        try:
+            with self.__connect() as conn:
+                conn.execute(
+                    'DELETE FROM limits_history WHERE changed_at < ?;',
+                    (to_timestamp(now - timedelta(days=retention_days)),),
+                )
+                conn.execute(
+                    'DELETE FROM limits_openings WHERE day < ?;',
+                    ((now - timedelta(days=openings_days)).date().isoformat(),),
+                )
+        except sqlite3.Error as error:
+            logging.warning(f'Error prune history: {error}')
+
+    def enqueue_alerts(self, messages: dict, ages=None):
+        ages = ages or {}
+        try:
+            with self.__connect() as conn:
+                conn.executemany(
+                    "INSERT INTO alerts_outbox (user_id, text, created_at) VALUES (?, ?, datetime('now', ?));",
+                    ((user_id, text, f'-{ages.get(user_id, 0.0):.3f} seconds') for user_id, text in messages.items()),
+                )
+        except sqlite3.Error as error:
+            logging.warning(f'Error enqueue alerts: {error}')
+            raise
+
+    def claim_alerts(self, shard: int, shards: int, limit: int, lease: int, max_attempts=ALERT_MAX_ATTEMPTS) -> list:
+        result = []
+        now = datetime.now()
+        expired = to_timestamp(now - timedelta(seconds=lease))
+        try:
+            with self.__connect() as conn:
+                # уведомления, не доставленные за max_attempts захватов, больше не захватываются
+                dropped = conn.execute(
+                    'DELETE FROM alerts_outbox WHERE user_id % ? = ? AND attempts >= ? AND claimed_at < ?;',
+                    (shards, shard, max_attempts, expired),
+                ).rowcount
+                if dropped:
+                    logging.warning(f'Dropped {dropped} undelivered alerts after {max_attempts} attempts')
+                query = """
+                SELECT
+                    id,
+                    user_id,
+                    text,
+                    (julianday('now') - julianday(created_at)) * 86400
+                FROM
+                    alerts_outbox
+                WHERE
+                    user_id % ? = ?
+                    AND attempts < ?
+                    AND (claimed_at IS NULL OR claimed_at < ?)
+                ORDER BY id
+                LIMIT ?;
+                """
+                result = conn.execute(query, (shards, shard, max_attempts, expired, limit)).fetchall()
+                conn.executemany(
+                    'UPDATE alerts_outbox SET claimed_at = ?, attempts = attempts + 1 WHERE id = ?;',
+                    ((to_timestamp(now), row[0]) for row in result),
+                )
+        except sqlite3.Error as error:
+            logging.warning(f'Error claim alerts, shard {shard}/{shards}: {error}')
+            result = []
+
+        return result
+
+    def delete_alerts(self, ids):
+        try:
+            with self.__connect() as conn:
+                conn.executemany('DELETE FROM alerts_outbox WHERE id = ?;', ((alert_id,) for alert_id in ids))
+        except sqlite3.Error as error:
+            logging.warning(f'Error delete alerts: {error}')
+
+    def read_state(self, key: str):
+        now = datetime.now()
+        try:
+            with self.__connect() as conn:
+                query = """
+                SELECT
+                    state,
+                    data,
+                    expires_at
+                FROM
+                    bot_states
+                WHERE
+                    key = ?
+                    AND expires_at > ?;
+                """
+                row = conn.execute(query, (key, to_timestamp(now))).fetchone()
+        except sqlite3.Error as error:
+            logging.warning(f'Error read state {key}: {error}')
+            raise
+
+        if row is None:
+            return None
+        state, data, expires_at = row
+        return state, json.loads(data), (from_timestamp(expires_at) - now).total_seconds()
+
+    def write_state(self, key: str, state: str, data: dict, ttl: int, origin=''):
+        expires_at = to_timestamp(datetime.now() + timedelta(seconds=ttl))
+        try:
+            with self.__connect() as conn:
+                query = """
+                INSERT INTO bot_states (key, state, data, expires_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    state = excluded.state,
+                    data = excluded.data,
+                    expires_at = excluded.expires_at;
+                """
+                conn.execute(query, (key, state, json.dumps(data), expires_at))
+        except sqlite3.Error as error:
+            logging.warning(f'Error write state {key}: {error}')
+            raise
+
+    def delete_state(self, key: str, origin=''):
+        try:
+            with self.__connect() as conn:
+                conn.execute('DELETE FROM bot_states WHERE key = ?;', (key,))
+        except sqlite3.Error as error:
+            logging.warning(f'Error delete state {key}: {error}')
+            raise
+
+    def prune_states(self) -> int:
+        try:
+            with self.__connect() as conn:
+                return conn.execute(
+                    'DELETE FROM bot_states WHERE expires_at <= ?;', (to_timestamp(datetime.now()),)
+                ).rowcount
+        except sqlite3.Error as error:
+            logging.warning(f'Error prune states: {error}')
+            return 0
+
+    def migrate(self) -> list:
+        """Apply new migrations from migrations/sqlite, return applied versions"""
+        applied = []
+        with self.lock:
+            query = """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version TEXT PRIMARY KEY,
+                applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+            );
+            """
+            self.conn.execute(query)
+            done = {row[0] for row in self.conn.execute('SELECT version FROM schema_migrations;')}
+            for version, sql in read_migrations('sqlite'):
+                if version in done:
+                    continue
+                # миграция и отметка о ней применяются в одной транзакции
+                try:
+                    self.conn.executescript(
+                        f"BEGIN;\n{sql}\nINSERT INTO schema_migrations (version) VALUES ('{version}');\nCOMMIT;",
+                    )
+                except sqlite3.Error as error:
+                    # executescript не откатывает начатую им транзакцию
+                    if self.conn.in_transaction:
+                        self.conn.rollback()
+                    logging.warning(f'Error apply migration {version}: {error}')
+                    raise
+                applied.append(version)
+        self.cache.invalidate()
+        return applied
+
+    def check_plans(self) -> dict:
+        """EXPLAIN QUERY PLAN the hot queries, return {name: (uses expected index, plan)}"""
+        result = {}
+        with self.__connect() as conn:
+            for name, (query, params, index) in EXPLAIN_CHECKS.items():
+                plan = '\n'.join(row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {query}', params))
+                result[name] = (uses_index(plan, index), plan)
+        return result
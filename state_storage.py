@@ -0,0 +1,165 @@
+"""Bot dialog states shared by replicas through the database with an in-process cache"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from telebot.asyncio_storage.base_storage import StateDataContext, StateStorageBase
+
+# через сколько секунд без изменений диалог считается брошенным
+STATE_TTL = 24 * 3600
+# сколько ключей держать в памяти, включая пользователей без диалога
+STATE_CACHE_SIZE = 100_000
+# как часто удалять истекшие диалоги из базы
+STATE_PRUNE_INTERVAL = 600
+
+
+class SharedStateStorage(StateStorageBase):
+    """Write-through cache of dialog states over a key-value backend
+
+    The backend is any object with async read_state, write_state, delete_state and
+    prune_states, as AsyncDB over the Storage backends. Reads are served from memory,
+    a key missing from the cache is read once and cached even if there is no dialog.
+    Backend errors are raised to the handler and leave the cache as it was.
+    Other replicas drop their cached copy on the STATES_CHANNEL notification.
+    """
+
+    def __init__(
+        self, backend, ttl=STATE_TTL, maxsize=STATE_CACHE_SIZE, prefix='telebot', separator=':', clock=time.time
+    ) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.prefix = prefix
+        self.separator = separator
+        self.clock = clock
+        # идентификатор реплики, свои уведомления об изменениях пропускаются
+        self.origin = uuid.uuid4().hex[:12]
+        # key -> [state, data, expires_at] или None, если диалога нет
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __key(self, chat_id, user_id, business_connection_id=None, message_thread_id=None, bot_id=None) -> str:
+        return self._get_key(
+            chat_id, user_id, self.prefix, self.separator, business_connection_id, message_thread_id, bot_id
+        )
+
+    def __put(self, key: str, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    async def __get(self, key: str):
+        """Live [state, data, expires_at] of the key or None"""
+        if key in self.entries:
+            self.hits += 1
+            entry = self.entries[key]
+            self.entries.move_to_end(key)
+            if entry is None or entry[2] > self.clock():
+                return entry
+            self.entries[key] = None
+            return None
+
+        self.misses += 1
+        row = await self.backend.read_state(key)
+        entry = None
+        if row is not None:
+            state, data, ttl = row
+            entry = [state, data, self.clock() + ttl]
+        self.__put(key, entry)
+        return entry
+
+    async def __write(self, key: str, state: str, data: dict):
+        # кэш меняется только после записи, при ошибке он остаётся согласован с базой
+        await self.backend.write_state(key, state, data, self.ttl, self.origin)
+        self.__put(key, [state, data, self.clock() + self.ttl])
+
+    def forget(self, payload: str):
+        """Drop the cached state changed by another replica, payload is '<origin> <key>'"""
+        origin, _, key = payload.partition(' ')
+        if origin != self.origin:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        """Drop all cached states, after a lost notifications connection they may be stale"""
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+    async def run_expiry(self, interval=STATE_PRUNE_INTERVAL):
+        """Remove abandoned dialogs from the backend and the cache"""
+        while True:
+            await asyncio.sleep(interval)
+            now = self.clock()
+            for key in [key for key, entry in self.entries.items() if entry is not None and entry[2] <= now]:
+                self.entries[key] = None
+            removed = await self.backend.prune_states()
+            if removed:
+                logging.info(f'Expired {removed} bot dialogs')
+
+    async def set_state(
+        self, chat_id, user_id, state, business_connection_id=None, message_thread_id=None, bot_id=None
+    ):
+        if hasattr(state, 'name'):
+            state = state.name
+        key = self.__key(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        entry = await self.__get(key)
+        await self.__write(key, state, entry[1] if entry is not None else {})
+        return True
+
+    async def get_state(self, chat_id, user_id, business_connection_id=None, message_thread_id=None, bot_id=None):
+        entry = await self.__get(self.__key(chat_id, user_id, business_connection_id, message_thread_id, bot_id))
+        return entry[0] if entry is not None else None
+
+    async def delete_state(self, chat_id, user_id, business_connection_id=None, message_thread_id=None, bot_id=None):
+        key = self.__key(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        entry = await self.__get(key)
+        if entry is None:
+            return False
+        await self.backend.delete_state(key, self.origin)
+        self.__put(key, None)
+        return True
+
+    async def set_data(
+        self, chat_id, user_id, key, value, business_connection_id=None, message_thread_id=None, bot_id=None
+    ):
+        state_key = self.__key(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        entry = await self.__get(state_key)
+        if entry is None:
+            raise RuntimeError(f'SharedStateStorage: key {state_key} does not exist.')
+        await self.__write(state_key, entry[0], {**entry[1], key: value})
+        return True
+
+    async def get_data(self, chat_id, user_id, business_connection_id=None, message_thread_id=None, bot_id=None):
+        entry = await self.__get(self.__key(chat_id, user_id, business_connection_id, message_thread_id, bot_id))
+        return dict(entry[1]) if entry is not None else {}
+
+    async def reset_data(self, chat_id, user_id, business_connection_id=None, message_thread_id=None, bot_id=None):
+        key = self.__key(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        entry = await self.__get(key)
+        if entry is None:
+            return False
+        await self.__write(key, entry[0], {})
+        return True
+
+    def get_interactive_data(self, chat_id, user_id, business_connection_id=None, message_thread_id=None, bot_id=None):
+        return StateDataContext(
+            self,
+            chat_id=chat_id,
+            user_id=user_id,
+            business_connection_id=business_connection_id,
+            message_thread_id=message_thread_id,
+            bot_id=bot_id,
+        )
+
+    async def save(self, chat_id, user_id, data, business_connection_id=None, message_thread_id=None, bot_id=None):
+        key = self.__key(chat_id, user_id, business_connection_id, message_thread_id, bot_id)
+        entry = await self.__get(key)
+        if entry is None:
+            return False
+        await self.__write(key, entry[0], data)
+        return True
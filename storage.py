@@ -0,0 +1,252 @@
+"""Storage interface shared by the Postgres and SQLite backends"""
+
+import functools
+import logging
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from datetime import date, datetime, timezone
+
+# сколько раз рассылка захватывает уведомление, прежде чем оно удаляется без доставки
+ALERT_MAX_ATTEMPTS = 5
+
+
+def ingest_stats(rows: int, start: float) -> dict:
+    """Statistics of one limits load started at time.monotonic() value start"""
+    elapsed = time.monotonic() - start
+    logging.info(f'Update limits: {rows} rows in {elapsed:.3f}s')
+    return {
+        'rows': rows,
+        'seconds': elapsed,
+        'rows_per_second': rows / elapsed if elapsed else 0.0,
+    }
+
+
+def utc_now() -> datetime:
+    """Current UTC time without tzinfo, history of coefficients is stored in UTC"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def count_openings(changes, changed_at) -> Counter:
+    """(warehouse_id, type, day, hour) -> number of slots opened, coef changed from -1
+
+    day and hour are those of changed_at, UTC.
+    """
+    openings = Counter()
+    for warehouse_id, _, accept_type, prev_coef, coef in changes:
+        if prev_coef == -1 and coef is not None and coef != -1:
+            openings[(warehouse_id, accept_type, changed_at.date(), changed_at.hour)] += 1
+    return openings
+
+
+def uses_index(plan: str, index: str) -> bool:
+    """Whether the query plan text names exactly this index"""
+    return re.search(rf'\b{re.escape(index)}\b', plan) is not None
+
+
+class QueryCache:
+    """Bounded LRU cache of query results, invalidated on new snapshot"""
+
+    def __init__(self, maxsize=256) -> None:
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # признак неудачного запроса в текущем потоке, его результат не сохраняется
+        self.local = threading.local()
+        # номер снимка данных, меняется при каждой инвалидации
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return (found, value)"""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, self.entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value, generation: int):
+        with self.lock:
+            # результат запроса, начатого до инвалидации, уже устарел
+            if generation != self.generation or not self.maxsize:
+                return
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def skip(self):
+        """Do not store the result of the current call, it is a fallback of a failed query"""
+        self.local.skip = True
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+
+def cached(method):
+    """Read-through cache for Storage methods keyed by method name and parameters
+
+    Methods call cache.skip() on DB errors, so their fallback result is not stored.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        # дата в ключе, так как запросы сравнивают слоты с текущей датой
+        key = (method.__name__, args, tuple(sorted(kwargs.items())), date.today())
+        found, value = self.cache.get(key)
+        if found:
+            return value
+        generation = self.cache.generation
+        self.cache.local.skip = False
+        value = method(self, *args, **kwargs)
+        if not self.cache.local.skip:
+            self.cache.put(key, value, generation)
+        return value
+
+    return wrapper
+
+
+class Storage(ABC):
+    """Interface for storage backends"""
+
+    def __init__(self, cache_size=256) -> None:
+        # статистика последней загрузки limits
+        self.ingest_stats = {'rows': 0, 'seconds': 0.0, 'rows_per_second': 0.0}
+        # кэш справочных запросов, сбрасывается при загрузке limits и warehouses
+        self.cache = QueryCache(cache_size)
+
+    @abstractmethod
+    def update_user(self, user_id: int, name: str):
+        """Create or rename user"""
+
+    @abstractmethod
+    def read_warehouses(self, sc=None) -> list:
+        """Names of warehouses, sc: True - only sorting centres, False - without them"""
+
+    @abstractmethod
+    def read_all_warehouses(self) -> list:
+        """(id, name) of all warehouses"""
+
+    @abstractmethod
+    def create_warehouses(self, warehouses):
+        """Upsert warehouses from WB API"""
+
+    @abstractmethod
+    def read_accessible_warehouses(self, sc=None) -> list:
+        """(type, name, min coef, max coef) of warehouses with free slots"""
+
+    @abstractmethod
+    def read_warehouse_id(self, warehouse: str) -> int:
+        """ID of warehouse by name or -1"""
+
+    @abstractmethod
+    def create_order(self, user_id: int, warehouse_id: int, max_coef: int, delay: int, accept_type: str):
+        """Create order of the user"""
+
+    @abstractmethod
+    def delete_order(self, user_id: int, warehouse_id: int):
+        """Delete orders of the user for warehouse"""
+
+    @abstractmethod
+    def read_orders(self, user_id: int) -> list:
+        """(name, max coef, delay, type) of orders of the user"""
+
+    @abstractmethod
+    def read_subscriptions(self):
+        """(user_id, warehouse_id, name, max coef, delay, type) of all orders or None on DB error"""
+
+    @abstractmethod
+    def update_limits(self, coefficients, warehouse_ids=None) -> dict:
+        """Replace limits with coefficients from WB API, return ingest stats or None on error
+
+        With warehouse_ids only limits of these warehouses are replaced.
+        """
+
+    @abstractmethod
+    def read_limits(self) -> list:
+        """(warehouse_id, date, coef, type) of the last stored snapshot or None on DB error"""
+
+    @abstractmethod
+    def read_all_slots(self) -> list:
+        """(user_id, name, date, coef, type) of slots matching orders"""
+
+    @abstractmethod
+    def find_slot(self, max_coef: int, delay: int, accept_type: str) -> list:
+        """(name, date, coef) of free slots"""
+
+    @abstractmethod
+    def record_history(self, changes, changed_at=None):
+        """Append (warehouse_id, date, type, prev coef, coef) changes to the history
+
+        changed_at is naive UTC, the current time by default.
+        """
+
+    @abstractmethod
+    def read_opening_hours(self, warehouse_id: int, days: int) -> list:
+        """(type, hour, openings) of slot openings at the warehouse in the last days, hours in UTC"""
+
+    @abstractmethod
+    def prune_history(self, retention_days: int, openings_days: int):
+        """Drop history older than retention_days and openings older than openings_days"""
+
+    @abstractmethod
+    def enqueue_alerts(self, messages: dict, ages=None):
+        """Store user_id -> text alerts for sender processes and notify them, raise on error
+
+        ages maps user_id to seconds since the alert was detected, it is counted in the
+        age returned by claim_alerts. The caller keeps the alerts if they are not stored.
+        """
+
+    @abstractmethod
+    def claim_alerts(self, shard: int, shards: int, limit: int, lease: int, max_attempts=ALERT_MAX_ATTEMPTS) -> list:
+        """(id, user_id, text, age) of unclaimed alerts of users with user_id % shards == shard
+
+        Claimed alerts are hidden from other senders for lease seconds,
+        age is seconds since the alert was stored. Alerts of the shard claimed
+        max_attempts times without delivery are deleted instead of claimed again.
+        """
+
+    @abstractmethod
+    def delete_alerts(self, ids):
+        """Remove delivered alerts and alerts Telegram rejected"""
+
+    @abstractmethod
+    def read_state(self, key: str):
+        """(state, data, seconds to expiry) of a bot dialog or None if there is no live one
+
+        Errors are raised, None would end the dialog.
+        """
+
+    @abstractmethod
+    def write_state(self, key: str, state: str, data: dict, ttl: int, origin=''):
+        """Store a bot dialog for ttl seconds and notify other bot replicas, raise on error"""
+
+    @abstractmethod
+    def delete_state(self, key: str, origin=''):
+        """Remove a bot dialog and notify other bot replicas, raise on error"""
+
+    @abstractmethod
+    def prune_states(self) -> int:
+        """Remove expired bot dialogs, return their number"""
+
+    @abstractmethod
+    def migrate(self) -> list:
+        """Apply new schema migrations, return applied versions"""
+
+    @abstractmethod
+    def check_plans(self) -> dict:
+        """{query name: (uses expected index, plan)} for the hot queries"""
+
+    def close(self):
+        """Release resources of the backend"""
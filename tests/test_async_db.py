@@ -0,0 +1,15 @@
+import asyncio
+
+from async_db import AsyncDB
+from sqlite_db import SQLiteDB
+
+
+def test_async_db():
+    async def run():
+        adb = AsyncDB(SQLiteDB(), workers=2)
+        await adb.create_warehouses([{'ID': 1, 'name': 'Коледино'}])
+        result = await asyncio.gather(adb.read_warehouses(), adb.read_warehouse_id('Коледино'))
+        adb.close()
+        return result
+
+    assert asyncio.run(run()) == [['Коледино'], 1]
@@ -0,0 +1,22 @@
+from datetime import datetime
+
+from changes import ChangeDetector
+
+
+def test_change_detector():
+    date = datetime(2024, 10, 1)
+    detector = ChangeDetector()
+    changes = detector.update([(1, 'wh1', date, 5, 'Короба'), (1, 'wh2', date, 1, 'Короба')])
+    assert len(changes.appeared) == 2
+    assert not changes.disappeared
+    assert not changes.improved
+
+    changes = detector.update([(1, 'wh1', date, 2, 'Короба'), (2, 'wh1', date, 2, 'Короба')])
+    assert changes.appeared == [(2, 'wh1', date, 2, 'Короба')]
+    assert changes.disappeared == [(1, 'wh2', date, 1, 'Короба')]
+    assert changes.improved == [(1, 'wh1', date, 2, 'Короба')]
+    assert changes.alerts == [(2, 'wh1', date, 2, 'Короба'), (1, 'wh1', date, 2, 'Короба')]
+
+    changes = detector.update([(1, 'wh1', date, 3, 'Короба'), (2, 'wh1', date, 2, 'Короба')])
+    assert not changes.alerts
+    assert changes.worsened == [(1, 'wh1', date, 3, 'Короба')]
@@ -0,0 +1,68 @@
+from datetime import datetime
+
+from coalesce import Coalescer
+
+DATE = datetime(2024, 10, 1)
+
+
+def slot(user_id, coef, warehouse='wh1'):
+    return (user_id, warehouse, DATE, coef, 'Короба')
+
+
+def test_flapping_slot_is_alerted_once():
+    coalescer = Coalescer(window=60)
+    coalescer.add([slot(1, 2)], now=0)
+    assert coalescer.flush(now=0) == [slot(1, 2)]
+    # слот пропал и появился снова с тем же коэффициентом
+    assert coalescer.add([slot(1, 2)], now=10) == 1
+    assert coalescer.flush(now=10) == []
+    # снижение коэффициента уведомляется, но уже в дайджесте в конце окна
+    assert coalescer.add([slot(1, 1)], now=20) == 0
+    assert coalescer.flush(now=20) == []
+    assert coalescer.flush(now=60) == [slot(1, 1)]
+    assert coalescer.add([slot(1, 1)], now=130) == 0
+
+
+def test_digest_per_window():
+    coalescer = Coalescer(window=60)
+    coalescer.add([slot(1, 2), slot(2, 2)], now=0)
+    assert coalescer.flush(now=0) == [slot(1, 2), slot(2, 2)]
+    coalescer.add([slot(1, 3, 'wh2'), slot(1, 0, 'wh3')], now=5)
+    coalescer.add([slot(1, 1, 'wh2')], now=10)
+    coalescer.add([slot(1, 0, 'wh4')], now=15)
+    # пропавший до отправки слот не попадает в дайджест
+    coalescer.discard([slot(1, 0, 'wh3')])
+    assert coalescer.flush(now=30) == []
+    assert coalescer.flush(now=61) == [slot(1, 1, 'wh2'), slot(1, 0, 'wh4')]
+
+
+def test_zero_window_passes_through():
+    coalescer = Coalescer(window=0)
+    coalescer.add([slot(1, 2)], now=0)
+    assert coalescer.flush(now=0) == [slot(1, 2)]
+    assert coalescer.add([slot(1, 2)], now=0) == 0
+    assert coalescer.flush(now=0) == [slot(1, 2)]
+
+
+def test_requeue_unpublished():
+    coalescer = Coalescer(window=60)
+    coalescer.add([slot(1, 2)], now=0)
+    flushed = coalescer.flush(now=0)
+    # дайджест не ушёл: слот не считается отправленным и уходит со следующим сбросом
+    coalescer.requeue(flushed)
+    assert coalescer.add([slot(1, 2)], now=5) == 0
+    assert coalescer.flush(now=5) == [slot(1, 2)]
+
+
+def test_pending_follows_current_coefficient():
+    coalescer = Coalescer(window=60)
+    coalescer.add([slot(1, 2)], now=0)
+    coalescer.flush(now=0)
+    coalescer.add([slot(1, 0, 'wh2')], now=10)
+    # коэффициент ожидающего слота вырос, но слот ещё подходит: в дайджесте текущий
+    coalescer.update([slot(1, 5, 'wh2')])
+    coalescer.update([slot(1, 7, 'wh3')])
+    assert coalescer.pending_count() == 1
+    assert coalescer.flush(now=60) == [slot(1, 5, 'wh2')]
+    # задержка дайджеста считается от обнаружения слота, а не от сброса
+    assert coalescer.started == {1: 10}
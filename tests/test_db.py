@@ -0,0 +1,22 @@
+from datetime import date
+
+from db import CopyStream, copy_row, history_partition
+
+
+def test_copy_row():
+    assert copy_row((1, '2024-10-01T00:00:00Z', -1, 'Короба')) == '1\t2024-10-01T00:00:00Z\t-1\tКороба\n'
+
+
+def test_copy_row_escape():
+    assert copy_row(('a\tb\\c\nd', None)) == 'a\\tb\\\\c\\nd\t\\N\n'
+
+
+def test_history_partition():
+    assert history_partition(date(2024, 12, 15)) == ('limits_history_2024_12', date(2024, 12, 1), date(2025, 1, 1))
+
+
+def test_copy_stream():
+    stream = CopyStream(row for row in ['1\ta\n', '2\tb\n'])
+    assert stream.read(3) == '1\ta'
+    assert stream.read() == '\n2\tb\n'
+    assert stream.read(10) == ''
@@ -0,0 +1,35 @@
+import asyncio
+from telebot.asyncio_helper import ApiTelegramException
+
+from dispatcher import Dispatcher, split_message
+
+
+def test_split_message():
+    assert split_message('aa\nbb\ncc\n', limit=6) == ['aa\nbb', 'cc']
+    assert split_message('a\nbbbbbbbb\n', limit=4) == ['a', 'bbbb', 'bbbb']
+    assert split_message('') == []
+
+
+def test_dispatch_retry_after():
+    sent = []
+    flood = {'error_code': 429, 'description': 'Too Many Requests', 'parameters': {'retry_after': 0}}
+
+    async def send(chat_id, text):
+        if chat_id == 1 and not sent:
+            sent.append(None)
+            raise ApiTelegramException('sendMessage', None, flood)
+        if chat_id == 2:
+            raise ApiTelegramException('sendMessage', None, {'error_code': 403, 'description': 'blocked'})
+        if chat_id == 4:
+            raise ApiTelegramException('sendMessage', None, {'error_code': 502, 'description': 'Bad Gateway'})
+        sent.append((chat_id, text))
+
+    dispatcher = Dispatcher(send, workers=2, rate=1000, chat_interval=0)
+    stats = asyncio.run(dispatcher.dispatch({1: 'one', 2: 'two', 3: 'three', 4: 'four'}))
+    assert sorted(sent[1:]) == [(1, 'one'), (3, 'three')]
+    assert stats['sent'] == 2
+    assert stats['failed'] == 2
+    assert sorted(stats['delivered']) == [1, 3]
+    # заблокировавший бота пользователь не получит сообщение и при повторе, ошибка сервера временная
+    assert stats['rejected'] == [2]
+    assert stats['undelivered'] == [4]
@@ -0,0 +1,48 @@
+import aiohttp
+import asyncio
+
+from fakes import FakeTelegram, FakeWB
+from wb import AsyncWB, Coefficient, MyError
+
+
+def test_fake_wb():
+    cells = [Coefficient(warehouse_id, '2024-10-01T00:00:00Z', -1, 'Короба') for warehouse_id in (1, 2, 3)]
+
+    async def run():
+        wb_api = FakeWB(cells, churn=1.0, flood_every=2)
+        await wb_api.start()
+        client = AsyncWB('token', request_interval=0)
+        try:
+            warehouses = await client.get_warehouses()
+            coefficients = await client.get_coefficients({1, 3})
+            try:
+                await client.get_coefficients()
+            except MyError as error:
+                retry_after = error.retry_after
+        finally:
+            await client.close()
+            await wb_api.stop()
+        return warehouses, coefficients, retry_after, wb_api.changed
+
+    warehouses, coefficients, retry_after, changed = asyncio.run(run())
+    assert [warehouse['ID'] for warehouse in warehouses] == [1, 2, 3]
+    assert sorted(coefficient.warehouse_id for coefficient in coefficients) == [1, 3]
+    assert retry_after == 1
+    assert changed == 2
+
+
+def test_fake_telegram_chat_interval():
+    async def run():
+        telegram = FakeTelegram(chat_interval=1.0)
+        url = (await telegram.start()).format('token', 'sendMessage')
+        try:
+            async with aiohttp.ClientSession() as session:
+                statuses = []
+                for chat_id in (1, 1, 2):
+                    async with session.post(url, data={'chat_id': chat_id, 'text': 'slot'}) as response:
+                        statuses.append(response.status)
+        finally:
+            await telegram.stop()
+        return statuses, telegram.messages
+
+    assert asyncio.run(run()) == ([200, 429, 200], [(1, 'slot'), (2, 'slot')])
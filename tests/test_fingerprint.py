@@ -0,0 +1,48 @@
+from fingerprint import Fingerprinter
+from wb import Coefficient
+
+
+def coefficient(warehouse_id, coef, day=10):
+    return Coefficient(warehouse_id, f'2024-10-{day}T00:00:00Z', coef, 'Короба')
+
+
+def test_fingerprinter():
+    fingerprinter = Fingerprinter(full_every=3)
+    payload = [coefficient(1, 0), coefficient(1, 5, day=11), coefficient(2, 1)]
+    assert fingerprinter.update(payload).full
+
+    # порядок строк в выгрузке не влияет на отпечаток
+    diff = fingerprinter.update(list(reversed(payload)))
+    assert diff.empty
+    assert diff.unchanged == 2
+
+    diff = fingerprinter.update([coefficient(1, 0), coefficient(1, 3, day=11)])
+    assert diff.changed == {1}
+    assert diff.removed == {2}
+    assert diff.warehouse_ids == {1, 2}
+
+    assert fingerprinter.update([coefficient(1, 0), coefficient(1, 3, day=11)]).full
+
+
+def test_fingerprinter_targeted():
+    fingerprinter = Fingerprinter()
+    fingerprinter.update([coefficient(1, 0), coefficient(2, 1)])
+
+    # запрошен только склад 2: склад 1 не считается пропавшим
+    diff = fingerprinter.update([coefficient(2, 3)], warehouse_ids={2})
+    assert not diff.full
+    assert diff.changed == {2}
+    assert not diff.removed
+
+    diff = fingerprinter.update([], warehouse_ids={1})
+    assert diff.removed == {1}
+    assert fingerprinter.update([coefficient(2, 3)]).empty
+
+
+def test_fingerprinter_reset():
+    fingerprinter = Fingerprinter()
+    payload = [coefficient(1, 0), coefficient(2, 1)]
+    fingerprinter.update(payload)
+    # после неудачной записи limits та же выгрузка снова считается изменившейся
+    fingerprinter.reset()
+    assert fingerprinter.update(payload).full
@@ -1,7 +1,15 @@
-from main import get_all_warehouse_from_list
+from main import get_all_warehouse_from_list, get_opening_hours_from_list
 
 
 def test_get_all_warehouse_from_list():
     assert (
         get_all_warehouse_from_list(['wh1', 'wh2'], 'prefix', 'postfix') == 'prefix wh1 postfix\nprefix wh2 postfix\n'
     )
+
+
+def test_get_opening_hours_from_list():
+    # часы в базе по UTC, в ответе по Москве
+    hours = [('Короба', 7, 5), ('Короба', 20, 2), ('Короба', 4, 1), ('Монопаллеты', 22, 1)]
+    assert get_opening_hours_from_list(hours, top=2) == (
+        'Короба: 10:00-11:00 (5), 23:00-00:00 (2)\nМонопаллеты: 01:00-02:00 (1)\n'
+    )
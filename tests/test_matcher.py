@@ -0,0 +1,64 @@
+from datetime import date, datetime
+
+from matcher import Matcher
+from wb import Coefficient
+
+
+def coefficient(warehouse_id, coef, day=10, box_type='Короба'):
+    return Coefficient(warehouse_id, f'2024-10-{day}T00:00:00Z', coef, box_type)
+
+
+def test_matcher():
+    today = date(2024, 10, 1)
+    matcher = Matcher()
+    assert matcher.load_subscriptions([(1, 10, 'wh10', 5, 0, 'Короба')], today) == []
+
+    changes = matcher.apply([coefficient(10, 3), coefficient(10, -1, day=11), coefficient(20, 0)], today)
+    assert changes.alerts == [(1, 'wh10', datetime(2024, 10, 10), 3, 'Короба')]
+
+    changes = matcher.apply([coefficient(10, 1), coefficient(10, 7, day=11), coefficient(20, 0)], today)
+    assert changes.improved == [(1, 'wh10', datetime(2024, 10, 10), 1, 'Короба')]
+    assert not changes.appeared
+
+    new_slots = matcher.load_subscriptions(
+        [(1, 10, 'wh10', 5, 0, 'Короба'), (2, 10, 'wh10', 10, 0, 'Короба')],
+        today,
+    )
+    assert sorted(new_slots) == [
+        (2, 'wh10', datetime(2024, 10, 10), 1, 'Короба'),
+        (2, 'wh10', datetime(2024, 10, 11), 7, 'Короба'),
+    ]
+
+    changes = matcher.apply([coefficient(10, 1)], today)
+    assert changes.disappeared == [(2, 'wh10', datetime(2024, 10, 11), 7, 'Короба')]
+    assert not changes.alerts
+
+
+def test_matcher_partial_update():
+    today = date(2024, 10, 1)
+    matcher = Matcher()
+    matcher.load_subscriptions([(1, 10, 'wh10', 5, 0, 'Короба'), (1, 20, 'wh20', 5, 0, 'Короба')], today)
+    matcher.apply([coefficient(10, 3), coefficient(20, 1)], today)
+
+    # в выгрузке только склад 20, снимок склада 10 сохраняется
+    changes = matcher.apply([], today, warehouse_ids={20})
+    assert changes.disappeared == [(1, 'wh20', datetime(2024, 10, 10), 1, 'Короба')]
+    assert matcher.snapshot == {(10, datetime(2024, 10, 10), 'Короба'): 3}
+
+
+def test_matcher_load_snapshot():
+    today = date(2024, 10, 1)
+    matcher = Matcher()
+    # порядок как в poll(): снимок прошлого лидера из limits, затем заявки без уведомлений
+    matcher.load_snapshot([(10, datetime(2024, 10, 10), 3, 'Короба')])
+    assert matcher.load_subscriptions([(1, 10, 'wh10', 5, 0, 'Короба')], today, announce=False) == []
+    # новая заявка следующего цикла получает открытые слоты
+    assert matcher.load_subscriptions([(1, 10, 'wh10', 5, 0, 'Короба'), (2, 10, 'wh10', 5, 0, 'Короба')], today) == [
+        (2, 'wh10', datetime(2024, 10, 10), 3, 'Короба')
+    ]
+
+    assert not matcher.apply([coefficient(10, 3)], today).alerts
+    assert sorted(matcher.apply([coefficient(10, 3), coefficient(10, 1, day=11)], today).appeared) == [
+        (1, 'wh10', datetime(2024, 10, 11), 1, 'Короба'),
+        (2, 'wh10', datetime(2024, 10, 11), 1, 'Короба'),
+    ]
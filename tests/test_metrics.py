@@ -0,0 +1,42 @@
+from metrics import Counter, Gauge, Histogram, LoopLagMonitor, Registry
+
+
+def test_render(monkeypatch):
+    registry = Registry()
+    monkeypatch.setattr('metrics.REGISTRY', registry)
+    counter = Counter('sent_total', 'Sent', labels=('code',))
+    counter.labels(429).inc()
+    counter.labels(429).inc(2)
+    gauge = Gauge('age_seconds', 'Age')
+    gauge.set_function(lambda: 5)
+    connections = Gauge('connections', 'Connections', labels=('event',))
+    connections.set_function(lambda: {'opened': 1, 'reused': 4})
+    histogram = Histogram('fetch_seconds', 'Fetch', buckets=(0.1, 1))
+    histogram.observe(0.5)
+
+    assert registry.render() == (
+        '# HELP sent_total Sent\n'
+        '# TYPE sent_total counter\n'
+        'sent_total{code="429"} 3\n'
+        '# HELP age_seconds Age\n'
+        '# TYPE age_seconds gauge\n'
+        'age_seconds 5\n'
+        '# HELP connections Connections\n'
+        '# TYPE connections gauge\n'
+        'connections{event="opened"} 1\n'
+        'connections{event="reused"} 4\n'
+        '# HELP fetch_seconds Fetch\n'
+        '# TYPE fetch_seconds histogram\n'
+        'fetch_seconds_bucket{le="0.1"} 0\n'
+        'fetch_seconds_bucket{le="1"} 1\n'
+        'fetch_seconds_bucket{le="+Inf"} 1\n'
+        'fetch_seconds_sum 0.5\n'
+        'fetch_seconds_count 1\n'
+    )
+
+
+def test_loop_lag_max_is_per_period():
+    monitor = LoopLagMonitor()
+    monitor.max_lag = 2.0
+    assert monitor.take_max_lag() == 2.0
+    assert monitor.take_max_lag() == 0.0
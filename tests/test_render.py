@@ -0,0 +1,38 @@
+from datetime import datetime
+
+from render import cut_line, get_msg_from_result, message_length, paginate
+
+
+def test_get_msg_from_result():
+    slots = [
+        (1, 'Коледино', datetime(2024, 10, 10), 0, 'Короба'),
+        (1, 'Коледино', datetime(2024, 10, 11), 0, 'Короба'),
+        (1, 'Коледино', datetime(2024, 10, 12), 0, 'Короба'),
+        (1, 'Коледино', datetime(2024, 10, 14), 2, 'Короба'),
+        (2, 'Тула', datetime(2024, 10, 10), 1, 'Монопаллеты'),
+    ]
+    assert get_msg_from_result(slots) == {
+        1: '📦 Коледино, Короба: 10.10-12.10 ₽0, 14.10 ₽2\n',
+        2: '📦 Тула, Монопаллеты: 10.10 ₽1\n',
+    }
+
+
+def test_paginate():
+    assert message_length('📦a') == 3
+    assert paginate(['📦a\n', '📦b\n'], limit=8) == ['📦a\n📦b']
+    assert paginate(['📦a\n', '📦b\n'], limit=7) == ['📦a', '📦b']
+    # длинная строка режется после запятой, эмодзи не разрываются
+    assert paginate(['aa, bb, cc\n'], limit=8) == ['aa, bb,', 'cc']
+    assert paginate(['📦📦📦'], limit=3) == ['📦', '📦', '📦']
+    # страницы из одних пробелов и переводов строк не отправляются
+    assert paginate(['a' * 4, '\n', ' \n', 'b'], limit=4) == ['aaaa', 'b']
+    assert paginate(['\n\n']) == []
+
+
+def test_cut_line():
+    assert cut_line('abcdef', 4) == ['abcd', 'ef']
+    assert cut_line('a📦📦b', 4) == ['a📦', '📦b']
+    assert cut_line('aa, bb, cc, dd', 9) == ['aa, bb, ', 'cc, dd']
+    line = 'склад, ' * 5000
+    assert ''.join(cut_line(line, 4096)) == line
+    assert all(message_length(part) <= 4096 for part in cut_line(line, 4096))
@@ -0,0 +1,45 @@
+import asyncio
+
+from scheduler import Scheduler
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_fixed_cadence_and_overrun():
+    clock = FakeClock()
+    scheduler = Scheduler(interval=15, clock=clock, sleep=clock.sleep)
+
+    async def run():
+        await scheduler.wait()
+        clock.now += 4  # цикл короче интервала
+        await scheduler.wait()
+        clock.now += 40  # цикл длиннее двух интервалов
+        await scheduler.wait()
+        await scheduler.wait()
+
+    asyncio.run(run())
+    assert clock.sleeps == [0.0, 11, 0, 5]
+    assert scheduler.skipped == 2
+
+
+def test_backoff():
+    clock = FakeClock()
+    scheduler = Scheduler(interval=10, max_backoff=60, clock=clock, sleep=clock.sleep)
+    delays = [scheduler.failure() for _ in range(5)]
+    assert 5 <= delays[0] <= 10
+    assert 10 <= delays[1] <= 20
+    assert 30 <= delays[4] <= 60
+    assert scheduler.failure(retry_after=120) >= 120
+    assert scheduler.adapt(4000) == 5
+    assert scheduler.adapt(10) == 10
@@ -0,0 +1,167 @@
+import pytest
+import sqlite3
+from datetime import date, datetime, timedelta
+
+from sqlite_db import SQLiteDB
+from wb import Coefficient
+
+
+@pytest.fixture()
+def db():
+    storage = SQLiteDB()
+    storage.create_warehouses([{'ID': 1, 'name': 'Коледино'}, {'ID': 2, 'name': 'СЦ Абакан'}])
+    storage.update_user(100, 'user')
+    yield storage
+    storage.close()
+
+
+def coefficients(*rows):
+    return [
+        Coefficient(warehouse_id, f'{day.isoformat()}T00:00:00Z', coef, box) for warehouse_id, day, coef, box in rows
+    ]
+
+
+def test_read_warehouses(db):
+    assert db.read_warehouses() == ['Коледино', 'СЦ Абакан']
+    assert db.read_warehouses(sc=False) == ['Коледино']
+    assert db.read_warehouses(sc=True) == ['СЦ Абакан']
+    assert db.read_warehouse_id('Коледино') == 1
+    assert db.read_warehouse_id('Нет такого') == -1
+    assert db.read_all_warehouses() == [(1, 'Коледино'), (2, 'СЦ Абакан')]
+
+
+def test_slots(db):
+    day = date.today() + timedelta(days=5)
+    stats = db.update_limits(
+        coefficients(
+            (1, day, 1, 'Короба'),
+            (1, day, 3, 'Монопаллеты'),
+            (2, day, -1, 'Короба'),
+            (1, date.today(), 0, 'Короба'),
+        ),
+    )
+    assert stats['rows'] == 4
+    assert (1, datetime(day.year, day.month, day.day), 1, 'Короба') in db.read_limits()
+
+    db.create_order(100, 1, 5, 0, 'Короба')
+    db.create_order(100, 1, 2, 1, 'Короба')
+    assert db.read_orders(100) == [('Коледино', 2, 1, 'Короба')]
+    assert db.read_subscriptions() == [(100, 1, 'Коледино', 2, 1, 'Короба')]
+    slot_date = datetime(day.year, day.month, day.day)
+    assert db.read_all_slots() == [(100, 'Коледино', slot_date, 1, 'Короба')]
+    assert db.find_slot(5, 0, 'Монопаллеты') == [('Коледино', slot_date, 3)]
+    assert db.read_accessible_warehouses(sc=False) == [
+        ('Короба', 'Коледино', 0, 1),
+        ('Монопаллеты', 'Коледино', 3, 3),
+    ]
+
+    db.delete_order(100, 1)
+    assert db.read_all_slots() == []
+
+    # частичное обновление заменяет только limits указанных складов
+    db.update_limits(coefficients((2, day, 4, 'Короба')), warehouse_ids={2})
+    assert db.read_accessible_warehouses() == [
+        ('Короба', 'Коледино', 0, 1),
+        ('Короба', 'СЦ Абакан', 4, 4),
+        ('Монопаллеты', 'Коледино', 3, 3),
+    ]
+
+
+def test_cache(db):
+    assert db.read_warehouses(sc=True) == ['СЦ Абакан']
+    assert db.read_warehouses(sc=True) == ['СЦ Абакан']
+    assert db.cache.stats() == {'hits': 1, 'misses': 1, 'size': 1}
+
+    db.create_warehouses([{'ID': 3, 'name': 'СЦ Барнаул'}])
+    assert db.read_warehouses(sc=True) == ['СЦ Абакан', 'СЦ Барнаул']
+    assert db.cache.stats()['misses'] == 2
+
+
+def test_migrations(db):
+    assert db.migrate() == []
+    for name, (uses_index, plan) in db.check_plans().items():
+        assert uses_index, f'{name}: {plan}'
+
+
+def test_failed_migration(db, monkeypatch):
+    monkeypatch.setattr('sqlite_db.read_migrations', lambda backend: [('9999_broken', 'CREATE TABLE broken (;')])
+    with pytest.raises(sqlite3.Error):
+        db.migrate()
+    assert not db.conn.in_transaction
+    db.update_user(101, 'user')
+    assert ('9999_broken',) not in db.conn.execute('SELECT version FROM schema_migrations;').fetchall()
+
+
+def test_history(db):
+    slot_date = datetime(2024, 10, 10)
+    now = datetime.now().replace(hour=10, minute=30)
+    db.record_history([(1, slot_date, 'Короба', -1, 2), (1, slot_date, 'Монопаллеты', 3, 5)], now)
+    db.record_history([(1, slot_date, 'Короба', -1, 0)], now)
+    db.record_history([(1, slot_date, 'Короба', -1, 1)], now - timedelta(days=100))
+    assert db.read_opening_hours(1, 30) == [('Короба', 10, 2)]
+
+    db.prune_history(retention_days=90, openings_days=30)
+    assert db.conn.execute('SELECT count(*) FROM limits_history;').fetchone() == (3,)
+    assert db.read_opening_hours(1, 365) == [('Короба', 10, 2)]
+
+
+def test_alerts_outbox(db):
+    db.enqueue_alerts({1: 'a\n', 2: 'b\n', 3: 'c\n'})
+    claimed = db.claim_alerts(1, 2, limit=10, lease=300)
+    assert [(user_id, text) for _, user_id, text, _ in claimed] == [(1, 'a\n'), (3, 'c\n')]
+    assert all(0 <= age < 60 for _, _, _, age in claimed)
+    # захваченные уведомления не выдаются повторно до истечения аренды
+    assert db.claim_alerts(1, 2, limit=10, lease=300) == []
+    assert len(db.claim_alerts(1, 2, limit=10, lease=-1)) == 2
+
+    # возраст считается от обнаружения слота, переданного при записи в очередь
+    db.enqueue_alerts({5: 'e\n'}, {5: 120.0})
+    assert [119 < age < 125 for _, _, _, age in db.claim_alerts(1, 2, limit=10, lease=300)] == [True]
+    db.delete_alerts([alert_id for alert_id, _, _, _ in claimed])
+    assert [user_id for _, user_id, _, _ in db.claim_alerts(0, 2, limit=10, lease=300)] == [2]
+
+
+def test_alerts_max_attempts(db):
+    db.enqueue_alerts({1: 'a\n'})
+    assert len(db.claim_alerts(0, 1, limit=10, lease=-1, max_attempts=2)) == 1
+    assert len(db.claim_alerts(0, 1, limit=10, lease=-1, max_attempts=2)) == 1
+    # после max_attempts захватов без доставки уведомление удаляется
+    assert db.claim_alerts(0, 1, limit=10, lease=-1, max_attempts=2) == []
+    assert db.conn.execute('SELECT count(*) FROM alerts_outbox;').fetchone() == (0,)
+
+
+def test_enqueue_alerts_error():
+    storage = SQLiteDB()
+    storage.close()
+    with pytest.raises(sqlite3.Error):
+        storage.enqueue_alerts({1: 'a\n'})
+
+
+def test_bot_states(db):
+    db.write_state('telebot:1:1', 'AddWarehouseStates:name', {'delay': 3}, ttl=60)
+    state, data, ttl = db.read_state('telebot:1:1')
+    assert (state, data) == ('AddWarehouseStates:name', {'delay': 3})
+    assert 0 < ttl <= 60
+    db.write_state('telebot:2:2', 'FindSlot:delay', {}, ttl=-1)
+    assert db.read_state('telebot:2:2') is None
+    assert db.prune_states() == 1
+    db.delete_state('telebot:1:1')
+    assert db.read_state('telebot:1:1') is None
+
+
+def test_read_subscriptions_error():
+    storage = SQLiteDB()
+    storage.close()
+    assert storage.read_subscriptions() is None
+
+
+def test_read_limits_error():
+    storage = SQLiteDB()
+    storage.close()
+    assert storage.read_limits() is None
+
+
+def test_update_limits_error():
+    storage = SQLiteDB()
+    storage.close()
+    assert storage.update_limits(coefficients((1, date(2024, 10, 10), 0, 'Короба'))) is None
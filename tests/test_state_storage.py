@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+
+from async_db import AsyncDB
+from sqlite_db import SQLiteDB
+from state_storage import SharedStateStorage
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_shared_state_storage():
+    async def run():
+        adb = AsyncDB(SQLiteDB(), workers=1)
+        first = SharedStateStorage(adb, ttl=60)
+        await first.set_state(1, 1, 'FindSlot:delay')
+        await first.set_data(1, 1, 'delay', 3)
+        # другая реплика читает диалог из базы, повторные чтения идут из памяти
+        second = SharedStateStorage(adb, ttl=60)
+        result = [await second.get_state(1, 1), await second.get_data(1, 1), await second.get_state(2, 2)]
+        await second.get_state(1, 1)
+        await second.get_state(2, 2)
+        result.append(second.stats())
+        # изменение первой реплики доходит до второй через уведомление
+        await first.delete_state(1, 1)
+        second.forget(f'{first.origin} telebot:1:1')
+        first.forget(f'{first.origin} telebot:1:1')
+        result += [await second.get_state(1, 1), await first.get_state(1, 1)]
+        adb.close()
+        return result
+
+    assert asyncio.run(run()) == [
+        'FindSlot:delay',
+        {'delay': 3},
+        None,
+        {'hits': 3, 'misses': 2, 'size': 2},
+        None,
+        None,
+    ]
+
+
+def test_state_ttl():
+    async def run():
+        clock = Clock()
+        adb = AsyncDB(SQLiteDB(), workers=1)
+        storage = SharedStateStorage(adb, ttl=60, clock=clock)
+        await storage.set_state(1, 1, 'DelWarehouseStates:name')
+        clock.now += 30
+        before = await storage.get_state(1, 1)
+        clock.now += 31
+        after = await storage.get_state(1, 1)
+        adb.close()
+        return before, after
+
+    assert asyncio.run(run()) == ('DelWarehouseStates:name', None)
+
+
+class FlakyBackend:
+    def __init__(self) -> None:
+        self.states = {}
+        self.failing = False
+
+    def check(self):
+        if self.failing:
+            raise OSError('database is unavailable')
+
+    async def read_state(self, key):
+        self.check()
+        return self.states.get(key)
+
+    async def write_state(self, key, state, data, ttl, origin=''):
+        self.check()
+        self.states[key] = (state, data, ttl)
+
+    async def delete_state(self, key, origin=''):
+        self.check()
+        self.states.pop(key, None)
+
+
+def test_backend_errors_keep_cache():
+    async def run():
+        backend = FlakyBackend()
+        backend.states['telebot:1:1'] = ('FindSlot:delay', {}, 60)
+        storage = SharedStateStorage(backend, ttl=60)
+        backend.failing = True
+        # ошибка чтения не кэшируется как отсутствие диалога
+        with pytest.raises(OSError):
+            await storage.get_state(1, 1)
+        backend.failing = False
+        state = await storage.get_state(1, 1)
+        # ошибка записи не меняет кэш
+        backend.failing = True
+        with pytest.raises(OSError):
+            await storage.set_state(1, 1, 'FindSlot:coef')
+        with pytest.raises(OSError):
+            await storage.delete_state(1, 1)
+        return state, await storage.get_state(1, 1)
+
+    assert asyncio.run(run()) == ('FindSlot:delay', 'FindSlot:delay')
@@ -0,0 +1,47 @@
+from storage import QueryCache, cached, uses_index
+
+
+def test_query_cache_lru():
+    cache = QueryCache(maxsize=2)
+    cache.put('a', 1, cache.generation)
+    cache.put('b', 2, cache.generation)
+    assert cache.get('a') == (True, 1)
+    cache.put('c', 3, cache.generation)
+    assert cache.get('b') == (False, None)
+
+    generation = cache.generation
+    cache.invalidate()
+    cache.put('d', 4, generation)
+    assert cache.get('d') == (False, None)
+    assert cache.get('a') == (False, None)
+
+
+class Backend:
+    def __init__(self) -> None:
+        self.cache = QueryCache()
+        self.calls = 0
+
+    @cached
+    def read(self, fail=False):
+        self.calls += 1
+        if fail:
+            self.cache.skip()
+            return []
+        return [self.calls]
+
+
+def test_cached_skips_failed_query():
+    backend = Backend()
+    assert backend.read() == [1]
+    assert backend.read(fail=True) == []
+    assert backend.read(fail=True) == []
+    # неудачный запрос не сбрасывает остальные результаты
+    assert backend.read() == [1]
+    assert backend.calls == 3
+
+
+def test_uses_index():
+    plan = 'Index Only Scan using limits_type_date_idx on limits'
+    assert uses_index(plan, 'limits_type_date_idx')
+    assert not uses_index(plan, 'limits_type_date')
+    assert not uses_index('Index Scan using limits_type_date_idx_old on limits', 'limits_type_date_idx')
@@ -0,0 +1,15 @@
+from warehouse_index import WarehouseIndex, normalize
+
+
+def test_normalize():
+    assert normalize('СЦ  Подольск-3 (Ёлки)') == 'сц подольск 3 елки'
+
+
+def test_search():
+    index = WarehouseIndex()
+    index.load([(1, 'Коледино'), (2, 'Электросталь'), (3, 'СЦ Абакан'), (4, 'Подольск 3')])
+    name, warehouse_id, score = index.search('коледина')[0]
+    assert (name, warehouse_id) == ('Коледино', 1)
+    assert score >= 70
+    assert [item[1] for item in index.search('подольск', limit=1)] == [4]
+    assert index.search('...') == []
@@ -0,0 +1,124 @@
+import asyncio
+import pytest
+import time
+from aiohttp import web
+
+import wb
+from wb import AsyncWB, Coefficient, MyError, iter_json_array
+
+
+def item(warehouse_id):
+    return {'warehouseID': warehouse_id, 'date': '2024-10-01T00:00:00Z', 'coefficient': 0, 'boxTypeName': 'Короба'}
+
+
+async def run_with_server(monkeypatch, handler, call, request_interval=0):
+    app = web.Application()
+    app.router.add_get('/api/v1/acceptance/coefficients', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    monkeypatch.setattr(wb, 'SUPPLIES_API', f'http://127.0.0.1:{port}/api/v1')
+    client = AsyncWB('token', request_interval=request_interval)
+    try:
+        return await call(client)
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+def test_async_get_coefficients(monkeypatch):
+    async def handler(request):
+        assert request.headers['Authorization'] == 'token'
+        return web.json_response([item(1)])
+
+    result = asyncio.run(run_with_server(monkeypatch, handler, lambda client: client.get_coefficients()))
+    assert result == [Coefficient(1, '2024-10-01T00:00:00Z', 0, 'Короба')]
+
+
+def test_async_get_coefficients_by_warehouses(monkeypatch):
+    requested = []
+
+    async def handler(request):
+        requested.append(request.query.get('warehouseIDs'))
+        warehouse_ids = request.query.get('warehouseIDs', '1,2,3,4,5')
+        return web.json_response([item(int(warehouse_id)) for warehouse_id in warehouse_ids.split(',')])
+
+    result = asyncio.run(run_with_server(monkeypatch, handler, lambda client: client.get_coefficients({5, 1, 3})))
+    assert requested == ['1,3,5']
+    assert [coefficient.warehouse_id for coefficient in result] == [1, 3, 5]
+
+    # больше max_ids складов запрашиваются одним запросом всех складов и отбираются на месте
+    requested.clear()
+    result = asyncio.run(
+        run_with_server(monkeypatch, handler, lambda client: client.get_coefficients({5, 1, 3}, max_ids=2)),
+    )
+    assert requested == [None]
+    assert [coefficient.warehouse_id for coefficient in result] == [1, 3, 5]
+
+
+def test_coefficients_quota(monkeypatch):
+    requested_at = []
+
+    async def handler(request):
+        requested_at.append(time.monotonic())
+        return web.json_response([])
+
+    async def call(client):
+        for warehouse_id in range(3):
+            await client.get_coefficients({warehouse_id})
+
+    asyncio.run(run_with_server(monkeypatch, handler, call, request_interval=0.1))
+    assert len(requested_at) == 3
+    assert all(later - earlier >= 0.09 for earlier, later in zip(requested_at, requested_at[1:]))
+
+
+def test_async_get_coefficients_wrong_status(monkeypatch):
+    async def handler(request):
+        return web.Response(status=429)
+
+    with pytest.raises(MyError):
+        asyncio.run(run_with_server(monkeypatch, handler, lambda client: client.get_coefficients()))
+
+
+def test_rate_limit_retry_after(monkeypatch):
+    async def handler(request):
+        return web.Response(status=429, headers={'X-Ratelimit-Retry': '7'})
+
+    with pytest.raises(MyError) as error:
+        asyncio.run(run_with_server(monkeypatch, handler, lambda client: client.get_coefficients()))
+    assert error.value.retry_after == 7
+
+
+def test_iter_json_array():
+    body = ' [{"a": "ё, ]"}, {"b": [1, 2]} ,{}]'.encode()
+
+    async def chunks():
+        # куски режут объекты и многобайтовые символы
+        for index in range(0, len(body), 3):
+            yield body[index : index + 3]
+
+    async def parse():
+        return [item async for item in iter_json_array(chunks())]
+
+    assert asyncio.run(parse()) == [{'a': 'ё, ]'}, {'b': [1, 2]}, {}]
+
+
+@pytest.mark.parametrize('body', ['[,{}]', '[{},,{}]', '[{},]', '[{} {}]', '{}'])
+def test_iter_json_array_malformed(body):
+    async def chunks():
+        yield body.encode()
+
+    async def parse():
+        return [item async for item in iter_json_array(chunks())]
+
+    with pytest.raises(ValueError):
+        asyncio.run(parse())
+
+
+def test_coefficient_from_json_malformed():
+    with pytest.raises(MyError):
+        Coefficient.from_json({'warehouseID': 1, 'date': '2024-10-01T00:00:00Z'})
+    with pytest.raises(MyError):
+        Coefficient.from_json([1, 2, 3, 4])
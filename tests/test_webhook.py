@@ -0,0 +1,67 @@
+import aiohttp
+import asyncio
+
+from fakes import make_update
+from webhook import SECRET_HEADER, WebhookServer
+
+
+class FakeBot:
+    def __init__(self) -> None:
+        self.texts = []
+
+    async def process_new_updates(self, updates):
+        self.texts.extend(update.message.text for update in updates)
+
+
+async def post(server, port, secret, body):
+    url = f'http://127.0.0.1:{port}{server.path}'
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, json=body, headers={SECRET_HEADER: secret}) as response:
+            return response.status
+
+
+def test_webhook_secret_and_dispatch():
+    async def run():
+        bot = FakeBot()
+        server = WebhookServer(bot, 'secret', workers=2)
+        port = await server.start(0, '127.0.0.1')
+        try:
+            statuses = [
+                await post(server, port, 'wrong', make_update(1, 10, 'ignored')),
+                await post(server, port, 'secret', make_update(2, 10, '📦 Мои склады')),
+            ]
+            await server.join()
+        finally:
+            await server.stop()
+        return statuses, bot.texts
+
+    assert asyncio.run(run()) == ([403, 200], ['📦 Мои склады'])
+
+
+def test_webhook_queue_full():
+    async def run():
+        server = WebhookServer(FakeBot(), 'secret', workers=0, queue_size=1)
+        port = await server.start(0, '127.0.0.1')
+        try:
+            return [await post(server, port, 'secret', make_update(i, 10, 'text')) for i in range(2)]
+        finally:
+            await server.stop()
+
+    assert asyncio.run(run()) == [200, 503]
+
+
+def test_webhook_invalid_update():
+    async def run():
+        server = WebhookServer(FakeBot(), 'secret', workers=0)
+        port = await server.start(0, '127.0.0.1')
+        try:
+            # валидный JSON, но не обновление Telegram
+            return [
+                await post(server, port, 'secret', {}),
+                await post(server, port, 'secret', {'update_id': 1, 'message': {'text': 'no message_id'}}),
+                await post(server, port, 'secret', []),
+            ]
+        finally:
+            await server.stop()
+
+    assert asyncio.run(run()) == [400, 400, 400]
@@ -0,0 +1,64 @@
+"""Pre-indexed fuzzy search of warehouse names"""
+
+import re
+from collections import Counter
+from fuzzywuzzy import fuzz
+
+# количество кандидатов после n-грамм фильтра, которые оцениваются fuzzywuzzy
+CANDIDATES = 20
+NGRAM = 3
+
+
+def normalize(name: str) -> str:
+    """Lower case, ё -> е, punctuation to spaces"""
+    name = name.lower().replace('ё', 'е')
+    return ' '.join(re.findall(r'\w+', name))
+
+
+def ngrams(text: str, size=NGRAM) -> set:
+    text = f' {text} '
+    return {text[index : index + size] for index in range(max(len(text) - size + 1, 1))}
+
+
+class WarehouseIndex:
+    """Normalized warehouse names with an n-gram prefilter"""
+
+    def __init__(self) -> None:
+        self.names = {}  # id -> наименование склада
+        self.normalized = {}  # id -> нормализованное наименование
+        self.grams = {}  # n-грамма -> id складов
+
+    def load(self, warehouses):
+        """Rebuild the index from (id, name) rows"""
+        names = {}
+        normalized = {}
+        grams = {}
+        for warehouse_id, name in warehouses:
+            names[warehouse_id] = name
+            normalized[warehouse_id] = normalize(name)
+            for gram in ngrams(normalized[warehouse_id]):
+                grams.setdefault(gram, set()).add(warehouse_id)
+        # замена целиком, чтобы поиск не видел частично заполненный индекс
+        self.names, self.normalized, self.grams = names, normalized, grams
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def search(self, query: str, limit=5) -> list:
+        """Top-N (name, id, score) for the query"""
+        query = normalize(query)
+        if not query:
+            return []
+        counts = Counter()
+        for gram in ngrams(query):
+            counts.update(self.grams.get(gram, ()))
+        candidates = [warehouse_id for warehouse_id, _ in counts.most_common(CANDIDATES)]
+        if not candidates:
+            candidates = list(self.names)
+
+        result = [
+            (self.names[warehouse_id], warehouse_id, fuzz.WRatio(query, self.normalized[warehouse_id]))
+            for warehouse_id in candidates
+        ]
+        result.sort(key=lambda item: item[2], reverse=True)
+        return result[:limit]
@@ -1,14 +1,119 @@
 """API for WB"""
 
+from typing import NamedTuple
+
+import aiohttp
+import asyncio
+import codecs
+import json
+import re
 import requests
+import time
+
+from metrics import WB_ERRORS, WB_FETCH_SECONDS
 
 CONNECT_TIMEOUT = 10
 SUPPLIES_API = 'https://supplies-api.wildberries.ru/api/v1'
+# наибольшее количество ID складов в запросе коэффициентов, чтобы URL оставался коротким
+WAREHOUSE_IDS_LIMIT = 100
+# размер куска тела ответа при потоковом разборе
+STREAM_CHUNK = 64 * 1024
+# квота WB на acceptance/coefficients - 6 запросов в минуту, секунд между запросами
+COEFFICIENTS_INTERVAL = 10.0
+
+WHITESPACE = re.compile(r'\s*')
+# состояния разбора массива в iter_json_array
+ARRAY_START, FIRST_ITEM, SEPARATOR, NEXT_ITEM = range(4)
 
 
 class MyError(Exception):
     """Class for exception"""
 
+    def __init__(self, message='', retry_after=None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after  # сколько секунд WB просит подождать
+
+
+class Coefficient(NamedTuple):
+    """Compact record of the acceptance/coefficients payload"""
+
+    warehouse_id: int
+    date: str
+    coef: int
+    type: str
+
+    @classmethod
+    def from_json(cls, item: dict):
+        try:
+            return cls(
+                item['warehouseID'],  # ID склада
+                item['date'],  # Дата поставки
+                item['coefficient'],  # Коэффициент приемки
+                item['boxTypeName'],  # Тип поставки
+            )
+        except (KeyError, TypeError, ValueError) as err:
+            raise MyError(f'Malformed coefficient {item!r}: {err!r}') from err
+
+
+async def iter_json_array(chunks):
+    """Yield items of a JSON array from an async iterator of byte chunks
+
+    Only the not yet parsed tail of the body is kept in memory.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    # что допустимо дальше: начало массива, элемент или конец, запятая или конец, элемент
+    expect = ARRAY_START
+    async for chunk in chunks:
+        buffer += text.decode(chunk)
+        position = 0
+        while True:
+            position = WHITESPACE.match(buffer, position).end()
+            if position == len(buffer):
+                break
+            char = buffer[position]
+            if expect == ARRAY_START:
+                if char != '[':
+                    raise ValueError('JSON array expected')
+                expect = FIRST_ITEM
+                position += 1
+                continue
+            if char == ']' and expect in (FIRST_ITEM, SEPARATOR):
+                return
+            if expect == SEPARATOR:
+                if char != ',':
+                    raise ValueError(f'Expected , or ] in JSON array, got {char!r}')
+                expect = NEXT_ITEM
+                position += 1
+                continue
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # элемент пришёл не целиком, ждём следующий кусок
+                break
+            expect = SEPARATOR
+            yield item
+        buffer = buffer[position:]
+    raise ValueError('Unexpected end of JSON array')
+
+
+def get_retry_after(headers):
+    """Seconds to wait from WB rate-limit headers or None"""
+    for header in ('X-Ratelimit-Retry', 'Retry-After'):
+        if header in headers:
+            try:
+                return float(headers[header])
+            except ValueError:
+                return None
+    # лимит исчерпан, ждём до его сброса
+    if headers.get('X-Ratelimit-Remaining') == '0' and 'X-Ratelimit-Reset' in headers:
+        try:
+            return float(headers['X-Ratelimit-Reset'])
+        except ValueError:
+            return None
+    return None
+
 
 class WB:
     """Class for WB API"""
@@ -54,3 +159,117 @@ class WB:
             raise MyError(f'Request got wrong: {err}') from err
 
         return data
+
+
+class AsyncWB:
+    """Async class for WB API with one keep-alive session"""
+
+    def __init__(self, token, timeout=CONNECT_TIMEOUT, limit=10, request_interval=COEFFICIENTS_INTERVAL) -> None:
+        self.token = token  # TOKEN доступ до API
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.limit = limit  # максимальное количество соединений в сессии
+        self.session = None
+        # запросы коэффициентов идут не чаще раза в request_interval секунд
+        self.request_interval = request_interval
+        self.next_request = 0.0
+        # пауза перед следующим запросом по заголовкам лимитов последнего ответа
+        self.retry_after = None
+
+    def __get_session(self) -> aiohttp.ClientSession:
+        # сессия создаётся лениво, внутри работающего event loop
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=60)
+            headers = {'Accept-Encoding': 'gzip'}
+            if self.token:
+                headers['Authorization'] = self.token
+            self.session = aiohttp.ClientSession(connector=connector, headers=headers)
+        return self.session
+
+    async def __request(self, url, params=None):
+        try:
+            async with self.__get_session().get(url, params=params, timeout=self.timeout) as response:
+                self.retry_after = get_retry_after(response.headers)
+                # Обработка ответа
+                if response.status == 200:
+                    return await response.json()
+                raise MyError(f'Get wrong status code: {response.status}', retry_after=self.retry_after)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            raise MyError(f'Request got wrong: {err}') from err
+
+    async def __stream(self, method, url, params=None):
+        """Yield items of the JSON array response without reading the whole body"""
+        start = time.monotonic()
+        try:
+            async with self.__get_session().get(url, params=params, timeout=self.timeout) as response:
+                self.retry_after = get_retry_after(response.headers)
+                if response.status != 200:
+                    raise MyError(f'Get wrong status code: {response.status}', retry_after=self.retry_after)
+                async for item in iter_json_array(response.content.iter_chunked(STREAM_CHUNK)):
+                    yield item
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as err:
+            WB_ERRORS.labels(method).inc()
+            raise MyError(f'Request got wrong: {err}') from err
+        except MyError:
+            WB_ERRORS.labels(method).inc()
+            raise
+        finally:
+            WB_FETCH_SECONDS.labels(method).observe(time.monotonic() - start)
+
+    async def __get(self, method, url, params=None):
+        start = time.monotonic()
+        try:
+            return await self.__request(url, params)
+        except MyError:
+            WB_ERRORS.labels(method).inc()
+            raise
+        finally:
+            WB_FETCH_SECONDS.labels(method).observe(time.monotonic() - start)
+
+    async def __wait_quota(self):
+        """Wait for the turn of the next coefficients request within the WB quota"""
+        now = time.monotonic()
+        # очередь занимается до ожидания, чтобы параллельные запросы не пошли вместе
+        start = max(now, self.next_request)
+        self.next_request = start + self.request_interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def stream_coefficients(self, params=None):
+        """Yield Coefficient records while the response is being received"""
+        await self.__wait_quota()
+        async for item in self.__stream('coefficients', f'{SUPPLIES_API}/acceptance/coefficients', params):
+            try:
+                coefficient = Coefficient.from_json(item)
+            except MyError:
+                WB_ERRORS.labels('coefficients').inc()
+                raise
+            yield coefficient
+
+    async def __collect_coefficients(self, params=None) -> list:
+        return [coefficient async for coefficient in self.stream_coefficients(params)]
+
+    async def get_coefficients(self, warehouse_ids=None, max_ids=WAREHOUSE_IDS_LIMIT) -> list:
+        """Get warehouse coefficients as Coefficient records, only for warehouse_ids if they are set
+
+        More than max_ids warehouses are fetched with one request for all of them and filtered
+        here: a request per part would wait for the WB quota between parts.
+        """
+        if warehouse_ids is None:
+            return await self.__collect_coefficients()
+        if len(warehouse_ids) > max_ids:
+            return [
+                coefficient
+                async for coefficient in self.stream_coefficients()
+                if coefficient.warehouse_id in warehouse_ids
+            ]
+        params = {'warehouseIDs': ','.join(str(warehouse_id) for warehouse_id in sorted(warehouse_ids))}
+        return await self.__collect_coefficients(params)
+
+    async def get_warehouses(self):
+        """Get list of warehouse"""
+        return await self.__get('warehouses', f'{SUPPLIES_API}/warehouses')
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
@@ -0,0 +1,88 @@
+"""Telegram webhook server dispatching updates to the bot handlers through a bounded queue"""
+
+import asyncio
+import hmac
+import logging
+import time
+from aiohttp import web
+from collections import deque
+from telebot import types
+
+from metrics import WEBHOOK_HANDLER_SECONDS, WEBHOOK_UPDATES
+
+WEBHOOK_PATH = '/telegram/webhook'
+# заголовок, в котором Telegram передаёт secret_token из setWebhook
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+# наибольшее max_connections, которое принимает setWebhook
+MAX_CONNECTIONS = 100
+
+
+class WebhookServer:
+    """Receives updates over HTTP, handlers run in worker tasks
+
+    When the queue is full the update is rejected with 503 and Telegram retries it later,
+    so a burst of updates does not grow memory without bound.
+    """
+
+    def __init__(self, bot, secret_token: str, workers=8, queue_size=1000, path=WEBHOOK_PATH) -> None:
+        self.bot = bot
+        self.secret_token = secret_token
+        self.workers = workers
+        self.path = path
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.runner = None
+        self.tasks = []
+        # задержки от приёма обновления до завершения обработчика, для нагрузочного теста
+        self.latencies = deque(maxlen=100_000)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), self.secret_token):
+            WEBHOOK_UPDATES.labels('forbidden').inc()
+            return web.Response(status=403)
+        try:
+            update = types.Update.de_json(await request.json())
+        except (ValueError, KeyError, TypeError):
+            # не JSON или JSON без обязательных полей обновления
+            WEBHOOK_UPDATES.labels('invalid').inc()
+            return web.Response(status=400)
+        try:
+            self.queue.put_nowait((update, time.monotonic()))
+        except asyncio.QueueFull:
+            WEBHOOK_UPDATES.labels('rejected').inc()
+            return web.Response(status=503)
+        WEBHOOK_UPDATES.labels('accepted').inc()
+        return web.Response()
+
+    async def __work(self):
+        while True:
+            update, received = await self.queue.get()
+            try:
+                await self.bot.process_new_updates([update])
+            except Exception as error:
+                logging.warning(f'Webhook update {update.update_id} error: {error}')
+            finally:
+                latency = time.monotonic() - received
+                self.latencies.append(latency)
+                WEBHOOK_HANDLER_SECONDS.observe(latency)
+                self.queue.task_done()
+
+    async def start(self, port: int, host='0.0.0.0') -> int:
+        """Serve the webhook, returns the bound port"""
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.tasks = [asyncio.create_task(self.__work()) for _ in range(self.workers)]
+        return self.runner.addresses[0][1]
+
+    async def join(self):
+        """Wait until all received updates are handled"""
+        await self.queue.join()
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        if self.runner is not None:
+            await self.runner.cleanup()
@@ -0,0 +1,95 @@
+"""Load test of the webhook mode without Telegram
+
+Synthetic updates are posted to the webhook server with the real bot handlers,
+replies go to a local fake of the Bot API, the database is an in-memory SQLite.
+
+python webhook_loadtest.py --updates 5000 --concurrency 100 --workers 8
+"""
+
+import aiohttp
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0000:loadtest')
+os.environ['DB_BACKEND'] = 'sqlite'
+os.environ['DB_PATH'] = ':memory:'
+
+import main  # noqa: E402
+from fakes import FakeTelegram, make_update  # noqa: E402
+from webhook import SECRET_HEADER, WebhookServer  # noqa: E402
+
+SECRET = 'loadtest'
+TEXTS = ['📦 Мои склады', '🔍 Показать все', '🍒 Склады WB', '⏪️ Назад']
+
+
+def percentile(values, part: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * part))]
+
+
+async def post_updates(url: str, updates: int, concurrency: int, users: int) -> dict:
+    """Post updates from concurrent clients, returns counts of response statuses"""
+    statuses = {}
+    counter = itertools.count(1)
+    async with aiohttp.ClientSession(headers={SECRET_HEADER: SECRET}) as session:
+
+        async def client():
+            for update_id in counter:
+                if update_id > updates:
+                    return
+                update = make_update(update_id, update_id % users + 1, TEXTS[update_id % len(TEXTS)])
+                async with session.post(url, json=update) as response:
+                    statuses[response.status] = statuses.get(response.status, 0) + 1
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+    return statuses
+
+
+async def run(args):
+    telegram = FakeTelegram(latency=args.telegram_latency)
+    await telegram.start()
+    await main.adb.migrate()
+    main.setup_bot()
+    server = WebhookServer(main.bot, SECRET, args.workers, args.queue_size)
+    port = await server.start(args.port, '127.0.0.1')
+
+    start = time.perf_counter()
+    statuses = await post_updates(f'http://127.0.0.1:{port}{server.path}', args.updates, args.concurrency, args.users)
+    await server.join()
+    elapsed = time.perf_counter() - start
+
+    await server.stop()
+    await main.bot.close_session()
+    await telegram.stop()
+
+    latencies = list(server.latencies)
+    sys.stdout.write(f'updates: {args.updates}, responses: {statuses}\n')
+    sys.stdout.write(f'elapsed: {elapsed:.2f}s, {len(latencies) / elapsed:.0f} updates/s\n')
+    if latencies:
+        sys.stdout.write(
+            f'handler latency: mean {statistics.mean(latencies) * 1000:.1f} ms, '
+            f'p95 {percentile(latencies, 0.95) * 1000:.1f} ms, '
+            f'max {max(latencies) * 1000:.1f} ms\n'
+        )
+    sys.stdout.write(f'Bot API calls: {dict(telegram.calls)}\n')
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50, help='concurrent HTTP clients')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=main.WEBHOOK_WORKERS)
+    parser.add_argument('--queue-size', type=int, default=main.WEBHOOK_QUEUE_SIZE)
+    parser.add_argument('--port', type=int, default=0, help='webhook port, 0 - any free port')
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help='seconds per Bot API call')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    cli()